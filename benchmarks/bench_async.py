@@ -0,0 +1,104 @@
+from methabc.run import PRIORS
+from methabc.simulate import AsyncSimulator, simulate
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+
+def proportional_memory(pid):
+    """
+    Proportional set size of a process in MB: its resident memory, with
+    pages shared between processes split between them.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+class MemorySampler(threading.Thread):
+    """
+    Peak memory of this process and its multiprocessing workers, leaving
+    out the simulator subprocesses.
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            pids = [os.getpid()] + [p.pid for p in
+                                    multiprocessing.active_children()]
+            self.peak = max(self.peak,
+                            sum(proportional_memory(pid) for pid in pids))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return self.peak
+
+
+def _simulate(params):
+    return simulate(params, seed="params")
+
+
+def main():
+    parser = ArgumentParser(
+        description="Wall time and Python memory of running simulations in "
+                    "a process pool or concurrently from one process, with "
+                    "the methdemon stand-in.")
+    parser.add_argument("-n", "--simulations", type=int, default=64)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=1,
+                        help="wall time of a stand-in run")
+    args = parser.parse_args()
+
+    package = os.path.dirname(os.path.dirname(
+        os.path.abspath(sys.modules["methabc"].__file__)))
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package, os.environ.get("PYTHONPATH")]))
+    os.environ["METHABC_MODEL"] = f"{sys.executable} -m methabc.standin"
+    os.environ["METHABC_STANDIN_SECONDS"] = str(args.seconds)
+
+    rng = np.random.default_rng(0)
+    draws = [{key: rng.uniform(a, b) for key, (a, b) in
+              PRIORS["simulate"].items()} for _ in range(args.simulations)]
+
+    def pool():
+        with multiprocessing.get_context("fork").Pool(args.concurrency) as p:
+            return p.map(_simulate, draws)
+
+    def concurrent():
+        return AsyncSimulator(args.concurrency).map(draws, seed="params")
+
+    print(f"{args.simulations} simulations, {args.concurrency} at once")
+    print(f"{'driver':<28} {'s':>7} {'peak Python MB':>15}")
+    results = {}
+    for name, run in (("process pool", pool),
+                      ("AsyncSimulator", concurrent)):
+        sampler = MemorySampler()
+        sampler.start()
+        start = time.time()
+        results[name] = run()
+        elapsed = time.time() - start
+        print(f"{name:<28} {elapsed:>7.1f} {sampler.stop():>15.0f}")
+    assert all(np.array_equal(a.arrays, b.arrays) for a, b in
+               zip(*results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from methabc.distance import (distance_components, population_distances,
+                              total_distance)
+from methabc.utils import import_data
+
+import glob
+import os
+import re
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+import numpy as np
+
+from suite import standin_tumours
+
+
+def per_particle(function, size, repeat=3):
+    """
+    Best time of one call scoring size particles, in ms per particle.
+    """
+    return 1e3 * min(timeit.repeat(function, number=1, repeat=repeat)) / size
+
+
+def main():
+    parser = ArgumentParser(
+        description="Time population_distances against scoring particles "
+                    "one at a time on the tumours of data/individual, and "
+                    "check that both give the same distances.")
+    parser.add_argument("-n", "--particles", type=int, default=500)
+    parser.add_argument("--fcpgs", type=int, default=None,
+                        help="fCpG sites per simulated deme (default: as in "
+                             "the config template)")
+    parser.add_argument("--max-bytes", type=int, default=2**22,
+                        help="memory bound of a batch, see batch_distances")
+    parser.add_argument("--data_dir", type=str, default="data/individual")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        particles = standin_tumours(rng, args.particles, tempdir,
+                                    fcpgs=args.fcpgs)
+    sum_stats = [{"data": p} for p in particles]
+
+    print(f"{args.particles} stand-in particles, "
+          f"{particles[0].arrays.shape[1]} fCpG sites")
+    print(f"{'tumour':<7} {'loop ms':>8} {'batch ms':>9} {'speed-up':>9} "
+          f"{'terms loop':>11} {'terms batch':>12} {'max diff':>9}")
+    for path in sorted(glob.glob(os.path.join(args.data_dir,
+                                              "tumour_*.csv"))):
+        tumour_id = re.fullmatch(r"tumour_(.*)\.csv",
+                                 os.path.basename(path))[1]
+        observed = {"data": import_data(path, compiled=True)}
+        size = len(sum_stats)
+        loop = per_particle(
+            lambda: [total_distance(x, observed) for x in sum_stats], size)
+        batch = per_particle(
+            lambda: population_distances(sum_stats, observed["data"],
+                                         max_bytes=args.max_bytes), size)
+        terms_loop = per_particle(
+            lambda: [distance_components(x, observed) for x in sum_stats],
+            size)
+        terms_batch = per_particle(
+            lambda: population_distances(sum_stats, observed["data"], True,
+                                         max_bytes=args.max_bytes), size)
+        expected = np.array([total_distance(x, observed) for x in sum_stats])
+        diff = np.abs(population_distances(sum_stats, observed["data"])
+                      - expected).max()
+        print(f"{tumour_id:<7} {loop:>8.3f} {batch:>9.3f} "
+              f"{loop / batch:>8.1f}x {terms_loop:>11.3f} "
+              f"{terms_batch:>12.3f} {diff:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from methabc.utils import load_template, render_config, write_config
+
+import numpy as np
+import os
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+
+TEMPLATE = "resources/config_template.dat"
+
+
+def write_config_per_call(params, config_template_path, output_dir):
+    """
+    The config writer used before ConfigTemplate: reads and splits the
+    template on every call.
+    """
+    with open(config_template_path, "r") as file:
+        lines = file.readlines()
+    updated_lines = []
+    for line in lines:
+        parts = line.split(maxsplit=1)
+        if parts[0] in params.keys():
+            if type(params[parts[0]]) is float:
+                updated_line = f"    {parts[0]} {params[parts[0]]:.6f}\n"
+            else:
+                updated_line = f"    {parts[0]} {params[parts[0]]}\n"
+        else:
+            updated_line = line
+        updated_lines.append(updated_line)
+    output_path = os.path.join(output_dir, "config.dat")
+    with open(output_path, "w") as file:
+        file.writelines(updated_lines)
+    return output_path
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=2000,
+                        help="number of configs per timing")
+    args = parser.parse_args()
+
+    params = {
+        'init_migration_rate': 0.009,
+        'mu_driver_birth': np.float64(0.0001),
+        's_driver_birth': 0.1,
+        'meth_rate': 0.0022,
+        'demeth_rate': 0.0018,
+        'deme_carrying_capacity': 100,
+        'seed': 1234,
+    }
+    load_template(TEMPLATE)
+    with tempfile.TemporaryDirectory() as tempdir:
+        old = write_config_per_call(params, TEMPLATE, tempdir)
+        with open(old) as file:
+            expected = file.read()
+        assert render_config(params, TEMPLATE) == expected
+
+        timings = {
+            "read template per call": lambda: write_config_per_call(
+                params, TEMPLATE, tempdir),
+            "write_config": lambda: write_config(params, TEMPLATE, tempdir),
+            "render_config only": lambda: render_config(params, TEMPLATE),
+        }
+        for name, func in timings.items():
+            seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+            print(f"{name:>24}: {1e6 * seconds / args.number:8.2f} us/config")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from methabc.counts import import_counts
+from methabc.distance import allele_count_distance, total_distance
+from methabc.tumour import compact
+from methabc.utils import import_data
+
+import glob
+import os
+import re
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+import numpy as np
+from scipy.stats import spearmanr
+
+from suite import standin_tumours
+
+
+def per_particle(distance, particles, observed, repeat=3):
+    """
+    Best time of scoring every particle against observed, in ms per
+    particle.
+    """
+    seconds = min(timeit.repeat(
+        lambda: [distance({"data": p}, {"data": observed})
+                 for p in particles], number=1, repeat=repeat))
+    return 1e3 * seconds / len(particles)
+
+
+def main():
+    parser = ArgumentParser(
+        description="Time the allele count distance against total_distance "
+                    "on the tumours of data/individual, and compare the "
+                    "particles they rank best.")
+    parser.add_argument("-n", "--particles", type=int, default=200)
+    parser.add_argument("--fcpgs", type=int, default=None,
+                        help="fCpG sites per simulated deme (default: as in "
+                             "the config template)")
+    parser.add_argument("--data_dir", type=str, default="data/individual")
+    parser.add_argument("--counts_dir", type=str,
+                        default="data/individual_distances")
+    parser.add_argument("--accept", type=float, default=0.1,
+                        help="fraction of best particles compared")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tempdir:
+        particles = standin_tumours(rng, args.particles, tempdir,
+                                    fcpgs=args.fcpgs)
+    counted = [compact(p, "counts") for p in particles]
+    best = int(np.ceil(args.accept * len(particles)))
+
+    print(f"{args.particles} stand-in particles, "
+          f"{particles[0].arrays.shape[1]} fCpG sites")
+    print(f"{'tumour':<7} {'total ms':>9} {'counts ms':>10} "
+          f"{'uint8 ms':>9} {'speed-up':>9} {'rank corr':>10} "
+          f"{'best overlap':>13}")
+    for path in sorted(glob.glob(os.path.join(args.data_dir,
+                                              "tumour_*.csv"))):
+        tumour_id = re.fullmatch(r"tumour_(.*)\.csv",
+                                 os.path.basename(path))[1]
+        observed = import_data(path, compiled=True)
+        counts = import_counts(os.path.join(
+            args.counts_dir, f"CRC-multi_patient-{tumour_id}.csv"))
+        total = per_particle(total_distance, particles, observed)
+        allele = per_particle(allele_count_distance, particles, counts)
+        stored = per_particle(allele_count_distance, counted, counts)
+        d_total = np.array([total_distance({"data": p}, {"data": observed})
+                            for p in particles])
+        d_counts = np.array([allele_count_distance({"data": p},
+                                                   {"data": counts})
+                             for p in particles])
+        overlap = len(set(np.argsort(d_total)[:best])
+                      & set(np.argsort(d_counts)[:best])) / best
+        print(f"{tumour_id:<7} {total:>9.3f} {allele:>10.3f} {stored:>9.3f} "
+              f"{total / allele:>8.1f}x "
+              f"{spearmanr(d_total, d_counts).correlation:>10.2f} "
+              f"{overlap:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from methabc import demo_distance
+from methabc.distance import (AdaptiveTotalDistance, distance_components,
+                              l2_component, l2_distance, overall_wasserstein,
+                              total_distance, wasserstein_component)
+from methabc.tumour import SimulatedTumour, as_observed
+
+import numpy as np
+import pyabc
+import timeit
+from argparse import ArgumentParser
+
+
+def random_tumour(rng, num_l_demes, fcpgs):
+    return SimulatedTumour(
+        arrays=rng.beta(0.5, 0.5, size=(8, fcpgs)),
+        side=np.array([0] * num_l_demes + [1] * (8 - num_l_demes),
+                      dtype=np.int8),
+        origin_time=rng.random(8),
+        generation=np.zeros(8),
+    )
+
+
+def main():
+    parser = ArgumentParser(
+        description="Cost per particle of the combined distance against "
+                    "separate L_2 and Wasserstein calls.")
+    parser.add_argument("-n", "--number", type=int, default=200,
+                        help="particles per timing")
+    parser.add_argument("--fcpgs", type=int, default=1200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    observation = random_tumour(rng, 4, args.fcpgs)
+    observed = as_observed(observation)
+    particles = [random_tumour(rng, 4, args.fcpgs)
+                 for _ in range(args.number)]
+
+    l2, wasserstein, _ = distance_components({"data": particles[0]},
+                                             {"data": observed})
+    assert np.isclose(l2 + wasserstein,
+                      total_distance({"data": particles[0]},
+                                     {"data": observed}))
+
+    separate = pyabc.AdaptiveAggregatedDistance([l2_component,
+                                                 wasserstein_component])
+    combined = AdaptiveTotalDistance()
+    distances = {
+        "demo l2_distance + overall_wasserstein": lambda x: (
+            demo_distance.l2_distance(x, {"data": observation})
+            + demo_distance.overall_wasserstein(x, {"data": observation})),
+        "l2_distance + overall_wasserstein": lambda x: (
+            l2_distance(x, {"data": observed})
+            + overall_wasserstein(x, {"data": observed})),
+        "total_distance": lambda x: total_distance(x, {"data": observed}),
+        "distance_components": lambda x: distance_components(
+            x, {"data": observed}),
+        "AdaptiveAggregatedDistance, matched terms": lambda x: separate(
+            x, {"data": observed}),
+        "AdaptiveTotalDistance": lambda x: combined(x, {"data": observed}),
+    }
+    print(f"{'distance':<44} {'ms/particle':>12}")
+    for name, distance in distances.items():
+        seconds = timeit.timeit(
+            lambda: [distance({"data": p}) for p in particles], number=1)
+        print(f"{name:<44} {1000 * seconds / args.number:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
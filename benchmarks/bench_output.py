@@ -0,0 +1,52 @@
+from methabc.run import PRIORS
+from methabc.simulate import simulate
+from methabc.workspace import get_workspace
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+
+def main():
+    parser = ArgumentParser(
+        description="Bytes written and time per particle of the output "
+                    "profiles, with the methdemon stand-in unless "
+                    "$METHABC_MODEL is set.")
+    parser.add_argument("-n", "--simulations", type=int, default=20)
+    args = parser.parse_args()
+
+    package = os.path.dirname(os.path.dirname(
+        os.path.abspath(sys.modules["methabc"].__file__)))
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package, os.environ.get("PYTHONPATH")]))
+    os.environ.setdefault("METHABC_MODEL",
+                          f"{sys.executable} -m methabc.standin")
+
+    rng = np.random.default_rng(0)
+    draws = [{key: rng.uniform(a, b) for key, (a, b) in
+              PRIORS["simulate"].items()} for _ in range(args.simulations)]
+    workspace = get_workspace()
+    print(f"{'output':<34} {'KB written':>11} {'ms/particle':>12}")
+    results = []
+    for name, profile, stream in (("full", "full", False),
+                                  ("lean, files", "lean", False),
+                                  ("lean, stdout", "lean", True)):
+        os.environ["METHABC_STANDIN_STREAM"] = str(int(stream))
+        written = workspace.total_bytes_written
+        start = time.time()
+        results.append([simulate(p, seed="params", profile=profile)
+                        for p in draws])
+        elapsed = time.time() - start
+        kb = (workspace.total_bytes_written - written) / 1024 / len(draws)
+        print(f"{name:<34} {kb:>11.1f} "
+              f"{1000 * elapsed / len(draws):>12.1f}")
+    for tumours in results[1:]:
+        assert all(np.array_equal(a.arrays, b.arrays)
+                   for a, b in zip(results[0], tumours))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from methabc.tumour import SimulatedTumour
+from methabc.utils import read_final_demes
+
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import timeit
+from argparse import ArgumentParser
+
+
+def write_final_demes(path, demes, fcpgs, generations, seed=0):
+    """
+    Write a synthetic final_demes.csv with the given number of demes per
+    generation and fCpG sites per deme.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as file:
+        file.write("Generation,Deme,Side,Population,OriginTime,AverageArray\n")
+        for generation in range(generations):
+            for deme in range(demes):
+                side = "left" if deme < demes // 2 else "right"
+                array = ";".join(f"{x:.6f}" for x in rng.random(fcpgs))
+                file.write(f"{generation + 0.5},{deme},{side},100,"
+                           f"{rng.random():.4f},{array}\n")
+
+
+def read_with_pandas(data_path):
+    """
+    The parsing path simulate used before read_final_demes.
+    """
+    df = pd.read_csv(data_path, header=0)
+    df.AverageArray = df.AverageArray.apply(lambda x: np.fromstring(x, sep=";"))
+    df = df[np.floor(df.Generation) == np.floor(df.Generation.max())]
+    df = df.reset_index(drop=True)
+    return SimulatedTumour.from_dataframe(df)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--repeats", type=int, default=5,
+                        help="number of timed reads per case")
+    args = parser.parse_args()
+
+    cases = [(8, 1200, 10), (8, 1200, 100), (64, 1200, 20), (8, 20000, 10),
+             (64, 20000, 10)]
+    print(f"{'demes':>6} {'fCpGs':>6} {'gens':>5} {'pandas s':>10} "
+          f"{'reader s':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tempdir:
+        for demes, fcpgs, generations in cases:
+            path = os.path.join(tempdir, "final_demes.csv")
+            write_final_demes(path, demes, fcpgs, generations)
+            old = read_with_pandas(path)
+            new = read_final_demes(path)
+            assert np.array_equal(old.arrays, new.arrays)
+            t_old = min(timeit.repeat(lambda: read_with_pandas(path),
+                                      number=1, repeat=args.repeats))
+            t_new = min(timeit.repeat(lambda: read_final_demes(path),
+                                      number=1, repeat=args.repeats))
+            print(f"{demes:>6} {fcpgs:>6} {generations:>5} {t_old:>10.4f} "
+                  f"{t_new:>10.4f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from methabc.runtime import (RuntimeLog, RuntimePredictor, lpt_order,
+                             makespan)
+
+import numpy as np
+from argparse import ArgumentParser
+
+
+def synthetic_runs(rng, size, sigma):
+    """
+    Parameters from the run_tumour prior with log-normal runtimes that grow
+    with the carrying capacity and migration rate, as methdemon's do.
+    """
+    params = [{
+        'deme_carrying_capacity': rng.choice([10, 100, 1000]),
+        'init_migration_rate': rng.uniform(0.0005, 0.1),
+        'mu_driver_birth': rng.uniform(0, 0.01),
+        's_driver_birth': rng.uniform(0, 0.2),
+        'meth_rate': rng.uniform(0, 0.1),
+        'demeth_rate': rng.uniform(0, 0.1),
+    } for _ in range(size)]
+    log_seconds = np.array([
+        -2 + 0.8 * np.log(p['deme_carrying_capacity'])
+        + 0.5 * np.log(p['init_migration_rate'] / 0.0005)
+        + 0.1 * np.log(p['mu_driver_birth'] + 1e-6)
+        for p in params])
+    return params, np.exp(log_seconds + rng.normal(0, sigma, size))
+
+
+def main():
+    parser = ArgumentParser(
+        description="Idle worker time per generation when simulations are "
+                    "dispatched in proposal order or longest predicted "
+                    "runtime first.")
+    parser.add_argument("--runtime-log", type=str, default=None,
+                        help="use recorded runtimes instead of synthetic ones")
+    parser.add_argument("-n", "--generation-size", type=int, default=2000)
+    parser.add_argument("-w", "--workers", type=int, default=64)
+    parser.add_argument("--sigma", type=float, default=0.5,
+                        help="log-scale noise of the synthetic runtimes")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.runtime_log:
+        entries = [entry for entry in RuntimeLog(args.runtime_log).simulations()
+                   if entry["status"] == "completed"]
+        params = [e["params"] for e in entries]
+        seconds = np.array([e["seconds"] for e in entries])
+    else:
+        params, seconds = synthetic_runs(rng, 10 * args.generation_size,
+                                         args.sigma)
+    train = rng.permutation(len(seconds))[:len(seconds) // 2]
+    predictor = RuntimePredictor(
+        config_template_path="resources/config_template.dat").fit(
+        [params[i] for i in train], seconds[train])
+    test = np.setdiff1d(np.arange(len(seconds)), train)
+
+    results = {"proposal order": [], "longest predicted first": [],
+               "longest actual first": []}
+    for _ in range(args.repeats):
+        generation = rng.choice(test, size=min(args.generation_size,
+                                               len(test)), replace=False)
+        actual = seconds[generation]
+        predicted = predictor.predict([params[i] for i in generation])
+        for name, order in (
+                ("proposal order", np.arange(len(actual))),
+                ("longest predicted first", lpt_order(predicted)),
+                ("longest actual first", lpt_order(actual))):
+            span, idle = makespan(actual[order], args.workers)
+            results[name].append((span, idle / (args.workers * span)))
+
+    print(f"{len(generation)} simulations on {args.workers} workers, "
+          f"residual sigma {predictor.sigma:.2f}")
+    print(f"{'dispatch':<26} {'makespan s':>11} {'idle':>6}")
+    for name, values in results.items():
+        span, idle = np.mean(values, axis=0)
+        print(f"{name:<26} {span:>11.0f} {idle:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from methabc.distance import total_distance
+from methabc.tumour import STORAGE, SimulatedTumour, as_observed, compact
+
+import numpy as np
+import os
+import pyabc
+import tempfile
+import time
+from argparse import ArgumentParser
+from pyabc.storage.bytes_storage import from_bytes, to_bytes
+
+
+def random_tumour(rng, fcpgs):
+    return SimulatedTumour(
+        arrays=rng.beta(0.3, 0.3, size=(8, fcpgs)),
+        side=np.array([0] * 4 + [1] * 4, dtype=np.int8),
+        origin_time=rng.random(8),
+        generation=np.full(8, 1000.),
+    )
+
+
+def write_history(db_path, payloads, generations):
+    """
+    Append populations holding the given payloads to a new history and
+    return the mean write time per generation.
+    """
+    history = pyabc.History("sqlite:///" + db_path)
+    history.store_initial_data(None, {}, {}, {}, ["model"], "", "", "")
+    weight = 1 / len(payloads)
+    seconds = []
+    for t in range(generations):
+        population = pyabc.Population([
+            pyabc.Particle(m=0, parameter=pyabc.Parameter(meth_rate=0.01),
+                           weight=weight, sum_stat={"data": payload},
+                           distance=1.)
+            for payload in payloads
+        ])
+        start = time.perf_counter()
+        history.append_population(t, 1., population, len(payloads),
+                                  ["model"])
+        seconds.append(time.perf_counter() - start)
+    return np.mean(seconds)
+
+
+def main():
+    parser = ArgumentParser(
+        description="History size, write time and distance error of the "
+                    "storage modes of simulate_abc.")
+    parser.add_argument("-n", "--population-size", type=int, default=200)
+    parser.add_argument("-g", "--generations", type=int, default=3)
+    parser.add_argument("--fcpgs", type=int, default=1200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    observed = as_observed(random_tumour(rng, 1164))
+    tumours = [random_tumour(rng, args.fcpgs)
+               for _ in range(args.population_size)]
+    exact = np.array([total_distance({"data": t}, {"data": observed})
+                      for t in tumours])
+
+    modes = {"dataframe (before)": [t.to_dataframe() for t in tumours]}
+    modes.update({mode: [compact(t, mode) for t in tumours]
+                  for mode in STORAGE})
+
+    print(f"{'storage':<20} {'MB':>8} {'s/generation':>13} "
+          f"{'max rel. distance error':>24}")
+    with tempfile.TemporaryDirectory() as tempdir:
+        for mode, payloads in modes.items():
+            db_path = os.path.join(tempdir, mode.split()[0] + ".db")
+            seconds = write_history(db_path, payloads, args.generations)
+            size = os.path.getsize(db_path) / 2**20
+            # distances on the payload as read back from the history
+            stored = [from_bytes(to_bytes(payload)) for payload in payloads]
+            dist = np.array([total_distance({"data": p}, {"data": observed})
+                             for p in stored])
+            error = np.max(np.abs(dist - exact) / exact)
+            print(f"{mode:<20} {size:>8.1f} {seconds:>13.3f} "
+                  f"{error:>24.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from methabc.store import build_store
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+
+# a worker starting up: import methabc, load every observed tumour, touch
+# its arrays, report the load time and memory and stay alive until released
+WORKER = """
+import json, os, sys, time
+start = time.perf_counter()
+from methabc.cohort import Cohort
+imported = time.perf_counter()
+cohort = Cohort.from_directory(sys.argv[1])
+loaded = time.perf_counter()
+touched = sum(float(t.arrays.sum() + t.sorted_arrays.sum())
+              for t in cohort.tumours)
+memory = {}
+with open(f"/proc/{os.getpid()}/smaps_rollup") as file:
+    for line in file:
+        if line.startswith(("Rss:", "Pss:")):
+            memory[line.split(":")[0]] = int(line.split()[1]) / 1024
+print(json.dumps({"import": imported - start, "load": loaded - imported,
+                  **memory}), flush=True)
+sys.stdin.readline()
+"""
+
+
+def start_workers(workers, data_dir, env):
+    """
+    Start the workers at once and return their reports. Proportional
+    memory splits shared pages between the processes mapping them, so the
+    workers stay alive until all of them reported.
+    """
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER, data_dir],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              env=env, text=True) for _ in range(workers)]
+    reports = [json.loads(proc.stdout.readline()) for proc in procs]
+    for proc in procs:
+        proc.communicate("\n")
+    return reports
+
+def main():
+    parser = ArgumentParser(
+        description="Worker cold start and memory with the observed tumours "
+                    "read from their CSV files or from the memory-mapped "
+                    "store.")
+    parser.add_argument("-w", "--workers", type=int, default=8)
+    parser.add_argument("--data_dir", type=str, default="data/individual")
+    parser.add_argument("--counts_dir", type=str,
+                        default="data/individual_distances")
+    args = parser.parse_args()
+
+    package = os.path.dirname(os.path.dirname(
+        os.path.abspath(sys.modules["methabc"].__file__)))
+    with tempfile.TemporaryDirectory() as tempdir:
+        store = os.path.join(tempdir, "tumours.store")
+        build_store(store, args.data_dir, args.counts_dir)
+        print(f"store: {os.path.getsize(store) / 2**20:.1f} MB, "
+              f"{args.workers} workers")
+        print(f"{'data':<8} {'import s':>9} {'load ms':>8} {'RSS MB':>7} "
+              f"{'PSS MB':>7}")
+        for name, path in (("csv", ""), ("store", store)):
+            env = {**os.environ, "METHABC_DATA_STORE": path,
+                   "PYTHONPATH": os.pathsep.join(filter(None, [
+                       package, os.environ.get("PYTHONPATH")]))}
+            reports = start_workers(args.workers, args.data_dir, env)
+            mean = {key: np.mean([r[key] for r in reports])
+                    for key in reports[0]}
+            print(f"{name:<8} {mean['import']:>9.2f} "
+                  f"{1e3 * mean['load']:>8.1f} {mean['Rss']:>7.1f} "
+                  f"{mean['Pss']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
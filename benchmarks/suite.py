@@ -0,0 +1,266 @@
+from methabc.cohort import Cohort
+from methabc.counts import ObservedCounts
+from methabc.distance import (AdaptiveTotalDistance, allele_count_distance,
+                              distance_components, distance_sum, l2_distance,
+                              overall_wasserstein, population_distances,
+                              total_distance)
+from methabc.run import PRIORS, add_sampler_arguments, make_sampler
+from methabc.simulate import limit_simulations, simulate, simulate_abc
+from methabc.standin import read_config, simulate_demes, write_final_demes
+from methabc.utils import import_data, read_final_demes, render_config, write_config
+
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from argparse import ArgumentParser
+
+import numpy as np
+import pyabc
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+TEMPLATE = "resources/config_template.dat"
+GROUPS = ("config", "parse", "simulate", "distance", "end-to-end")
+
+
+def per_call(func, number, repeat=3):
+    """
+    Best time of one call of func in seconds, over repeat timings of number
+    calls each.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def prior_draws(rng, size):
+    return [{key: rng.uniform(a, b) for key, (a, b) in
+             PRIORS["simulate"].items()} for _ in range(size)]
+
+
+def standin_tumours(rng, size, tempdir, demes=8, generations=3, fcpgs=None):
+    """
+    Stand-in simulations of prior draws, read back as SimulatedTumours.
+    """
+    config = read_config(TEMPLATE)
+    if fcpgs:
+        config["fCpG_loci_per_cell"] = fcpgs
+    path = os.path.join(tempdir, "final_demes.csv")
+    tumours = []
+    for params in prior_draws(rng, size):
+        arrays, origin_time = simulate_demes({**config, **params}, demes, rng)
+        write_final_demes(path, arrays, origin_time, generations)
+        tumours.append(read_final_demes(path))
+    return tumours
+
+
+def bench_config(args, tempdir):
+    params = {
+        'init_migration_rate': 0.009,
+        'mu_driver_birth': 0.0001,
+        's_driver_birth': 0.1,
+        'meth_rate': 0.0022,
+        'demeth_rate': 0.0018,
+        'deme_carrying_capacity': 100,
+        'seed': 1234,
+    }
+    render_config(params, TEMPLATE)
+    yield "render_config", 1e6 * per_call(
+        lambda: render_config(params, TEMPLATE), 20 * args.number), "us"
+    yield "write_config", 1e6 * per_call(
+        lambda: write_config(params, TEMPLATE, tempdir), 20 * args.number), \
+        "us"
+
+
+def bench_parse(args, tempdir):
+    rng = np.random.default_rng(0)
+    config = read_config(TEMPLATE)
+    path = os.path.join(tempdir, "final_demes.csv")
+    for demes, fcpgs, generations in ((8, 1200, 3), (8, 1200, 100),
+                                      (64, 1200, 20), (8, 20000, 10)):
+        arrays, origin_time = simulate_demes(
+            {**config, "fCpG_loci_per_cell": fcpgs}, demes, rng)
+        write_final_demes(path, arrays, origin_time, generations)
+        yield (f"read_final_demes {demes} demes x {fcpgs} x {generations} "
+               f"gens", 1e3 * per_call(lambda: read_final_demes(path),
+                                      max(args.number // 10, 1)), "ms")
+
+
+def bench_simulate(args, tempdir):
+    rng = np.random.default_rng(0)
+    # every call renders, writes and runs a new config
+    yield "simulate, stand-in", 1e3 * per_call(
+        lambda: simulate(prior_draws(rng, 1)[0]), max(args.number // 10, 1)), \
+        "ms"
+
+
+def bench_distance(args, tempdir):
+    rng = np.random.default_rng(0)
+    cohort = Cohort.from_directory(args.data_dir)
+    particles = standin_tumours(rng, args.number, tempdir)
+    adaptive = AdaptiveTotalDistance()
+    distances = {
+        "l2_distance": l2_distance,
+        "overall_wasserstein": overall_wasserstein,
+        "distance_sum": distance_sum,
+        "total_distance": total_distance,
+        "distance_components": distance_components,
+        "AdaptiveTotalDistance": lambda x, x_0: adaptive(x, x_0),
+    }
+    for name, distance in distances.items():
+        seconds = per_call(lambda: [distance({"data": p}, {"data": observed})
+                                    for observed in cohort.tumours
+                                    for p in particles], 1)
+        yield name, 1e3 * seconds / (len(cohort) * len(particles)), \
+            "ms/particle"
+    counts = [ObservedCounts.from_arrays(t.arrays) for t in cohort.tumours]
+    seconds = per_call(lambda: [allele_count_distance({"data": p},
+                                                      {"data": observed})
+                                for observed in counts
+                                for p in particles], 1)
+    yield "allele_count_distance", \
+        1e3 * seconds / (len(cohort) * len(particles)), "ms/particle"
+    sum_stats = [{"data": p} for p in particles]
+    seconds = per_call(lambda: [population_distances(sum_stats, observed)
+                                for observed in cohort.tumours], 1)
+    yield "population_distances", \
+        1e3 * seconds / (len(cohort) * len(particles)), "ms/particle"
+    seconds = per_call(lambda: [cohort.distances(p) for p in particles], 1)
+    yield f"Cohort.distances, {len(cohort)} tumours", \
+        1e3 * seconds / len(particles), "ms/particle"
+
+
+def bench_end_to_end(args, tempdir):
+    observation = import_data(os.path.join(args.data_dir, "tumour_D.csv"),
+                              compiled=True)
+    prior = pyabc.Distribution(**{key: pyabc.RV("uniform", a, b - a)
+                                  for key, (a, b) in
+                                  PRIORS["simulate"].items()})
+    parser = ArgumentParser()
+    add_sampler_arguments(parser)
+    for mode in args.samplers:
+        sampler_args = ["--sampler", mode]
+        if args.processes and mode != "redis":
+            sampler_args += ["--processes", str(args.processes)]
+        abc = pyabc.ABCSMC(simulate_abc, prior, total_distance,
+                           population_size=args.population_size,
+                           sampler=make_sampler(
+                               parser.parse_args(sampler_args)))
+        abc.new(db="sqlite:///" + os.path.join(tempdir, f"{mode}.db"),
+                observed_sum_stat={"data": observation})
+        start = time.time()
+        history = abc.run(max_nr_populations=args.generations)
+        elapsed = time.time() - start
+        limit_simulations(None)
+        yield f"{mode} sampler", history.total_nr_simulations / elapsed, \
+            "particles/s"
+
+
+BENCHMARKS = {
+    "config": bench_config,
+    "parse": bench_parse,
+    "simulate": bench_simulate,
+    "distance": bench_distance,
+    "end-to-end": bench_end_to_end,
+}
+
+
+def compare(value, unit, baseline, tolerance):
+    """
+    Relative change against the baseline, positive when slower, and whether
+    it exceeds the tolerance.
+    """
+    if unit == "particles/s":
+        change = baseline / value - 1
+    else:
+        change = value / baseline - 1
+    return change, change > tolerance
+
+
+def main():
+    parser = ArgumentParser(
+        description="Benchmark config rendering, output parsing, simulation "
+                    "overhead, distances on data/individual and end-to-end "
+                    "throughput, using the methdemon stand-in, and compare "
+                    "against stored baselines.")
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=GROUPS,
+                        help="benchmark groups to run (default: all)")
+    parser.add_argument("-n", "--number", type=int, default=100,
+                        help="calls, or particles, per timing")
+    parser.add_argument("--data_dir", type=str, default="data/individual")
+    parser.add_argument("--samplers", nargs="+", default=["pool",
+                                                          "throttled-pool"],
+                        help="sampler modes of the end-to-end runs; redis "
+                             "needs a server and workers with "
+                             "$METHABC_MODEL set to the stand-in")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--population-size", type=int, default=100)
+    parser.add_argument("--generations", type=int, default=3)
+    parser.add_argument("--standin-seconds", type=float, default=0,
+                        help="wall time of a stand-in run")
+    parser.add_argument("--baseline", type=str, default=BASELINE)
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    logging.getLogger("ABC").setLevel(logging.WARNING)
+
+    # the stand-in runs under this interpreter and sees this methabc
+    package = os.path.dirname(os.path.dirname(
+        os.path.abspath(sys.modules["methabc"].__file__)))
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package, os.environ.get("PYTHONPATH")]))
+    os.environ["METHABC_MODEL"] = f"{sys.executable} -m methabc.standin"
+    os.environ["METHABC_STANDIN_SECONDS"] = str(args.standin_seconds)
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    except FileNotFoundError:
+        baseline = {}
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<52} {'value':>10} {'unit':<12} "
+          f"{'baseline':>10} {'change':>8}")
+    for group in args.only:
+        with tempfile.TemporaryDirectory() as tempdir:
+            for name, value, unit in BENCHMARKS[group](args, tempdir):
+                key = f"{group}: {name}"
+                results[key] = {"value": value, "unit": unit}
+                line = f"{key:<52} {value:>10.3f} {unit:<12}"
+                if key in baseline:
+                    change, slower = compare(value, unit,
+                                             baseline[key]["value"],
+                                             args.tolerance)
+                    line += (f" {baseline[key]['value']:>10.3f} "
+                             f"{change:>+8.0%}")
+                    if slower:
+                        line += "  REGRESSION"
+                        regressions.append(key)
+                print(line, flush=True)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump({
+                "machine": {"python": platform.python_version(),
+                            "processor": platform.processor(),
+                            "cores": os.cpu_count()},
+                "results": baseline,
+            }, file, indent=2)
+            file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} benchmarks more than "
+              f"{args.tolerance:.0%} slower than the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
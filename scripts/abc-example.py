@@ -1,11 +1,18 @@
 from methabc.simulate import simulate_abc, simulate
-from methabc.demo_distance import l2_distance, overall_wasserstein, compute_deme_matrix
-from pyabc.sampler import RedisEvalParallelSampler
+from methabc.demo_distance import compute_deme_matrix
+from methabc.distance import AdaptiveTotalDistance
+from methabc.tumour import as_observed
+from methabc.run import add_sampler_arguments, make_sampler
 
 import pyabc
+from argparse import ArgumentParser
 
 
 def main():
+    parser = ArgumentParser()
+    add_sampler_arguments(parser, default="redis", port=2666)
+    args = parser.parse_args()
+
     unif_params = {
         'init_migration_rate': (0.001, 0.1),
         'mu_driver_birth': (0, 0.01),
@@ -30,10 +37,10 @@ def main():
     observation = simulate(obs_param)
     observed_matrix = compute_deme_matrix(observation)
     print("Done!")
-    print("Setting up redis_sampler...")
-    redis_sampler = RedisEvalParallelSampler(host="127.0.0.1", port=2666)
+    sampler = make_sampler(args)
 
-    distance = pyabc.AdaptiveAggregatedDistance([l2_distance, overall_wasserstein])
+    # L_2 and Wasserstein terms computed together, adaptively weighted
+    distance = AdaptiveTotalDistance()
 
     abc = pyabc.ABCSMC(
         simulate_abc,
@@ -41,12 +48,12 @@ def main():
         distance,
         population_size=200,
         eps=pyabc.SilkOptimalEpsilon(k=10),
-        sampler=redis_sampler,
+        sampler=sampler,
     )
 
     abc_id = abc.new(
         db="sqlite:///" + "tmp/example.db",
-        observed_sum_stat={"data": observation},
+        observed_sum_stat={"data": as_observed(observation)},
         gt_par=obs_param,
         meta_info={"initial_dist_matrix": observed_matrix},
     )
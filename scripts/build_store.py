@@ -0,0 +1,24 @@
+from methabc.store import DEFAULT_STORE, build_store
+
+from argparse import ArgumentParser
+
+
+def main():
+    parser = ArgumentParser(
+        description="Convert the observed tumours and their allele counts "
+                    "into the memory-mapped store import_data reads.")
+    parser.add_argument("-o", "--store", type=str, default=DEFAULT_STORE,
+                        help="store file to write")
+    parser.add_argument("--data_dir", type=str, default="data/individual",
+                        help="folder with the tumour_<ID>.csv files")
+    parser.add_argument("--counts_dir", type=str,
+                        default="data/individual_distances",
+                        help="folder with the CRC-multi_patient-<ID>.csv "
+                             "allele counts")
+    args = parser.parse_args()
+    ids = build_store(args.store, args.data_dir, args.counts_dir)
+    print(f"Stored tumours {', '.join(ids)} in {args.store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 from methabc.simulate import log_model_abc
-from methabc.distance import total_distance, compute_deme_matrix
+from methabc.distance import total_distance
 from methabc.utils import import_data
-from pyabc.sampler import RedisEvalParallelSampler
+from methabc.run import (add_resume_arguments, add_sampler_arguments,
+                         make_sampler, report_simulations, resumable,
+                         setup_logging)
+from methabc.resume import finished, report_resume, start_or_resume
 
 import pyabc
+import time
 from argparse import ArgumentParser
 
 
@@ -11,7 +15,10 @@ def main():
     parser = ArgumentParser()
     parser.add_argument("-d", "--data_id", type=str,
                         help="ID of the data set in the data folder")
+    add_resume_arguments(parser)
+    add_sampler_arguments(parser, default="redis", port=2166)
     args = parser.parse_args()
+    setup_logging()
     data_id = args.data_id
 
     unif_params = {
@@ -28,29 +35,41 @@ def main():
 
     data_path = "data/individual/tumour_" + data_id + ".csv"
 
-    observation = import_data(data_path)
+    observation = import_data(data_path, compiled=True)
 
-    observed_matrix = compute_deme_matrix(observation)
+    observed_matrix = observation.deme_matrix
 
-    print("Setting up redis_sampler...")
-    redis_sampler = RedisEvalParallelSampler(host="127.0.0.1", port=2166)
+    sampler = make_sampler(args)
     print("Done.")
 
+    db = "tmp/log_model_" + data_id + ".db"
+    model, prior, transition, journal = resumable(log_model_abc, prior, db,
+                                                  args)
+
     abc = pyabc.ABCSMC(
-        log_model_abc,
+        model,
         prior,
         total_distance,
         population_size=1000,
-        sampler=redis_sampler,
+        transitions=transition,
+        sampler=sampler,
     )
 
-    abc_id = abc.new(
-        db="sqlite:///" + "tmp/log_model_" + data_id + ".db",
+    t0 = start_or_resume(
+        abc, db,
         observed_sum_stat={"data": observation},
         meta_info={"initial_dist_matrix": observed_matrix},
+        resume=args.resume,
+        journal=journal,
     )
+    if finished(db, t0, 25):
+        return
 
-    history = abc.run(max_nr_populations=25, minimum_epsilon=0, min_acceptance_rate=0.03)
+    start = time.time()
+    history = abc.run(max_nr_populations=25 - t0, minimum_epsilon=0, min_acceptance_rate=0.03)
+    report_simulations(args.runtime_log, start)
+    if journal is not None:
+        report_resume(journal)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+from methabc.cohort import Cohort, ReferenceTable, build_reference_table
+from methabc.run import PRIORS, fit_runtime_predictor
+
+import logging
+import os
+import time
+import pyabc
+from argparse import ArgumentParser
+
+
+def main():
+    parser = ArgumentParser(
+        description="Simulate prior draws once and score them against every "
+                    "observed tumour, building the reference table used by "
+                    "methabc --reference-table.")
+    parser.add_argument("-n", "--num_samples", type=int, default=10000,
+                        help="number of simulations to add to the table")
+    parser.add_argument("--table", type=str, default="tmp/reference_table.npz",
+                        help="reference table, extended if it exists")
+    parser.add_argument("--data_dir", type=str, default="data/individual",
+                        help="folder with the tumour_<ID>.csv files")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: cores)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="run this many simulations at once from a "
+                             "single Python process instead of using "
+                             "--processes worker processes")
+    parser.add_argument("--runtime-log", type=str, default=None,
+                        help="record simulation runtimes in this file and "
+                             "dispatch the longest predicted runs first")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    prior = pyabc.Distribution(
+        **{key: pyabc.RV("uniform", a, b - a)
+           for key, (a, b) in PRIORS["simulate"].items()},
+    )
+
+    cohort = Cohort.from_directory(args.data_dir)
+    table = ReferenceTable(args.table, names=list(PRIORS["simulate"]),
+                           ids=cohort.ids)
+    print(f"Scoring against tumours {', '.join(cohort.ids)}; "
+          f"table has {len(table)} rows")
+
+    predictor = None
+    if args.runtime_log:
+        os.environ["METHABC_RUNTIME_LOG"] = args.runtime_log
+        predictor = fit_runtime_predictor(args.runtime_log)
+
+    start = time.time()
+    build_reference_table(table, cohort, prior, args.num_samples,
+                          processes=args.processes,
+                          runtime_predictor=predictor,
+                          concurrency=args.concurrency)
+    print(f"{args.num_samples} simulations in {time.time() - start:.0f} s, "
+          f"{len(table)} rows in {args.table}")
+
+
+if __name__ == "__main__":
+    main()
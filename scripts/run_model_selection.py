@@ -1,14 +1,37 @@
-from methabc.distance import total_distance, compute_deme_matrix
-from methabc.model_selection import simulate_10, simulate_100, simulate_1000
+from methabc.distance import total_distance
+from methabc.model_selection import (cost_aware_selection, model_family,
+                                     report_model_costs)
 from methabc.utils import import_data
-from pyabc.sampler import RedisEvalParallelSampler
+from methabc.run import (add_sampler_arguments, make_sampler,
+                         report_simulations, setup_logging)
 
-import numpy as np
 import os
 import pyabc
+import time
+from argparse import ArgumentParser
+
+# lower bound of the migration rate prior per carrying capacity
+MIN_MIGRATION_RATE = {10: 0.001, 100: 0.0005, 1000: 0.0001}
 
 
 def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", "--data_id", type=str, default="M",
+                        help="ID of the data set in the data folder")
+    parser.add_argument("--carrying-capacities", type=int, nargs="+",
+                        default=[10, 100, 1000],
+                        help="deme carrying capacity of every model")
+    parser.add_argument("--population-size", type=int, default=500)
+    parser.add_argument("--max-populations", type=int, default=10)
+    parser.add_argument("--min-probability", type=float, default=0.01,
+                        help="stop proposing models whose posterior "
+                             "probability falls below this")
+    # simulator time per model is read from the runtime log
+    add_sampler_arguments(parser, default="redis", port=2166,
+                          runtime_log="model_selection/runtimes.jsonl")
+    args = parser.parse_args()
+    setup_logging()
+
     unif_params = {
         'meth_rate': (0, 0.1),
         'demeth_rate': (0, 0.1),
@@ -19,46 +42,44 @@ def main():
         's_driver_birth': 0.05,
     }
 
-    prior10 = pyabc.Distribution(
-        init_migration_rate=pyabc.RV("uniform", 0.001, 0.1),
-        **{key: pyabc.RV("uniform", a, b - a) for key, (a, b) in unif_params.items()},
-        **{key: pyabc.RV("halfnorm", a) for key, a in halfnorm_params.items()},
-        )
-
-    prior100 = pyabc.Distribution(
-        init_migration_rate=pyabc.RV("uniform", 0.0005, 0.1),
-        **{key: pyabc.RV("uniform", a, b - a) for key, (a, b) in unif_params.items()},
-        **{key: pyabc.RV("halfnorm", a) for key, a in halfnorm_params.items()},
-        )
-
-    prior1000 = pyabc.Distribution(
-        init_migration_rate=pyabc.RV("uniform", 0.0001, 0.1),
-        **{key: pyabc.RV("uniform", a, b - a) for key, (a, b) in unif_params.items()},
-        **{key: pyabc.RV("halfnorm", a) for key, a in halfnorm_params.items()},
-        )
-    priors = [prior10, prior100, prior1000]
-
-    redis_sampler = RedisEvalParallelSampler(host="127.0.0.1", port=2166)
-    models = [simulate_10, simulate_100, simulate_1000]
+    priors = [
+        pyabc.Distribution(
+            init_migration_rate=pyabc.RV(
+                "uniform", MIN_MIGRATION_RATE.get(k, 0.0005), 0.1),
+            **{key: pyabc.RV("uniform", a, b - a) for key, (a, b) in unif_params.items()},
+            **{key: pyabc.RV("halfnorm", a) for key, a in halfnorm_params.items()},
+            )
+        for k in args.carrying_capacities
+    ]
 
     os.makedirs("model_selection", exist_ok=True)
+    sampler = make_sampler(args)
+    models = model_family(deme_carrying_capacity=args.carrying_capacities)
+    distance, kernel = cost_aware_selection(
+        models, total_distance, min_probability=args.min_probability,
+        runtime_log=args.runtime_log)
 
     abc = pyabc.ABCSMC(
             models,
             priors,
-            total_distance,
-            population_size=500,
-            sampler=redis_sampler,
+            distance,
+            population_size=args.population_size,
+            model_perturbation_kernel=kernel,
+            sampler=sampler,
             )
 
     db_path = "sqlite:///" + os.path.join(os.getcwd(), "model_selection/ms_history.db")
-    observation = import_data("data/individual/tumour_M.csv")
+    observation = import_data("data/individual/tumour_" + args.data_id + ".csv",
+                              compiled=True)
     abc_id = abc.new(
             db_path,
             observed_sum_stat={"data": observation},
-            meta_info={"initial_dist_matrix": compute_deme_matrix(observation)},
+            meta_info={"initial_dist_matrix": observation.deme_matrix},
             )
-    history = abc.run(max_nr_populations=10)
+    start = time.time()
+    history = abc.run(max_nr_populations=args.max_populations)
+    report_model_costs(distance, history)
+    report_simulations(args.runtime_log, start)
 
 
 if __name__ == "__main__":
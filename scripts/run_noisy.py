@@ -1,7 +1,7 @@
 from methabc.simulate import simulate_abc 
-from methabc.distance import total_distance, compute_deme_matrix
+from methabc.distance import total_distance
 from methabc.utils import import_data
-from pyabc.sampler import RedisEvalParallelSampler
+from methabc.run import add_sampler_arguments, make_sampler
 
 import pyabc
 from argparse import ArgumentParser
@@ -11,6 +11,7 @@ def main():
     parser = ArgumentParser()
     parser.add_argument("-d", "--data_id", type=str,
                         help="ID of the data set in the data folder")
+    add_sampler_arguments(parser, default="redis", port=2166)
     args = parser.parse_args()
     data_id = args.data_id
 
@@ -28,12 +29,11 @@ def main():
 
     data_path = "data/individual/tumour_" + data_id + ".csv"
 
-    observation = import_data(data_path)
+    observation = import_data(data_path, compiled=True)
 
-    observed_matrix = compute_deme_matrix(observation)
+    observed_matrix = observation.deme_matrix
 
-    print("Setting up redis_sampler...")
-    redis_sampler = RedisEvalParallelSampler(host="127.0.0.1", port=2166)
+    sampler = make_sampler(args)
     print("Done.")
 
     abc = pyabc.ABCSMC(
@@ -44,7 +44,7 @@ def main():
         kernel=pyabc.IndependentNormalKernel(var=0.01),
         eps=pyabc.Temperature(),
         population_size=1000,
-        sampler=redis_sampler,
+        sampler=sampler,
     )
 
     abc_id = abc.new(
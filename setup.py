@@ -6,4 +6,10 @@ setup(
     python_requires=">=3.11",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
+    entry_points={
+        "console_scripts": [
+            "methabc=methabc.run:main",
+            "methdemon-standin=methabc.standin:main",
+        ],
+    },
 )
@@ -0,0 +1,164 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from .runtime import get_runtime_log
+from .tumour import SimulatedTumour
+
+logger = logging.getLogger(__name__)
+
+
+class SimulationCache:
+    """
+    Content-addressed on-disk cache of simulator outputs. Entries are keyed
+    on the rendered config, which includes the seed, and hold the final
+    generation arrays. Writes are atomic renames, so many workers on one
+    node can share a cache directory; the least recently used entries are
+    evicted once the cache grows beyond max_bytes.
+
+    Args:
+        directory: directory to store the cache in
+        max_bytes: size cap of the cache
+        log_every: log hit and miss counts every this many lookups
+    """
+
+    def __init__(self, directory, max_bytes=10 * 2**30, log_every=100):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.log_every = log_every
+        self.hits = 0
+        self.misses = 0
+        self._unchecked_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, config):
+        key = hashlib.sha256(config.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        # counted across workers by the driver, see RuntimeLog.counts
+        runtime_log = get_runtime_log()
+        if runtime_log is not None:
+            runtime_log.record_event("cache_hit" if hit else "cache_miss")
+        if (self.hits + self.misses) % self.log_every == 0:
+            logger.info(f"Simulation cache: {self.hits} hits, "
+                        f"{self.misses} misses")
+
+    def get(self, config):
+        """
+        Return the cached result for a rendered config, or None.
+        """
+        path = self._path(config)
+        try:
+            with np.load(path) as entry:
+                tumour = SimulatedTumour(
+                    arrays=entry["arrays"],
+                    side=entry["side"],
+                    origin_time=entry["origin_time"],
+                    generation=entry["generation"],
+                )
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # partially written or corrupt entry
+            logger.warning(f"Removing unreadable cache entry {path}")
+            self._remove(path)
+            self._count(False)
+            return None
+        self._count(True)
+        return tumour
+
+    def put(self, config, tumour):
+        """
+        Store the result of a simulation under its rendered config.
+        """
+        path = self._path(config)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(
+                    file,
+                    arrays=tumour.arrays,
+                    side=tumour.side,
+                    origin_time=tumour.origin_time,
+                    generation=tumour.generation,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._unchecked_bytes += os.path.getsize(path)
+        # only scan the cache once enough has been written to matter
+        if self._unchecked_bytes > self.max_bytes / 20:
+            self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self):
+        """
+        Total size of the cache entries in bytes.
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(".npz"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is below
+        its size cap. Only one process evicts at a time.
+        """
+        self._unchecked_bytes = 0
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+
+_cache = None
+
+
+def default_cache():
+    """
+    Return the cache configured by $METHABC_CACHE (and optionally
+    $METHABC_CACHE_BYTES), or None if caching is off.
+    """
+    global _cache
+    directory = os.environ.get("METHABC_CACHE")
+    if not directory:
+        return None
+    if _cache is None or _cache.directory != directory:
+        max_bytes = int(os.environ.get("METHABC_CACHE_BYTES", 10 * 2**30))
+        _cache = SimulationCache(directory, max_bytes=max_bytes)
+    return _cache
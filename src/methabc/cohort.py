@@ -0,0 +1,325 @@
+import glob
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+
+import numpy as np
+import pyabc
+
+from .distance import REJECTED, match_demes, total_distance
+from .runtime import lpt_order, makespan
+from .simulate import AsyncSimulator, simulate
+from .tumour import as_simulated
+from .utils import import_data
+from .wasserstein import wasserstein_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class Cohort:
+    """
+    Every observed tumour of a data set, stacked so that a simulation can be
+    scored against all of them in one vectorised pass. Tumours are grouped by
+    their number of fCpG sites, which differs between some tumours.
+
+    Args:
+        ids: data IDs of the tumours, e.g. "D"
+        tumours: ObservedTumour of every ID, all with the same number of demes
+    """
+
+    def __init__(self, ids, tumours):
+        self.ids = tuple(ids)
+        self.tumours = tuple(tumours)
+        num_demes = {tumour.arrays.shape[0] for tumour in self.tumours}
+        if len(num_demes) != 1:
+            raise ValueError(f"Tumours have different numbers of demes: "
+                             f"{sorted(num_demes)}")
+        self.num_demes = num_demes.pop()
+        self.deme_matrices = np.stack([t.deme_matrix for t in self.tumours])
+        self.groups = []
+        for num_sites in sorted({t.arrays.shape[1] for t in self.tumours}):
+            index = np.array([i for i, t in enumerate(self.tumours)
+                              if t.arrays.shape[1] == num_sites])
+            self.groups.append((index, np.stack(
+                [self.tumours[i].sorted_arrays for i in index])))
+
+    @classmethod
+    def from_directory(cls, directory="data/individual"):
+        """
+        Load every tumour_<ID>.csv of a directory once.
+        """
+        paths = sorted(glob.glob(os.path.join(directory, "tumour_*.csv")))
+        if not paths:
+            raise FileNotFoundError(f"No tumour_*.csv files in {directory}")
+        ids = [re.fullmatch(r"tumour_(.*)\.csv", os.path.basename(path))[1]
+               for path in paths]
+        return cls(ids, [import_data(path, compiled=True) for path in paths])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, data):
+        """
+        Compute the total distance of a simulated tumour to every tumour of
+        the cohort, see total_distance.
+        Args:
+            data: SimulatedTumour, or None for a failed simulation
+        Returns:
+            array of shape (tumours,), in the order of ids
+        """
+        res = np.full(len(self), float(REJECTED))
+        if data is None:
+            return res
+        tumour = as_simulated(data)
+        if np.count_nonzero(tumour.side >= 0) != self.num_demes:
+            return res
+        tumour = tumour.sorted_by_side()
+        sim_sorted = tumour.sorted_arrays
+        costs = np.empty_like(self.deme_matrices)
+        for index, obs_sorted in self.groups:
+            costs[index] = wasserstein_matrix(sim_sorted, obs_sorted)
+        dist, _ = match_demes(tumour.deme_matrix, self.deme_matrices, costs,
+                              tumour.num_left)
+        return np.minimum(res, dist)
+
+
+class ReferenceTable:
+    """
+    Persistent table of prior draws and their distance to every tumour of a
+    cohort, shared between the inference runs of the individual tumours.
+    Stored as a .npz file, which is replaced atomically on every save.
+
+    Args:
+        path: file to store the table in; an existing table is loaded
+        names: parameter names, required for a new table
+        ids: tumour IDs, required for a new table
+    """
+
+    def __init__(self, path, names=None, ids=None):
+        self.path = path
+        self._lookup = None
+        if os.path.exists(path):
+            with np.load(path) as table:
+                self.names = tuple(table["names"])
+                self.ids = tuple(table["ids"])
+                self.params = table["params"]
+                self.distances = table["distances"]
+            for given, stored, what in ((names, self.names, "parameters"),
+                                        (ids, self.ids, "tumours")):
+                if given is not None and tuple(given) != stored:
+                    raise ValueError(f"Reference table {path} has {what} "
+                                     f"{list(stored)}, not {list(given)}")
+        elif names is None or ids is None:
+            raise FileNotFoundError(f"No reference table at {path}")
+        else:
+            self.names = tuple(names)
+            self.ids = tuple(ids)
+            self.params = np.empty((0, len(self.names)))
+            self.distances = np.empty((0, len(self.ids)))
+
+    def __len__(self):
+        return len(self.params)
+
+    def append(self, params, distances):
+        """
+        Add rows to the table.
+        Args:
+            params: list of parameter dicts
+            distances: array of shape (rows, tumours)
+        """
+        rows = np.array([[p[name] for name in self.names] for p in params],
+                        dtype=float).reshape(-1, len(self.names))
+        self.params = np.vstack([self.params, rows])
+        self.distances = np.vstack([self.distances, distances])
+        self._lookup = None
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, names=np.array(self.names),
+                         ids=np.array(self.ids), params=self.params,
+                         distances=self.distances)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def parameter(self, row):
+        """
+        Return the parameters of a row as a pyabc Parameter. Values stay
+        NumPy floats, as drawn from the prior, since configs render Python
+        floats with fewer digits (see ConfigTemplate.render) and the row
+        would not reproduce its simulation.
+        """
+        return pyabc.Parameter(dict(zip(self.names, self.params[row])))
+
+    def lookup(self, params, tumour_id):
+        """
+        Return the stored distance of parameters drawn from the table to a
+        tumour, or None if the parameters are not in the table.
+        """
+        if self._lookup is None:
+            self._lookup = {tuple(row): i
+                            for i, row in enumerate(self.params.tolist())}
+        try:
+            key = tuple(float(params[name]) for name in self.names)
+        except KeyError:
+            return None
+        row = self._lookup.get(key)
+        if row is None:
+            return None
+        return float(self.distances[row, self.ids.index(tumour_id)])
+
+
+class TablePrior(pyabc.Distribution):
+    """
+    Prior that draws its samples from the rows of a reference table, so that
+    the calibration sample and first generation of a run reuse simulations
+    already scored against its tumour. Every process draws the rows in its
+    own random order, so a row can be drawn by more than one worker; once
+    every row was drawn in a process, samples come from the prior again.
+    Densities are those of the prior, which must be the prior the table was
+    built with.
+
+    Args:
+        table: ReferenceTable
+        **random_variables: the prior, as for pyabc.Distribution
+    """
+
+    def __init__(self, table, **random_variables):
+        super().__init__(**random_variables)
+        if set(table.names) != set(self.keys()):
+            raise ValueError(f"Reference table has parameters "
+                             f"{list(table.names)}, not {sorted(self.keys())}")
+        self.table = table
+        self._order = None
+        self._pid = None
+
+    def copy(self):
+        return self.__class__(
+            self.table, **{key: value.copy() for key, value in self.items()})
+
+    def rvs(self, *args, **kwargs):
+        if self._pid != os.getpid():
+            # workers reseed numpy, so every process draws its own order
+            self._order = list(np.random.permutation(len(self.table)))
+            self._pid = os.getpid()
+        if self._order:
+            return self.table.parameter(self._order.pop())
+        return super().rvs(*args, **kwargs)
+
+
+class ReferenceModel:
+    """
+    Model returning the stored distance for parameters drawn from a
+    reference table, and simulating any other parameters.
+
+    Args:
+        model: model function, e.g. simulate_abc
+        table: ReferenceTable
+        tumour_id: ID of the tumour the run infers
+    """
+
+    def __init__(self, model, table, tumour_id):
+        self.model = model
+        self.table = table
+        self.tumour_id = tumour_id
+
+    def __call__(self, params):
+        dist = self.table.lookup(params, self.tumour_id)
+        if dist is not None:
+            return {"reference_distance": dist}
+        return self.model(params)
+
+
+class ReferenceDistance:
+    """
+    Distance passing the stored distance of ReferenceModel outputs through,
+    and computing any other distance with the given function.
+
+    Args:
+        distance: distance function, e.g. total_distance
+    """
+
+    def __init__(self, distance=total_distance):
+        self.distance = distance
+
+    def __call__(self, dict1, dict2):
+        for stats in (dict1, dict2):
+            if "reference_distance" in stats:
+                return float(stats["reference_distance"])
+        return self.distance(dict1, dict2)
+
+
+_cohort = None
+
+
+def _score(params):
+    return params, _cohort.distances(simulate(params, seed="params"))
+
+
+def build_reference_table(table, cohort, prior, num_samples, processes=None,
+                          save_every=100, runtime_predictor=None,
+                          concurrency=None):
+    """
+    Simulate prior draws in a process pool, or concurrently from this
+    process, and score every simulation against the whole cohort, adding
+    the results to a reference table.
+    Simulations are seeded from their parameters, so that they can be
+    reproduced (see params_seed).
+    Args:
+        table: ReferenceTable with the parameters of the prior and the IDs of
+            the cohort
+        cohort: Cohort to score against
+        prior: pyabc.Distribution to draw parameters from
+        num_samples: number of rows to add
+        processes: worker processes (default: cores)
+        save_every: save the table every this many rows
+        runtime_predictor: RuntimePredictor; if given, the draws are
+            dispatched longest predicted runtime first, so that no long
+            simulation is left running alone at the end
+        concurrency: if given, run this many simulations at once as
+            subprocesses of this process (see AsyncSimulator) and score them
+            here as they finish, instead of using worker processes
+    """
+    global _cohort
+    if tuple(cohort.ids) != table.ids:
+        raise ValueError(f"Reference table is for tumours {list(table.ids)}, "
+                         f"not {list(cohort.ids)}")
+    draws = [dict(prior.rvs()) for _ in range(num_samples)]
+    if runtime_predictor is not None:
+        runtimes = runtime_predictor.predict(draws)
+        order = lpt_order(runtimes)
+        draws = [draws[i] for i in order]
+        workers = concurrency or processes or os.cpu_count()
+        span, idle = makespan(runtimes[order], workers)
+        logger.info(f"Projected makespan {span:.0f} s, "
+                    f"{idle / (workers * span):.0%} idle")
+    params, distances = [], []
+
+    def add(i, p, d):
+        params.append(p)
+        distances.append(d)
+        if i % save_every == 0 or i == num_samples:
+            table.append(params, np.array(distances))
+            table.save()
+            params.clear()
+            distances.clear()
+            logger.info(f"Reference table: {len(table)} rows")
+
+    if concurrency is not None:
+        finished = itertools.count(1)
+        AsyncSimulator(concurrency).map(
+            draws, lambda i, tumour: add(next(finished), draws[i],
+                                         cohort.distances(tumour)),
+            seed="params")
+        return
+    _cohort = cohort  # inherited by the forked workers
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        for i, (p, d) in enumerate(pool.imap_unordered(_score, draws), 1):
+            add(i, p, d)
@@ -0,0 +1,171 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .store import MISSING_COUNT, data_store
+from .tumour import _frozen, allele_counts
+from .utils import order_demes
+
+# set bits of every byte; numpy 1.26 has no bitwise_count
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def bit_planes(counts):
+    """
+    Thermometer code of allele counts: plane k has a bit set where at least
+    k + 1 alleles are methylated, so that the absolute difference of two
+    counts is the number of planes in which their bits differ.
+    Args:
+        counts: uint8 allele counts of shape (demes, fCpGs)
+    Returns:
+        uint8 array of shape (2, demes, ceil(fCpGs / 8)), bits packed along
+        the fCpG sites
+    """
+    return np.stack([np.packbits(counts >= 1, axis=-1),
+                     np.packbits(counts >= 2, axis=-1)])
+
+
+def plane_fractions(planes, num_sites):
+    """
+    Fraction of sites with at least one and with two methylated alleles in
+    every deme, of shape (demes, 2).
+    """
+    return POPCOUNT[planes].sum(axis=-1, dtype=np.int64).T / num_sites
+
+
+def pairwise_allele_distance(planes1, planes2, num_sites):
+    """
+    Mean absolute difference in allele counts per site between every pair
+    of demes, from their bit planes: XOR and popcount over the packed
+    bytes instead of float differences.
+    Args:
+        planes1: bit planes of shape (2, demes1, bytes), see bit_planes
+        planes2: bit planes of shape (2, demes2, bytes)
+        num_sites: number of fCpG sites
+    Returns:
+        array of shape (demes1, demes2)
+    """
+    differing = planes1[:, :, None, :] ^ planes2[:, None, :, :]
+    return POPCOUNT[differing].sum(axis=(0, 3), dtype=np.int64) / num_sites
+
+
+def fraction_costs(fractions1, fractions2):
+    """
+    Wasserstein distance between the allele count distributions of every
+    pair of demes. Counts take the values 0, 1 and 2, so it is the summed
+    difference of the fractions of sites with at least one and with two
+    methylated alleles.
+    """
+    return np.abs(fractions1[:, None, :] - fractions2[None, :, :]).sum(-1)
+
+
+@dataclass(frozen=True, eq=False)
+class ObservedCounts:
+    """
+    Allele counts of an observed tumour with everything the allele count
+    distance needs from it computed once.
+    Attributes:
+        labels: CpG labels of the fCpG sites
+        demes: names of the demes, in the order of import_data
+        counts: uint8 allele counts of shape (demes, fCpGs)
+        planes: bit planes of the counts, see bit_planes
+        deme_matrix: mean absolute count difference between every pair of
+            demes
+        fractions: see plane_fractions
+        source: count file the counts were imported from, if any; such
+            counts pickle as a reference to the file and are loaded once per
+            worker process
+    """
+    labels: np.ndarray
+    demes: tuple
+    counts: np.ndarray
+    planes: np.ndarray
+    deme_matrix: np.ndarray
+    fractions: np.ndarray
+    source: str = None
+
+    @classmethod
+    def from_counts(cls, counts, labels=None, demes=None, source=None):
+        """
+        Build the observed counts from an array of shape (demes, fCpGs).
+        """
+        counts = _frozen(np.asarray(counts, dtype=np.uint8))
+        num_sites = counts.shape[1]
+        planes = bit_planes(counts)
+        if labels is None:
+            labels = np.arange(num_sites)
+        if demes is None:
+            demes = tuple(range(counts.shape[0]))
+        return cls(
+            labels=_frozen(labels),
+            demes=tuple(demes),
+            counts=counts,
+            planes=_frozen(planes),
+            deme_matrix=_frozen(pairwise_allele_distance(planes, planes,
+                                                         num_sites)),
+            fractions=_frozen(plane_fractions(planes, num_sites)),
+            source=source,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Discretise the methylation arrays of an observed or synthetic
+        tumour, see allele_counts.
+        """
+        return cls.from_counts(allele_counts(np.asarray(arrays)))
+
+    @property
+    def num_sites(self):
+        return self.counts.shape[1]
+
+    def __reduce_ex__(self, protocol):
+        if self.source is None:
+            return super().__reduce_ex__(protocol)
+        return load_counts, (self.source,)
+
+    def __array__(self, dtype=None, copy=None):
+        # pyabc stores summary statistics with numpy.save
+        if dtype is None:
+            return self.counts
+        return self.counts.astype(dtype)
+
+
+def import_counts(counts_path):
+    """
+    Import the allele counts of an observed tumour, with the demes in the
+    order of import_data, from the data store if it holds them or else from
+    the file.
+    Args:
+        counts_path: path to a CRC-multi_patient-<ID>.csv allele count file
+    Returns:
+        ObservedCounts
+    """
+    store = data_store()
+    tumour_id = store.find_counts(counts_path) if store is not None else None
+    if tumour_id is not None:
+        observed = store.observed(tumour_id)
+        counts = store.allele_counts(tumour_id)
+        # sites of the data file missing from the count file
+        present = np.all(counts != MISSING_COUNT, axis=0)
+        return ObservedCounts.from_counts(
+            counts[:, present], labels=observed.labels[present],
+            demes=observed.demes, source=os.path.abspath(counts_path))
+    counts = pd.read_csv(counts_path, index_col=0)
+    counts = counts[order_demes(counts.columns)]
+    return ObservedCounts.from_counts(counts.to_numpy(dtype=np.uint8).T,
+                                      labels=counts.index.to_numpy(),
+                                      demes=counts.columns,
+                                      source=os.path.abspath(counts_path))
+
+
+@lru_cache(maxsize=None)
+def load_counts(counts_path):
+    """
+    Import the allele counts of an observed tumour once per process, e.g.
+    in each worker that receives them from a sampler.
+    """
+    return import_counts(counts_path)
@@ -1,5 +1,7 @@
 import numpy as np
-from scipy.stats import wasserstein_distance
+
+from .tumour import as_simulated
+from .wasserstein import paired_wasserstein
 
 
 def squared_distance(gland1, gland2):
@@ -18,18 +20,13 @@ def compute_deme_matrix(df):
     Compute the distance matrix for a deme. If there are fewer than 8 demes,
     reject the df automatically.
     """
-    df = df.sort_values(by=['Side', 'OriginTime']).reset_index(drop=True)
-    if df.shape[0] != 8:
+    if df is None:
+        return 100 * np.ones((8, 8))
+    tumour = as_simulated(df).sorted_by_side()
+    if tumour.num_demes != 8:
         return 100 * np.ones((8, 8))
     else:
-        res = np.zeros((8, 8))
-        for i, row1 in df.iterrows():
-            for j, row2 in df.iterrows():
-                res[i, j] = squared_distance(
-                        row1.AverageArray,
-                        row2.AverageArray,
-                        )
-        return res
+        return tumour.deme_matrix
 
 
 def l2_distance(dict1, dict2):
@@ -52,14 +49,11 @@ def overall_wasserstein(dict1, dict2):
     Compute the Wasserstein distance between two simulated tumours. For fewer
     than 8 demes, reject the comparison automatically.
     """
-    df1 = dict1['data']
-    df2 = dict2['data']
-    if df1.shape[0] != 8 or df2.shape[0] != 8:
+    if dict1['data'] is None or dict2['data'] is None:
         return 1000
-    res = 0
-    for i in range(8):
-        res += wasserstein_distance(
-                df1.iloc[i].AverageArray,
-                df2.iloc[i].AverageArray
-                )
-    return res
+    tumour1 = as_simulated(dict1['data'])
+    tumour2 = as_simulated(dict2['data'])
+    if tumour1.num_demes != 8 or tumour2.num_demes != 8:
+        return 1000
+    return np.sum(paired_wasserstein(tumour1.sorted_arrays,
+                                     tumour2.sorted_arrays))
@@ -1,11 +1,31 @@
+import logging
 import numpy as np
 import pandas as pd
+import pyabc
 
+from collections import Counter
+from functools import lru_cache
 from itertools import permutations
 from math import factorial
-from scipy.stats import wasserstein_distance
 from scipy.optimize import linear_sum_assignment
 
+from .counts import (ObservedCounts, bit_planes, fraction_costs,
+                     pairwise_allele_distance, plane_fractions)
+from .runtime import get_runtime_log
+from .timing import stage
+from .tumour import (ObservedTumour, TumourSummary, allele_counts, as_observed,
+                     as_simulated, is_simulated, pairwise_squared)
+from .wasserstein import paired_wasserstein, sort_demes, wasserstein_matrix
+
+logger = logging.getLogger(__name__)
+
+# distance of failed simulations and of simulations with the wrong number of
+# demes
+REJECTED = 1000
+
+# how often total_distance rejected a simulation early, by reason
+rejection_counts = Counter()
+
 
 def squared_distance(gland1, gland2):
     """
@@ -21,18 +41,16 @@ def compute_deme_matrix(df):
     """
     Compute the deme matrix for a given dataframe.
     """
-    if 'Side' in df.columns:
-        if df.shape[0] != 8:
+    if df is None:
+        return 100 * np.ones((8, 8))
+    if isinstance(df, ObservedTumour):
+        return df.deme_matrix
+    if is_simulated(df):
+        tumour = as_simulated(df)
+        if tumour.num_demes != 8:
             return 100 * np.ones((8, 8))
         else:
-            res = np.zeros((8, 8))
-            for i, row1 in df.iterrows():
-                for j, row2 in df.iterrows():
-                    res[i, j] = squared_distance(
-                            row1.AverageArray,
-                            row2.AverageArray,
-                            )
-            return res
+            return tumour.deme_matrix
     else:
         res = np.zeros((8, 8))
         fcpgs = df.shape[0]
@@ -59,21 +77,10 @@ def overall_wasserstein(dict1, dict2):
     """
     Compute the Wasserstein distance between simulated tumour and data.
     """
-    df1 = dict1['data']
-    df2 = dict2['data']
-    res = 0
-    for i in range(8):
-        if 'AverageArray' in df1.columns:
-            df2_col = df2.columns[i]
-            res += wasserstein_distance(df1.iloc[i].AverageArray, df2[df2_col])
-        elif 'AverageArray' in df2.columns:
-            df1_col = df1.columns[i]
-            res += wasserstein_distance(df1[df1_col], df2.iloc[i].AverageArray)
-        else:
-            df1_col = df1.columns[i]
-            df2_col = df2.columns[i]
-            res += wasserstein_distance(df1[df1_col], df2[df2_col])
-    return res
+    if dict1['data'] is None or dict2['data'] is None:
+        return REJECTED
+    return np.sum(paired_wasserstein(_sorted_demes(dict1['data']),
+                                     _sorted_demes(dict2['data'])))
 
 
 def distance_sum(dict1, dict2):
@@ -109,26 +116,614 @@ def ith_df_perm(df, i):
     return perm_df.reset_index(drop=True)
 
 
+def deme_arrays(df):
+    """
+    Stack the methylation arrays of a dataframe into a (demes, fCpGs) array.
+    Simulated data holds one deme per row, observed data one deme per column.
+    """
+    if isinstance(df, ObservedTumour):
+        return df.arrays
+    if is_simulated(df):
+        return as_simulated(df).float_arrays
+    if 'AverageArray' in df.columns:
+        return np.vstack(df.AverageArray.values).astype(float)
+    return df.to_numpy(dtype=float).T
+
+
+def _sorted_demes(df):
+    """
+    Sorted arrays of the first 8 demes, precomputed for observed tumours and
+    summaries.
+    """
+    if isinstance(df, ObservedTumour):
+        return df.sorted_arrays[:8]
+    if is_simulated(df):
+        return as_simulated(df).sorted_arrays[:8]
+    return sort_demes(deme_arrays(df)[:8])
+
+
+def wasserstein_costs(sim_arrays, obs_arrays):
+    """
+    Compute the Wasserstein distance between every simulated and every
+    observed deme. Entry [k, i] compares simulated deme k to observed deme i.
+    """
+    return wasserstein_matrix(sort_demes(sim_arrays), sort_demes(obs_arrays))
+
+
+@lru_cache(maxsize=None)
+def side_blocks(num_l_demes, num_r_demes):
+    """
+    Return every ordering of the left demes and every ordering of the right
+    demes, as arrays of shape (orderings, demes).
+    """
+    left_perms = np.array(list(permutations(range(num_l_demes))),
+                          dtype=np.intp).reshape(factorial(num_l_demes),
+                                                 num_l_demes)
+    right_perms = np.array(list(permutations(range(num_l_demes,
+                                                   num_l_demes + num_r_demes))),
+                           dtype=np.intp).reshape(factorial(num_r_demes),
+                                                  num_r_demes)
+    left_perms.setflags(write=False)
+    right_perms.setflags(write=False)
+    return left_perms, right_perms
+
+
+@lru_cache(maxsize=None)
+def side_permutations(num_l_demes, num_r_demes):
+    """
+    Return every deme ordering that keeps left demes before right demes, as
+    an array of shape (orderings, demes).
+    """
+    left_perms, right_perms = side_blocks(num_l_demes, num_r_demes)
+    res = np.hstack([
+        np.repeat(left_perms, len(right_perms), axis=0),
+        np.tile(right_perms, (len(left_perms), 1)),
+    ])
+    res.setflags(write=False)
+    return res
+
+
+def _enumerate_orderings(sim_matrix, obs_matrix, costs, num_l_demes,
+                         chunk_size=4096):
+    """
+    Score every ordering allowed by the sides at once, in chunks. Leading
+    dimensions of the matrices are broadcast, to match several tumours at
+    once.
+    """
+    n = sim_matrix.shape[-1]
+    perms = side_permutations(num_l_demes, n - num_l_demes)
+    positions = np.arange(n)
+    batch = np.broadcast_shapes(sim_matrix.shape[:-2], obs_matrix.shape[:-2],
+                                costs.shape[:-2])
+    best = np.full(batch, np.inf)
+    best_perm = np.zeros(batch + (n,), dtype=np.intp)
+    for start in range(0, len(perms), chunk_size):
+        chunk = perms[start:start + chunk_size]
+        perm_matrix = sim_matrix[..., chunk[:, :, None], chunk[:, None, :]]
+        l2 = np.sqrt(np.sum((perm_matrix - obs_matrix[..., None, :, :]) ** 2,
+                            axis=(-2, -1)) / 2)
+        wass = np.sum(costs[..., chunk, positions], axis=-1)
+        dist = wass + l2
+        i = np.argmin(dist, axis=-1)
+        dist = np.take_along_axis(dist, i[..., None], axis=-1)[..., 0]
+        better = dist < best
+        best = np.where(better, dist, best)
+        best_perm = np.where(better[..., None], chunk[i], best_perm)
+    if best.ndim == 0:
+        return best[()], best_perm
+    return best, best_perm
+
+
+def _enumerate_by_side(sim_matrix, obs_matrix, costs, num_l_demes):
+    """
+    Score every ordering allowed by the sides for a batch of simulated deme
+    matrices of shape (N, demes, demes), without gathering a permuted matrix
+    per ordering. The squared L_2 distance is the sum of squares of both
+    matrices, which no ordering changes, minus twice their overlap
+    sum S[p_i, p_j] O[i, j]; the overlap splits into a term of the left
+    ordering, a term of the right ordering and a term of both, and the
+    Wasserstein term into a left and a right term.
+    """
+    n = sim_matrix.shape[-1]
+    left, right = side_blocks(num_l_demes, n - num_l_demes)
+    l_pos = np.arange(num_l_demes)
+    r_pos = np.arange(num_l_demes, n)
+    overlap_l = np.einsum("bpij,ij->bp",
+                          sim_matrix[:, left[:, :, None], left[:, None, :]],
+                          obs_matrix[:num_l_demes, :num_l_demes])
+    overlap_r = np.einsum("bpij,ij->bp",
+                          sim_matrix[:, right[:, :, None], right[:, None, :]],
+                          obs_matrix[num_l_demes:, num_l_demes:])
+    # overlap[k, j] of simulated right deme k at observed right position j
+    # with the left demes, for every left ordering
+    between = np.einsum("bpik,ij->bpkj",
+                        sim_matrix[:, left, num_l_demes:],
+                        obs_matrix[:num_l_demes, num_l_demes:])
+    between = between[:, :, right - num_l_demes, r_pos - num_l_demes].sum(-1)
+    overlap = overlap_l[:, :, None] + overlap_r[:, None, :] + 2 * between
+    squares = np.sum(sim_matrix ** 2, axis=(1, 2)) + np.sum(obs_matrix ** 2)
+    l2 = np.sqrt(np.maximum(squares[:, None, None] - 2 * overlap, 0) / 2)
+    wass = (costs[:, left, l_pos].sum(-1)[:, :, None]
+            + costs[:, right, r_pos].sum(-1)[:, None, :])
+    dist = (wass + l2).reshape(len(sim_matrix), -1)
+    i = np.argmin(dist, axis=-1)
+    return (np.take_along_axis(dist, i[:, None], axis=-1)[:, 0],
+            side_permutations(num_l_demes, n - num_l_demes)[i])
+
+
+def _assignment_bound(costs, demes, positions):
+    """
+    Lower bound on the Wasserstein part of the still unassigned positions.
+    """
+    if not positions:
+        return 0
+    sub = costs[np.ix_(demes, positions)]
+    rows, cols = linear_sum_assignment(sub)
+    return sub[rows, cols].sum()
+
+
+def _branch_and_bound(sim_matrix, obs_matrix, costs, num_l_demes):
+    """
+    Depth-first search over orderings, pruning any partial ordering whose
+    Wasserstein assignment bound plus partial L_2 term cannot beat the best
+    ordering found so far.
+    """
+    n = sim_matrix.shape[0]
+    sides = [range(num_l_demes), range(num_l_demes, n)]
+
+    # start from the best ordering for the Wasserstein term alone
+    best_perm = np.empty(n, dtype=np.intp)
+    for side in sides:
+        side = np.array(side, dtype=np.intp)
+        rows, cols = linear_sum_assignment(costs[np.ix_(side, side)])
+        best_perm[side[cols]] = side[rows]
+    best = (costs[best_perm, np.arange(n)].sum()
+            + np.sqrt(np.sum((sim_matrix[np.ix_(best_perm, best_perm)]
+                              - obs_matrix) ** 2) / 2))
+
+    order = []
+
+    def search(wass, squares):
+        nonlocal best, best_perm
+        k = len(order)
+        if k == n:
+            dist = wass + np.sqrt(squares / 2)
+            if dist < best:
+                best, best_perm = dist, np.array(order)
+            return
+        side = sides[0] if k < num_l_demes else sides[1]
+        candidates = [d for d in side if d not in order]
+        steps = []
+        for d in candidates:
+            added = (2 * np.sum((sim_matrix[order, d] - obs_matrix[:k, k]) ** 2)
+                     + (sim_matrix[d, d] - obs_matrix[k, k]) ** 2)
+            steps.append((wass + costs[d, k], squares + added, d))
+        steps.sort(key=lambda step: step[0] + np.sqrt(step[1] / 2))
+        for next_wass, next_squares, d in steps:
+            rest = [e for e in candidates if e != d]
+            bound = (next_wass + np.sqrt(next_squares / 2)
+                     + _assignment_bound(costs, [e for e in rest if e < num_l_demes],
+                                         list(range(k + 1, num_l_demes)))
+                     + _assignment_bound(costs, [e for e in rest if e >= num_l_demes],
+                                         list(range(max(k + 1, num_l_demes), n))))
+            if bound >= best:
+                continue
+            order.append(d)
+            search(next_wass, next_squares)
+            order.pop()
+
+    search(0, 0)
+    return best, best_perm
+
+
+def match_demes(sim_matrix, obs_matrix, costs, num_l_demes,
+                max_enumerate=factorial(8)):
+    """
+    Find the ordering of simulated demes minimising the Wasserstein plus L_2
+    distance to the observed tumour, keeping left demes before right demes.
+    Args:
+        sim_matrix: deme matrix of the simulated tumour, sorted by side
+        obs_matrix: deme matrix of the observed tumour
+        costs: Wasserstein distance of simulated deme k to observed deme i
+        num_l_demes: number of left demes in the simulated tumour
+        max_enumerate: largest number of orderings scored exhaustively before
+            switching to branch-and-bound
+        Leading dimensions of the matrices are broadcast, e.g. to match one
+        simulation to several observed tumours at once.
+    Returns:
+        distance: the minimal total distance
+        order: order[i] is the simulated deme matched to observed deme i
+    """
+    n = sim_matrix.shape[-1]
+    if factorial(num_l_demes) * factorial(n - num_l_demes) <= max_enumerate:
+        return _enumerate_orderings(sim_matrix, obs_matrix, costs, num_l_demes)
+    batch = np.broadcast_shapes(sim_matrix.shape[:-2], obs_matrix.shape[:-2],
+                                costs.shape[:-2])
+    if not batch:
+        return _branch_and_bound(sim_matrix, obs_matrix, costs, num_l_demes)
+    sim_matrix = np.broadcast_to(sim_matrix, batch + sim_matrix.shape[-2:])
+    obs_matrix = np.broadcast_to(obs_matrix, batch + obs_matrix.shape[-2:])
+    costs = np.broadcast_to(costs, batch + costs.shape[-2:])
+    best = np.empty(batch)
+    best_perm = np.empty(batch + (n,), dtype=np.intp)
+    for index in np.ndindex(batch):
+        best[index], best_perm[index] = _branch_and_bound(
+            sim_matrix[index], obs_matrix[index], costs[index], num_l_demes)
+    return best, best_perm
+
+
+def _count_rejection(reason, record=True):
+    rejection_counts[reason] += 1
+    if sum(rejection_counts.values()) % 100 == 0:
+        logger.info(f"Early rejections: {dict(rejection_counts)}")
+    # counted across workers by the driver, see RuntimeLog.counts; batched
+    # rescoring of particles scored before is not recorded again
+    runtime_log = get_runtime_log() if record else None
+    if runtime_log is not None:
+        runtime_log.record_event("rejected_" + reason)
+
+
+def _prepare(dict1, dict2):
+    """
+    Compute everything the matching of a simulated to an observed tumour
+    needs, or return None if the simulation is rejected early.
+    """
+    if dict1['data'] is None or dict2['data'] is None:
+        _count_rejection("failed_simulation")
+        return None
+    if is_simulated(dict1['data']):
+        sim, fd = dict1['data'], dict2['data']
+    else:
+        sim, fd = dict2['data'], dict1['data']
+    observed = as_observed(fd) # real data, precomputed once per run
+    tumour = as_simulated(sim) # simulated data
+    if np.count_nonzero(tumour.side >= 0) != observed.arrays.shape[0]:
+        _count_rejection("deme_count")
+        return None
+    tumour = tumour.sorted_by_side()
+    with stage("deme_matrix"):
+        sim_matrix = tumour.deme_matrix
+    with stage("wasserstein"):
+        costs = wasserstein_matrix(tumour.sorted_arrays,
+                                   observed.sorted_arrays)
+    return sim_matrix, observed.deme_matrix, costs, tumour.num_left
+
+
 def total_distance(dict1, dict2):
     """
-    Compute the total distance between two tumours.
+    Compute the total distance between two tumours: the Wasserstein plus L_2
+    distance under the best matching of simulated to observed demes.
+    Failed simulations and simulations that do not end with the observed
+    number of demes are rejected before any distance work.
+    """
+    res = REJECTED
+    prepared = _prepare(dict1, dict2)
+    if prepared is None:
+        return res
+    with stage("permutation_search"):
+        dist, _ = match_demes(*prepared)
+    return min(res, dist)
+
+
+def allele_count_distance(dict1, dict2):
+    """
+    Compute the total distance on allele counts: simulated methylation
+    arrays are discretised to 0, 1 or 2 methylated alleles, see
+    allele_counts, and compared with observed counts, see ObservedCounts.
+    The L_2 term compares the mean absolute count difference between every
+    pair of demes, computed by XOR and popcount on bit planes; the
+    Wasserstein term compares the count distributions of the matched demes.
+    Observed data given as beta values are discretised the same way.
+    Failed simulations and simulations that do not end with the observed
+    number of demes are rejected before any distance work.
     """
-    res = 1000
-    if 'Side' in dict1['data'].columns:
-        tmp_df = dict1['data'].sort_values(by=['Side',
-                                               'OriginTime']).reset_index(drop=True) # simulated data
-        fd = dict2['data'] # real data
+    if dict1['data'] is None or dict2['data'] is None:
+        _count_rejection("failed_simulation")
+        return REJECTED
+    if is_simulated(dict1['data']):
+        sim, fd = dict1['data'], dict2['data']
     else:
-        tmp_df = dict2['data'].sort_values(by=['Side',
-                                               'OriginTime']).reset_index(drop=True) # simulated data
-        fd = dict1['data'] # real data
-    num_l_demes = len(tmp_df[tmp_df['Side'] == 'left'])
-    num_r_demes = len(tmp_df[tmp_df['Side'] == 'right'])
-    iterations = factorial(num_l_demes) * factorial(num_r_demes)
-    for i in range(iterations):
-        perm_df = ith_df_perm(tmp_df, i)
-        tmp_wass = overall_wasserstein({'data': perm_df}, {'data': fd})
-        tmp_l2 = l2_distance({'data': perm_df}, {'data': fd})
-        tmp_dist = tmp_wass + tmp_l2
-        res = min(res, tmp_dist)
-    return res
+        sim, fd = dict2['data'], dict1['data']
+    observed = fd if isinstance(fd, ObservedCounts) else \
+        ObservedCounts.from_arrays(as_observed(fd).arrays)
+    tumour = as_simulated(sim)
+    if isinstance(tumour, TumourSummary):
+        raise ValueError("allele_count_distance needs the methylation "
+                         "arrays, not a TumourSummary")
+    if np.count_nonzero(tumour.side >= 0) != observed.counts.shape[0]:
+        _count_rejection("deme_count")
+        return REJECTED
+    tumour = tumour.sorted_by_side()
+    with stage("allele_counts"):
+        counts = tumour.arrays if tumour.arrays.dtype == np.uint8 \
+            else allele_counts(tumour.arrays)
+        planes = bit_planes(counts)
+    num_sites = counts.shape[1]
+    with stage("deme_matrix"):
+        sim_matrix = pairwise_allele_distance(planes, planes, num_sites)
+        costs = fraction_costs(plane_fractions(planes, num_sites),
+                               observed.fractions)
+    with stage("permutation_search"):
+        dist, _ = match_demes(sim_matrix, observed.deme_matrix, costs,
+                              tumour.num_left)
+    return min(REJECTED, dist)
+
+
+def distance_components(dict1, dict2, l2_weight=1, wasserstein_weight=1):
+    """
+    Compute the L_2 and Wasserstein terms of the total distance in one pass,
+    under the ordering of simulated demes minimising their weighted sum.
+    Args:
+        dict1, dict2: summary statistics of the simulated and the observed
+            tumour, in either order
+        l2_weight: weight of the L_2 term in the matching
+        wasserstein_weight: weight of the Wasserstein term in the matching
+    Returns:
+        l2: L_2 distance of the deme matrices under the best ordering
+        wasserstein: summed Wasserstein distance of the matched demes
+        order: order[i] is the simulated deme matched to observed deme i,
+            or None if the simulation was rejected, in which case both
+            terms are REJECTED
+    """
+    prepared = _prepare(dict1, dict2)
+    if prepared is None:
+        return REJECTED, REJECTED, None
+    sim_matrix, obs_matrix, costs, num_l_demes = prepared
+    # scaling the inputs scales the terms, so the matching is unchanged
+    with stage("permutation_search"):
+        _, order = match_demes(l2_weight * sim_matrix,
+                               l2_weight * obs_matrix,
+                               wasserstein_weight * costs, num_l_demes)
+    l2 = np.sqrt(np.sum((sim_matrix[np.ix_(order, order)] - obs_matrix) ** 2)
+                 / 2)
+    wasserstein = np.sum(costs[order, np.arange(len(order))])
+    return l2, wasserstein, order
+
+
+def l2_component(dict1, dict2):
+    """
+    L_2 term of the total distance, see distance_components.
+    """
+    return distance_components(dict1, dict2)[0]
+
+
+def wasserstein_component(dict1, dict2):
+    """
+    Wasserstein term of the total distance, see distance_components.
+    """
+    return distance_components(dict1, dict2)[1]
+
+
+def _batch_size(num_demes, num_l_demes, grid, max_bytes):
+    """
+    Number of simulations whose intermediate arrays fit in max_bytes.
+    """
+    num_r_demes = num_demes - num_l_demes
+    num_left, num_right = factorial(num_l_demes), factorial(num_r_demes)
+    per_simulation = 8 * max(
+        num_demes * num_demes * grid,  # deme matrix differences
+        num_left * num_l_demes * max(num_l_demes, num_r_demes),
+        num_right * num_r_demes * num_r_demes,
+        num_left * num_right * (num_r_demes + 1),  # orderings
+    )
+    return max(1, max_bytes // per_simulation)
+
+
+def _batch(prepare, valid, num_left, num_sites, observed, l2_weight,
+           wasserstein_weight, max_bytes):
+    """
+    Match chunks of simulations with the same number of left demes to an
+    observed tumour, see batch_distances.
+    Args:
+        prepare: function from the indices of a chunk to its deme matrices
+            and sorted arrays
+        valid: mask of the simulations not rejected early
+        num_left: number of left demes of every simulation
+        num_sites: number of fCpG sites, or quantiles, of the simulations
+    Returns:
+        distances, L_2 and Wasserstein terms of every simulation
+    """
+    l2, wasserstein = np.full((2, len(valid)), float(REJECTED))
+    num_demes, obs_sites = observed.sorted_arrays.shape
+    grid = num_sites if num_sites == obs_sites else num_sites + obs_sites
+    for left in np.unique(num_left[valid]):
+        left = int(left)
+        index = np.flatnonzero(valid & (num_left == left))
+        size = _batch_size(num_demes, left, grid, max_bytes)
+        for start in range(0, len(index), size):
+            chunk = index[start:start + size]
+            sim_matrix, sim_sorted = prepare(chunk)
+            with stage("wasserstein"):
+                costs = wasserstein_matrix(sim_sorted, observed.sorted_arrays)
+            with stage("permutation_search"):
+                weighted = (l2_weight * sim_matrix,
+                            l2_weight * observed.deme_matrix,
+                            wasserstein_weight * costs, left)
+                if (factorial(left) * factorial(num_demes - left)
+                        <= factorial(8)):
+                    _, order = _enumerate_by_side(*weighted)
+                else:
+                    _, order = match_demes(*weighted)
+            # the terms of the best ordering, without the cancellation of
+            # the overlap in _enumerate_by_side
+            rows = np.take_along_axis(sim_matrix, order[:, :, None], axis=1)
+            matched = np.take_along_axis(rows, order[:, None, :], axis=2)
+            l2[chunk] = np.sqrt(np.sum((matched - observed.deme_matrix) ** 2,
+                                       axis=(1, 2)) / 2)
+            wasserstein[chunk] = np.take_along_axis(
+                costs, order[:, None, :], axis=1)[:, 0].sum(axis=-1)
+    dist = np.where(valid, l2_weight * l2 + wasserstein_weight * wasserstein,
+                    REJECTED)
+    return np.minimum(dist, REJECTED), l2, wasserstein
+
+
+def batch_distances(arrays, observed, num_left, components=False,
+                    l2_weight=1, wasserstein_weight=1, max_bytes=2**22):
+    """
+    Compute the total distance of many simulated tumours to one observed
+    tumour at once: deme matrices, Wasserstein costs and the matching of
+    demes are computed for a chunk of simulations in single NumPy
+    operations, with chunks small enough that their intermediate arrays stay
+    below max_bytes.
+    Args:
+        arrays: methylation arrays of shape (N, demes, fCpGs), the demes of
+            every simulation ordered as by SimulatedTumour.sorted_by_side;
+            NaN rows mark failed simulations
+        observed: ObservedTumour, or data accepted by as_observed
+        num_left: number of left demes of every simulation, or of all
+        components: also return the L_2 and Wasserstein terms
+        l2_weight: weight of the L_2 term, see distance_components
+        wasserstein_weight: weight of the Wasserstein term
+        max_bytes: memory bound of the intermediate arrays of a chunk
+    Returns:
+        distances of shape (N,), REJECTED for failed simulations and for
+        simulations with another number of demes than the observation; with
+        components, also the unweighted L_2 and Wasserstein terms under the
+        same matching, REJECTED where the distance is
+    """
+    observed = as_observed(observed)
+    arrays = np.asarray(arrays)
+    n, num_demes, num_sites = arrays.shape
+    num_left = np.broadcast_to(np.asarray(num_left, dtype=int), (n,))
+    valid = ~np.isnan(arrays).any(axis=(1, 2))
+    for _ in range(n - np.count_nonzero(valid)):
+        _count_rejection("failed_simulation", record=False)
+    if num_demes != observed.arrays.shape[0]:
+        for _ in range(np.count_nonzero(valid)):
+            _count_rejection("deme_count", record=False)
+        valid[:] = False
+
+    def prepare(chunk):
+        chunk_arrays = np.asarray(arrays[chunk], dtype=float)
+        with stage("deme_matrix"):
+            sim_matrix = pairwise_squared(chunk_arrays)
+        with stage("wasserstein"):
+            sim_sorted = sort_demes(chunk_arrays)
+        return sim_matrix, sim_sorted
+
+    dist, l2, wasserstein = _batch(prepare, valid, num_left, num_sites,
+                                   observed, l2_weight, wasserstein_weight,
+                                   max_bytes)
+    if components:
+        return dist, l2, wasserstein
+    return dist
+
+
+def population_distances(sum_stats, observed, components=False,
+                         l2_weight=1, wasserstein_weight=1, max_bytes=2**22):
+    """
+    batch_distances for the summary statistics of many particles, e.g. a
+    pyabc sample or population. Simulated tumours and TumourSummary
+    statistics are batched separately, and by number of fCpG sites.
+    Args:
+        sum_stats: summary statistics {"data": tumour} of every particle
+        observed: ObservedTumour, or data accepted by as_observed
+        other arguments as for batch_distances
+    Returns:
+        as for batch_distances, in the order of sum_stats
+    """
+    observed = as_observed(observed)
+    num_demes = observed.arrays.shape[0]
+    dist, l2, wasserstein = np.full((3, len(sum_stats)), float(REJECTED))
+    groups = {}
+    for i, sum_stat in enumerate(sum_stats):
+        if sum_stat["data"] is None:
+            _count_rejection("failed_simulation", record=False)
+            continue
+        tumour = as_simulated(sum_stat["data"])
+        if np.count_nonzero(tumour.side >= 0) != num_demes:
+            _count_rejection("deme_count", record=False)
+            continue
+        tumour = tumour.sorted_by_side()
+        key = (type(tumour), tumour.sorted_arrays.shape[-1]
+               if isinstance(tumour, TumourSummary) else tumour.arrays.shape[1])
+        groups.setdefault(key, []).append((i, tumour))
+    for (kind, num_sites), members in groups.items():
+        index = np.array([i for i, _ in members])
+        tumours = [tumour for _, tumour in members]
+        num_left = np.array([tumour.num_left for tumour in tumours])
+        if kind is TumourSummary:
+            def prepare(chunk, tumours=tumours):
+                return (np.stack([tumours[i].deme_matrix for i in chunk]),
+                        np.stack([tumours[i].sorted_arrays for i in chunk]))
+
+            res = _batch(prepare, np.ones(len(tumours), dtype=bool),
+                         num_left, num_sites, observed, l2_weight,
+                         wasserstein_weight, max_bytes)
+        else:
+            res = batch_distances(
+                np.stack([tumour.float_arrays for tumour in tumours]),
+                observed, num_left, True, l2_weight, wasserstein_weight,
+                max_bytes)
+        dist[index], l2[index], wasserstein[index] = res
+    if components:
+        return dist, l2, wasserstein
+    return dist
+
+
+class AdaptiveTotalDistance(pyabc.AdaptiveAggregatedDistance):
+    """
+    Total distance with adaptively weighted L_2 and Wasserstein terms. Both
+    terms are computed together for every particle, see
+    distance_components, and the demes are matched to minimise the weighted
+    sum, so weights are updated without evaluating the terms separately.
+    Rejected simulations have distance REJECTED and are left out of the
+    scale estimates.
+
+    Between generations the terms of the whole sample, and the distances of
+    the accepted particles under the new weights, are computed in batches,
+    see population_distances; pyabc then reads the latter back particle by
+    particle.
+
+    Args:
+        as for pyabc.AdaptiveAggregatedDistance, without the distances
+    """
+
+    def __init__(self, initial_weights=None, factors=None, adaptive=True,
+                 scale_function=None, log_file=None):
+        super().__init__([l2_component, wasserstein_component],
+                         initial_weights=initial_weights, factors=factors,
+                         adaptive=adaptive, scale_function=scale_function,
+                         log_file=log_file)
+        # distances of the accepted particles under the latest weights
+        self.updated = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["updated"] = {}
+        return state
+
+    def _weights(self, t):
+        if not self.weights:
+            return np.ones(len(self.distances))
+        self.format_weights_and_factors(t)
+        return (self.get_for_t_or_latest(self.weights, t)
+                * self.get_for_t_or_latest(self.factors, t))
+
+    def __call__(self, x, x_0, t=None, par=None):
+        sum_stat, dist = self.updated.pop((id(x), t), (None, None))
+        if sum_stat is x and x_0 is self.x_0:
+            return dist
+        weights = self._weights(t)
+        l2, wasserstein, order = distance_components(x, x_0, *weights)
+        if order is None:
+            return REJECTED
+        return float(weights[0] * l2 + weights[1] * wasserstein)
+
+    def _update(self, t, sample):
+        _, *components = population_distances(
+            sample.all_sum_stats, self.x_0["data"], True, *self._weights(t))
+        components = np.array(components)[:, components[0] < REJECTED]
+        w = np.ones(len(self.distances))
+        if components.shape[1]:
+            for i, values in enumerate(components):
+                scale = self.scale_function(samples=values)
+                w[i] = 0 if np.isclose(scale, 0) else 1 / scale
+        self.weights[t] = w
+        self.log(t)
+        accepted = [particle.sum_stat
+                    for particle in sample.accepted_particles]
+        distances = population_distances(accepted, self.x_0["data"], False,
+                                         *self._weights(t))
+        self.updated = {(id(sum_stat), t): (sum_stat, float(dist))
+                        for sum_stat, dist in zip(accepted, distances)}
@@ -1,17 +1,246 @@
-from .simulate import simulate_abc
+import itertools
+
+import numpy as np
 import pyabc
+from pyabc.transition import ModelPerturbationKernel
+
+from .runtime import SIMULATOR_STATUSES, RuntimeLog, get_runtime_log
+from .simulate import simulate_abc
+
+
+class FixedParameters:
+    """
+    Simulator with some parameters fixed, e.g. the deme carrying capacity of
+    one model of a model selection run. The fixed values are added to a copy
+    of the parameters, which are left unchanged.
+
+    Args:
+        simulator: model function, e.g. simulate_abc
+        **fixed: fixed parameter values
+    """
+
+    def __init__(self, simulator=simulate_abc, **fixed):
+        self.simulator = simulator
+        self.fixed = fixed
+        self.__name__ = ",".join(f"{key}={value}"
+                                 for key, value in fixed.items())
+
+    def __call__(self, params):
+        return self.simulator({**params, **self.fixed})
+
+    def matches(self, params):
+        """
+        Tell whether simulated parameters, e.g. of a RuntimeLog record, are
+        those of this model.
+        """
+        return all(key in params and np.isclose(params[key], value)
+                   for key, value in self.fixed.items())
+
+
+def model_family(simulator=simulate_abc, **grid):
+    """
+    Build one model per combination of fixed parameter values.
+    Args:
+        simulator: model function, e.g. simulate_abc
+        **grid: values of every fixed parameter, e.g.
+            deme_carrying_capacity=[10, 100, 1000]
+    Returns:
+        list of FixedParameters models, in the order of the grid
+    """
+    keys = list(grid)
+    return [FixedParameters(simulator, **dict(zip(keys, values)))
+            for values in itertools.product(*grid.values())]
+
+
+simulate_10, simulate_100, simulate_1000 = model_family(
+    deme_carrying_capacity=[10, 100, 1000])
+
+
+class StoppingKernel(ModelPerturbationKernel):
+    """
+    Model perturbation kernel that never jumps to a stopped model, moving
+    its probability to the models still running.
+
+    Args:
+        as for pyabc.ModelPerturbationKernel
+    """
+
+    def __init__(self, nr_of_models, probability_to_stay=None):
+        # checked before pyabc clamps it into [0, 1]; with 1, a stopped
+        # model could not move its particles anywhere
+        if (nr_of_models > 1 and probability_to_stay is not None
+                and not 0 <= probability_to_stay < 1):
+            raise ValueError(f"probability_to_stay must be in [0, 1), got "
+                             f"{probability_to_stay}")
+        super().__init__(nr_of_models, probability_to_stay)
+        self.stopped = set()
+
+    def _probabilities(self, m):
+        if self.nr_of_models == 1:
+            return np.ones(1)
+        p = np.full(self.nr_of_models,
+                    (1 - self.probability_to_stay) / (self.nr_of_models - 1))
+        p[m] = self.probability_to_stay
+        p[list(self.stopped)] = 0
+        if not p.sum():
+            # m is the only model still running and probability_to_stay is 0
+            p[m] = 1
+        return p / p.sum()
+
+    def rvs(self, m):
+        return int(np.random.choice(self.nr_of_models,
+                                    p=self._probabilities(m)))
+
+    def pmf(self, n, m):
+        return float(self._probabilities(m)[n])
+
+
+class ModelSelectionDistance(pyabc.Distance):
+    """
+    Wrapper around the distance of a model selection run. Between
+    generations it records the posterior probability, simulations and
+    simulator time of every model, and stops proposing models whose
+    probability fell below min_probability. A stopped model dies out in the
+    next generation, so its probability is then taken as zero.
+
+    Simulator time is read from the runtime log, see RuntimeLog, which must
+    be shared by all workers of the run.
+
+    Args:
+        distance: distance function or pyabc.Distance, e.g. total_distance
+        models: FixedParameters models of the run
+        kernel: StoppingKernel of the run
+        min_probability: probability below which a model is stopped
+        runtime_log: RuntimeLog or its path (default: $METHABC_RUNTIME_LOG)
+    """
+
+    def __init__(self, distance, models, kernel, min_probability=0.01,
+                 runtime_log=None):
+        super().__init__()
+        self.distance = pyabc.distance.FunctionDistance.to_distance(distance)
+        self.models = models
+        self.kernel = kernel
+        self.min_probability = min_probability
+        if isinstance(runtime_log, str):
+            runtime_log = RuntimeLog(runtime_log)
+        self.runtime_log = runtime_log
+        self.read = 0
+        # one row per generation and model
+        self.generations = []
+
+    def __call__(self, x, x_0, t=None, par=None):
+        return self.distance(x, x_0, t, par)
+
+    def requires_calibration(self):
+        return self.distance.requires_calibration()
+
+    def is_adaptive(self):
+        return self.distance.is_adaptive()
+
+    def initialize(self, t, get_sample, x_0, total_sims):
+        self.distance.initialize(t=t, get_sample=get_sample, x_0=x_0,
+                                 total_sims=total_sims)
+        # the log may hold simulations of earlier runs
+        log = self.runtime_log or get_runtime_log()
+        self.read = len(log.read()) if log is not None else 0
+
+    def configure_sampler(self, sampler):
+        self.distance.configure_sampler(sampler)
+
+    def costs(self):
+        """
+        Simulations and simulator seconds of every model recorded in the
+        runtime log since the last call.
+        """
+        log = self.runtime_log or get_runtime_log()
+        if log is None:
+            return np.zeros(len(self.models)), np.zeros(len(self.models))
+        records = log.read()[self.read:]
+        self.read += len(records)
+        simulations, seconds = np.zeros((2, len(self.models)))
+        for record in records:
+            if record["status"] not in SIMULATOR_STATUSES:
+                continue
+            for m, model in enumerate(self.models):
+                if model.matches(record["params"]):
+                    simulations[m] += 1
+                    seconds[m] += record["seconds"]
+                    break
+        return simulations, seconds
 
+    def update(self, t, get_sample, total_sims):
+        updated = self.distance.update(t=t, get_sample=get_sample,
+                                       total_sims=total_sims)
+        particles = get_sample().accepted_particles
+        weights = np.zeros(len(self.models))
+        for particle in particles:
+            weights[particle.m] += particle.weight
+        probabilities = weights / weights.sum()
+        simulations, seconds = self.costs()
 
-def simulate_10(params):
-    params['deme_carrying_capacity'] = 10
-    return simulate_abc(params)
+        alive = [m for m in range(len(self.models))
+                 if m not in self.kernel.stopped]
+        best = max(alive, key=lambda m: probabilities[m])
+        for m in alive:
+            if m != best and probabilities[m] < self.min_probability:
+                self.kernel.stopped.add(m)
+                print(f"Generation {t - 1}: stopped "
+                      f"{self.models[m].__name__}, probability "
+                      f"{probabilities[m]:.3g} below {self.min_probability}")
+        for m, model in enumerate(self.models):
+            self.generations.append({
+                "t": t - 1,
+                "model": model.__name__,
+                "probability": probabilities[m],
+                "simulations": int(simulations[m]),
+                "seconds": seconds[m],
+                "stopped": m in self.kernel.stopped,
+            })
+        print(f"Generation {t - 1}: " + ", ".join(
+            f"{model.__name__} p={probabilities[m]:.3f} "
+            f"{int(simulations[m])} sims {seconds[m]:.0f} s"
+            + (" (stopped)" if m in self.kernel.stopped else "")
+            for m, model in enumerate(self.models)))
+        return updated
 
 
-def simulate_100(params):
-    params['deme_carrying_capacity'] = 100
-    return simulate_abc(params)
+def cost_aware_selection(models, distance, min_probability=0.01,
+                         probability_to_stay=None, runtime_log=None):
+    """
+    Set up a model selection run that stops proposing collapsed models.
+    Args:
+        models: FixedParameters models, see model_family
+        distance: distance function or pyabc.Distance, e.g. total_distance
+        min_probability: probability below which a model is stopped
+        probability_to_stay: see pyabc.ModelPerturbationKernel
+        runtime_log: RuntimeLog or its path (default: $METHABC_RUNTIME_LOG)
+    Returns:
+        distance and model perturbation kernel to pass to pyabc.ABCSMC
+    """
+    kernel = StoppingKernel(len(models), probability_to_stay)
+    return ModelSelectionDistance(distance, models, kernel, min_probability,
+                                  runtime_log), kernel
 
 
-def simulate_1000(params):
-    params['deme_carrying_capacity'] = 1000
-    return simulate_abc(params)
+def report_model_costs(distance, history):
+    """
+    Print the simulations, simulator time and final posterior probability
+    of every model of a run set up by cost_aware_selection.
+    """
+    # simulations of the last generation, not yet read by update
+    simulations, seconds = distance.costs()
+    for row in distance.generations:
+        m = [model.__name__ for model in distance.models].index(row["model"])
+        simulations[m] += row["simulations"]
+        seconds[m] += row["seconds"]
+    probabilities = history.get_model_probabilities().iloc[-1]
+    spent = seconds.sum()
+    print(f"{'model':<32} {'sims':>7} {'sim s':>9} {'share':>6} "
+          f"{'p':>6}  stopped")
+    for m, model in enumerate(distance.models):
+        stopped = [row["t"] for row in distance.generations
+                   if row["model"] == model.__name__ and row["stopped"]]
+        print(f"{model.__name__:<32} {simulations[m]:>7.0f} "
+              f"{seconds[m]:>9.0f} {seconds[m] / spent if spent else 0:>6.0%} "
+              f"{probabilities.get(m, 0):>6.3f}  "
+              f"{'after t=' + str(stopped[0]) if stopped else ''}")
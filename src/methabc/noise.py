@@ -0,0 +1,153 @@
+import numpy as np
+
+from .tumour import TumourSummary, compact
+
+
+class BetaNoise:
+    """
+    Add scale * Beta(a, b) noise to every site.
+
+    Args:
+        a, b: shape parameters of the Beta distribution
+        scale: factor applied to the draws
+        clip: clip the result to [0, 1]
+    """
+
+    def __init__(self, a=2, b=2, scale=0.01, clip=False):
+        self.a = a
+        self.b = b
+        self.scale = scale
+        self.clip = clip
+
+    def __call__(self, arrays, rng):
+        res = arrays + self.scale * rng.beta(self.a, self.b,
+                                             size=arrays.shape)
+        return np.clip(res, 0, 1, out=res) if self.clip else res
+
+
+class GaussianNoise:
+    """
+    Add N(0, sd^2) noise to every site and clip the result to [0, 1].
+
+    Args:
+        sd: standard deviation of the noise
+    """
+
+    def __init__(self, sd=0.01):
+        self.sd = sd
+
+    def __call__(self, arrays, rng):
+        res = arrays + rng.normal(0, self.sd, size=arrays.shape)
+        return np.clip(res, 0, 1, out=res)
+
+
+class PlatformBias:
+    """
+    Shift every site by a bias shared by all demes and all particles, as a
+    measurement platform would, and clip the result to [0, 1].
+
+    Args:
+        bias: bias of every fCpG site; if None, drawn once from N(0, sd^2)
+            with the given seed, so that every worker uses the same bias
+        sd: standard deviation of the drawn bias
+        seed: seed of the drawn bias
+    """
+
+    def __init__(self, bias=None, sd=0.02, seed=0):
+        self.bias = None if bias is None else np.asarray(bias, dtype=float)
+        self.sd = sd
+        self.seed = seed
+        self._drawn = {}
+
+    def site_bias(self, num_sites):
+        """
+        Return the bias of every site of arrays with num_sites fCpG sites.
+        """
+        if self.bias is not None:
+            if len(self.bias) != num_sites:
+                raise ValueError(f"Bias given for {len(self.bias)} sites, "
+                                 f"arrays have {num_sites}")
+            return self.bias
+        if num_sites not in self._drawn:
+            self._drawn[num_sites] = np.random.default_rng(self.seed).normal(
+                0, self.sd, size=num_sites)
+        return self._drawn[num_sites]
+
+    def __call__(self, arrays, rng):
+        res = arrays + self.site_bias(arrays.shape[-1])
+        return np.clip(res, 0, 1, out=res)
+
+
+class ComposedNoise:
+    """
+    Apply several noise stages in turn, e.g. a platform bias followed by
+    per-site Gaussian noise.
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def __call__(self, arrays, rng):
+        for stage in self.stages:
+            arrays = stage(arrays, rng)
+        return arrays
+
+
+def add_noise(tumour, noise, rng=None):
+    """
+    Return a copy of a simulated tumour with noise added to its whole
+    (demes, fCpGs) block. The simulator output is never changed in place.
+    Noise is added to beta values, so compacted tumours other than float32
+    ones are refused: quantising the result would erase most of the noise.
+    Args:
+        tumour: SimulatedTumour with float arrays, or None for a failed
+            simulation
+        noise: noise stage, e.g. BetaNoise()
+        rng: numpy.random.Generator; None draws fresh entropy
+    Returns:
+        SimulatedTumour with arrays of the original dtype, or None
+    """
+    if tumour is None:
+        return None
+    if isinstance(tumour, TumourSummary) or \
+            not np.issubdtype(tumour.arrays.dtype, np.floating):
+        raise ValueError("Noise must be added before the simulation is "
+                         "compacted to uint16, summary or counts storage; "
+                         "pass the storage to NoisyModel instead")
+    if rng is None:
+        rng = np.random.default_rng()
+    arrays = noise(tumour.arrays, rng)
+    return tumour.replace_arrays(arrays.astype(tumour.arrays.dtype,
+                                               copy=False))
+
+
+class NoisyModel:
+    """
+    pyabc model adding measurement noise to the output of another model,
+    e.g. simulate_abc or log_model_abc.
+
+    Args:
+        model: model function returning {"data": SimulatedTumour or None}
+            at full precision
+        noise: noise stage, e.g. ComposedNoise(PlatformBias(), BetaNoise())
+        seed: None draws fresh noise for every particle; an integer seeds
+            the noise of every particle from the seed and its parameters,
+            so that the noise is reproducible
+        storage: payload stored in the pyabc history, see compact; the
+            noisy arrays are compacted, not the simulator output
+    """
+
+    def __init__(self, model, noise, seed=None, storage="full"):
+        self.model = model
+        self.noise = noise
+        self.seed = seed
+        self.storage = storage
+
+    def __call__(self, params):
+        res = self.model(params)
+        rng = None
+        if self.seed is not None:
+            from .simulate import params_seed
+            rng = np.random.default_rng([self.seed, params_seed(params)])
+        noisy = add_noise(res["data"], self.noise, rng)
+        return {**res, "data": compact(noisy, self.storage)}
@@ -0,0 +1,225 @@
+import copy
+import logging
+
+import numpy as np
+import pyabc
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+
+class Surrogate:
+    """
+    Nearest-neighbour regression of the distance on the parameters. A
+    proposal is predicted to be far from the observation when even the
+    closest distance among its neighbours exceeds the threshold.
+
+    Args:
+        k: number of neighbours
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.tree = None
+        self.distances = None
+        self.offset = None
+        self.scale = None
+
+    def fit(self, params, distances):
+        """
+        Fit the surrogate to parameters of shape (samples, parameters) and
+        their distances.
+        """
+        self.offset = params.min(axis=0)
+        self.scale = np.ptp(params, axis=0)
+        self.scale[self.scale == 0] = 1
+        self.tree = cKDTree((params - self.offset) / self.scale)
+        self.distances = distances
+
+    def lower_bound(self, params):
+        """
+        Smallest distance among the neighbours of a parameter vector.
+        """
+        k = min(self.k, len(self.distances))
+        _, index = self.tree.query((params - self.offset) / self.scale, k=k)
+        return np.min(self.distances[index])
+
+
+class PrefilteredModel(pyabc.Model):
+    """
+    Delayed-acceptance model: proposals that a surrogate confidently
+    predicts to be rejected are not simulated. A random fraction of them is
+    simulated anyway, and such particles are weighted by 1 / explore when
+    accepted, so that every parameter keeps its acceptance probability in
+    expectation and the posterior is unchanged.
+
+    The surrogate is trained between generations by PrefilterDistance,
+    which must be the distance of the same run; see delayed_acceptance.
+    Only the default uniform acceptor is supported.
+
+    Args:
+        model: model function, e.g. simulate_abc
+        explore: probability of simulating a screened-out proposal anyway
+        margin: proposals are screened out if the surrogate lower bound
+            exceeds margin times the current epsilon
+        k: neighbours of the surrogate
+        min_train: number of simulations needed before screening starts
+        max_train: number of most recent simulations to train on
+    """
+
+    def __init__(self, model, explore=0.1, margin=1.2, k=10, min_train=200,
+                 max_train=20000, name=None):
+        super().__init__(name or getattr(model, "__name__", "model"))
+        self.model = model
+        self.explore = explore
+        self.margin = margin
+        self.min_train = min_train
+        self.max_train = max_train
+        self.surrogate = Surrogate(k=k)
+        self.names = None
+        self.params = None
+        self.distances = None
+        self.trained = False
+        # simulations saved per generation, filled in by PrefilterDistance
+        self.saved = {}
+
+    def sample(self, pars):
+        return self.model(pars)
+
+    def train(self, params, distances):
+        """
+        Add simulated (parameter, distance) pairs and refit the surrogate.
+        Args:
+            params: list of parameter dicts
+            distances: distance of every parameter dict
+        """
+        if not params:
+            return
+        if self.names is None:
+            self.names = sorted(params[0])
+        rows = np.array([[p[name] for name in self.names] for p in params],
+                        dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        if self.params is not None:
+            rows = np.vstack([self.params, rows])[-self.max_train:]
+            distances = np.concatenate([self.distances,
+                                        distances])[-self.max_train:]
+        self.params, self.distances = rows, distances
+        if len(self.distances) >= self.min_train:
+            self.surrogate.fit(self.params, self.distances)
+            self.trained = True
+
+    def reset(self):
+        """
+        Forget the training data, e.g. after the distance changed.
+        """
+        self.params = self.distances = None
+        self.trained = False
+
+    def screen(self, pars, eps):
+        """
+        Tell whether a proposal is confidently predicted to be rejected.
+        """
+        if not self.trained or not np.isfinite(eps):
+            return False
+        row = np.array([pars[name] for name in self.names], dtype=float)
+        return self.surrogate.lower_bound(row) > self.margin * eps
+
+    def accept(self, t, pars, sum_stat_calculator, distance_calculator,
+               eps_calculator, acceptor, x_0):
+        weight = 1.0
+        if self.screen(pars, eps_calculator(t)):
+            if np.random.uniform() >= self.explore:
+                # rejected without simulating, marked by empty statistics
+                return pyabc.ModelResult(accepted=False, distance=np.inf)
+            weight = 1 / self.explore
+        result = super().accept(t, pars, sum_stat_calculator,
+                                distance_calculator, eps_calculator, acceptor,
+                                x_0)
+        result.weight *= weight
+        return result
+
+
+class PrefilterDistance(pyabc.Distance):
+    """
+    Wrapper around the distance of a run with a PrefilteredModel. Between
+    generations it trains the surrogate of the model on every simulated
+    particle, accepted or rejected, and reports the simulations saved.
+
+    Args:
+        distance: distance function or pyabc.Distance, e.g. total_distance
+        model: PrefilteredModel of the run
+    """
+
+    def __init__(self, distance, model):
+        super().__init__()
+        self.distance = pyabc.distance.FunctionDistance.to_distance(distance)
+        self.model = model
+        self.x_0 = None
+
+    def __call__(self, x, x_0, t=None, par=None):
+        return self.distance(x, x_0, t, par)
+
+    def requires_calibration(self):
+        return self.distance.requires_calibration()
+
+    def is_adaptive(self):
+        return self.distance.is_adaptive()
+
+    def _get_simulated(self, get_sample):
+        """
+        Wrap get_sample to leave out the proposals screened out without
+        simulating, which have no statistics for the wrapped distance.
+        """
+        def get_simulated():
+            sample = copy.copy(get_sample())
+            sample.rejected_particles = [p for p in sample.rejected_particles
+                                         if p.sum_stat]
+            return sample
+        return get_simulated
+
+    def initialize(self, t, get_sample, x_0, total_sims):
+        self.x_0 = x_0
+        self.distance.initialize(t=t,
+                                 get_sample=self._get_simulated(get_sample),
+                                 x_0=x_0, total_sims=total_sims)
+
+    def configure_sampler(self, sampler):
+        self.distance.configure_sampler(sampler)
+        # rejected particles are training data for the surrogate
+        sampler.sample_factory.record_rejected()
+
+    def update(self, t, get_sample, total_sims):
+        updated = self.distance.update(
+            t=t, get_sample=self._get_simulated(get_sample),
+            total_sims=total_sims)
+        sample = get_sample()
+        simulated = [p for p in sample.all_particles if p.sum_stat]
+        if updated:
+            # earlier distances are not comparable any more
+            self.model.reset()
+            distances = [self.distance(p.sum_stat, self.x_0, t, p.parameter)
+                         for p in simulated]
+        else:
+            distances = [p.distance for p in simulated]
+        self.model.train([p.parameter for p in simulated], distances)
+
+        proposals = len(sample.all_particles)
+        self.model.saved[t - 1] = proposals - len(simulated)
+        logger.info(f"Generation {t - 1}: {self.model.saved[t - 1]} of "
+                    f"{proposals} proposals screened out without simulating")
+        return updated
+
+
+def delayed_acceptance(model, distance, **kwargs):
+    """
+    Wrap the model and distance of a run for delayed acceptance.
+    Args:
+        model: model function, e.g. simulate_abc
+        distance: distance function or pyabc.Distance, e.g. total_distance
+        **kwargs: passed to PrefilteredModel
+    Returns:
+        model and distance to pass to pyabc.ABCSMC
+    """
+    model = PrefilteredModel(model, **kwargs)
+    return model, PrefilterDistance(distance, model)
@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pyabc
+from pyabc.transition import MultivariateNormalTransition
+from pyabc.transition.multivariatenormal import silverman_rule_of_thumb
+
+logger = logging.getLogger(__name__)
+
+# journal entries claimed for replay in this process, by parameters; filled
+# when a proposal is drawn and emptied when the proposal is evaluated
+_replayed = {}
+
+
+def _key(params):
+    return tuple(sorted((key, float(value)) for key, value in params.items()))
+
+
+def _dump(path, entry):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _load(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+class Journal:
+    """
+    Directory holding every proposal of the generation in progress, and the
+    simulation of every proposal that finished, so that a resumed run can
+    replay the proposals of an interrupted generation instead of drawing new
+    ones, and reuse their simulations. Proposals are replayed in the order
+    they started in, finished or not, as pyabc's samplers order particles by
+    start index: replaying only the finished ones would favour parameters
+    that simulate fast. Entries are written and claimed by atomic renames,
+    so all workers of a run can share the directory; entries of finished
+    generations are removed as the next generation starts.
+
+    Args:
+        directory: journal directory, e.g. next to the history database
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # entries of other sessions are from interrupted runs
+        self.session = uuid.uuid4().hex[:12]
+        self.resume_t = None
+        self._pruned_t = None
+        self._pending = None
+        self._pid = None
+
+    def _entries(self, suffix=".start"):
+        for name in os.listdir(self.directory):
+            if name.endswith(suffix):
+                t, session, _ = name.split("_", 2)
+                yield int(t), session, os.path.join(self.directory, name)
+
+    def start(self, t, params, started=None):
+        """
+        Add a proposal of generation t as its evaluation starts.
+        Args:
+            t: generation
+            params: proposed parameters
+            started: start time in ns, of the interrupted run for replayed
+                proposals (default: now)
+        Returns:
+            path of the entry without suffix, see record
+        """
+        if self._pruned_t != t:
+            self.prune(t)
+            self._pruned_t = t
+        started = time.time_ns() if started is None else started
+        # names sort by start time within a generation
+        base = os.path.join(self.directory, f"{t}_{self.session}_"
+                                            f"{started:020d}_{uuid.uuid4().hex}")
+        _dump(base + ".start", {"t": t, "params": dict(params),
+                                "started": started})
+        return base
+
+    def record(self, base, sum_stat, weight, seconds):
+        """
+        Add the simulation of a started proposal.
+        Args:
+            base: entry returned by start
+            sum_stat: summary statistics the model returned
+            weight: model weight of the particle, see pyabc.ModelResult
+            seconds: wall time of the simulation
+        """
+        _dump(base + ".pkl", {"sum_stat": sum_stat, "weight": weight,
+                              "seconds": seconds})
+
+    def prune(self, t):
+        """
+        Remove the entries of generations before t.
+        """
+        for suffix in (".start", ".pkl", ".claimed"):
+            for entry_t, _, path in self._entries(suffix):
+                if entry_t < t:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def clear(self):
+        """
+        Remove every entry, e.g. when a new run starts.
+        """
+        self.prune(np.inf)
+        try:
+            os.remove(os.path.join(self.directory, "reused.jsonl"))
+        except FileNotFoundError:
+            pass
+
+    def resume(self, t):
+        """
+        Make the proposals of generation t recorded by earlier sessions
+        available for replay, and remove all others.
+        Returns:
+            number of proposals available, how many of them finished, and
+            the simulator time of those in seconds
+        """
+        self.prune(t)
+        self.resume_t = t
+        for suffix in (".start", ".pkl", ".claimed"):
+            for entry_t, _, path in self._entries(suffix):
+                if entry_t > t:
+                    os.remove(path)
+        # claimed by a session interrupted before it could evaluate them
+        for _, _, path in self._entries(".claimed"):
+            os.replace(path, path[:-len(".claimed")] + ".start")
+        proposals = 0
+        seconds = []
+        for _, _, path in self._entries():
+            proposals += 1
+            result = path[:-len(".start")] + ".pkl"
+            if os.path.exists(result):
+                seconds.append(_load(result)["seconds"])
+        return proposals, len(seconds), float(np.sum(seconds))
+
+    def claim(self):
+        """
+        Claim the earliest started unclaimed proposal of the resumed
+        generation for replay in this process, or return None if there is
+        none left. The entry holds the stored simulation if it finished.
+        """
+        if self.resume_t is None:
+            return None
+        if self._pid != os.getpid():
+            self._pending = sorted(
+                (path for t, session, path in self._entries()
+                 if t == self.resume_t and session != self.session),
+                key=lambda path: os.path.basename(path).split("_", 2)[2],
+                reverse=True)
+            self._pid = os.getpid()
+        while self._pending:
+            path = self._pending.pop()
+            base = path[:-len(".start")]
+            try:
+                os.rename(path, base + ".claimed")
+            except FileNotFoundError:
+                continue  # claimed by another process
+            entry = _load(base + ".claimed")
+            entry["claimed"] = [base + ".claimed"]
+            if os.path.exists(base + ".pkl"):
+                entry.update(_load(base + ".pkl"))
+                entry["claimed"].append(base + ".pkl")
+                _append(os.path.join(self.directory, "reused.jsonl"),
+                        {"session": self.session,
+                         "seconds": entry["seconds"]})
+            _replayed[_key(entry["params"])] = entry
+            return entry
+        return None
+
+    def reused(self):
+        """
+        Number of simulations replayed in this session, and the simulator
+        time in seconds they saved.
+        """
+        try:
+            with open(os.path.join(self.directory, "reused.jsonl")) as file:
+                seconds = [e["seconds"] for e in map(json.loads, file)
+                           if e["session"] == self.session]
+        except FileNotFoundError:
+            seconds = []
+        return len(seconds), float(np.sum(seconds))
+
+
+def _append(path, record):
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+    finally:
+        os.close(fd)
+
+
+class _Stored(pyabc.Model):
+    def __init__(self, sum_stat):
+        super().__init__("stored")
+        self.sum_stat = sum_stat
+
+    def sample(self, pars):
+        return self.sum_stat
+
+
+class JournalModel(pyabc.Model):
+    """
+    Model recording every proposal and simulation in a Journal, and
+    evaluating replayed proposals that finished before the interruption on
+    their stored summary statistics instead of simulating them. Replayed
+    proposals are journaled again with their original start time, so that a
+    run interrupted twice still replays them in order. Distances and
+    acceptance are computed anew, with the distance and epsilon of the
+    resumed run.
+
+    Args:
+        model: model function or pyabc.Model, e.g. simulate_abc or a
+            PrefilteredModel
+        journal: Journal of the run
+    """
+
+    def __init__(self, model, journal, name=None):
+        model = pyabc.model.FunctionModel.to_model(model)
+        super().__init__(name or model.name)
+        self.model = model
+        self.journal = journal
+
+    def sample(self, pars):
+        return self.model.sample(pars)
+
+    def summary_statistics(self, t, pars, sum_stat_calculator):
+        entry = _replayed.pop(_key(pars), None)
+        if entry is not None and "sum_stat" in entry:
+            return _Stored(entry["sum_stat"]).summary_statistics(
+                t, pars, sum_stat_calculator)
+        return self.model.summary_statistics(t, pars, sum_stat_calculator)
+
+    def accept(self, t, pars, sum_stat_calculator, distance_calculator,
+               eps_calculator, acceptor, x_0):
+        entry = _replayed.pop(_key(pars), {})
+        base = self.journal.start(t, pars, entry.get("started"))
+        for path in entry.get("claimed", []):
+            os.remove(path)
+        if "sum_stat" in entry:
+            result = _Stored(entry["sum_stat"]).accept(
+                t, pars, sum_stat_calculator, distance_calculator,
+                eps_calculator, acceptor, x_0)
+            result.weight *= entry["weight"]
+            self.journal.record(base, entry["sum_stat"], entry["weight"],
+                                entry["seconds"])
+            return result
+        start = time.time()
+        result = self.model.accept(t, pars, sum_stat_calculator,
+                                   distance_calculator, eps_calculator,
+                                   acceptor, x_0)
+        # proposals screened out without simulating have no statistics, and
+        # are screened again when replayed
+        if result.sum_stat:
+            self.journal.record(base, result.sum_stat, result.weight,
+                                time.time() - start)
+        return result
+
+
+class ReplayPrior(pyabc.Distribution):
+    """
+    Prior drawing the proposals of an interrupted first generation from a
+    Journal, in the order they started, before drawing new samples.
+    Densities are those of the prior.
+
+    Args:
+        journal: Journal of the run
+        **random_variables: the prior, as for pyabc.Distribution
+    """
+
+    def __init__(self, journal, **random_variables):
+        super().__init__(**random_variables)
+        self.journal = journal
+
+    def copy(self):
+        return self.__class__(
+            self.journal, **{key: value.copy() for key, value in self.items()})
+
+    def rvs(self, *args, **kwargs):
+        if self.journal.resume_t == 0:
+            entry = self.journal.claim()
+            if entry is not None:
+                return pyabc.Parameter(entry["params"])
+        return super().rvs(*args, **kwargs)
+
+
+class ReplayTransition(MultivariateNormalTransition):
+    """
+    Multivariate normal transition proposing the proposals of an
+    interrupted later generation from a Journal, in the order they started,
+    before drawing new samples. The transition of the resumed generation is
+    fitted to the same population as the interrupted one, and the replayed
+    proposals are the first ones it drew, finished or not, so they are not
+    biased towards parameters that simulate fast.
+
+    Args:
+        journal: Journal of the run
+        as for MultivariateNormalTransition otherwise
+    """
+
+    def __init__(self, journal=None, scaling=1,
+                 bandwidth_selector=silverman_rule_of_thumb):
+        super().__init__(scaling=scaling,
+                         bandwidth_selector=bandwidth_selector)
+        self.journal = journal
+
+    def rvs_single(self):
+        if self.journal is not None and self.journal.resume_t:
+            entry = self.journal.claim()
+            if entry is not None:
+                return pyabc.Parameter(entry["params"])
+        return super().rvs_single()
+
+
+def start_or_resume(abc, db, observed_sum_stat, meta_info=None, resume=False,
+                    journal=None):
+    """
+    Start a new run in a history database, or reattach to the run stored in
+    it. Resumed runs continue after the last finished generation, with the
+    distance, epsilon and transition initialised from it, and replay the
+    proposals of the interrupted generation recorded in the journal.
+    Args:
+        abc: pyabc.ABCSMC, built with the JournalModel, ReplayPrior and
+            ReplayTransition of the journal if one is given
+        db: path of the history database
+        observed_sum_stat: observed summary statistics
+        meta_info: meta information of a new run
+        resume: reattach to the last run in db, if there is one
+        journal: Journal of the run, or None
+    Returns:
+        t0: generation the run starts with
+    """
+    if resume and os.path.exists(db):
+        history = pyabc.History("sqlite:///" + db)
+        if history.id is not None and history.max_t is not None:
+            abc.load("sqlite:///" + db, abc_id=history.id,
+                     observed_sum_stat=observed_sum_stat)
+            t0 = history.max_t + 1
+            populations = history.get_all_populations()
+            elapsed = (populations.population_end_time.max()
+                       - history.get_abc().start_time).total_seconds()
+            print(f"Resuming run {history.id} at generation {t0}: kept "
+                  f"{populations.samples.sum()} simulations ({elapsed:.0f} s "
+                  f"of run time) from the history")
+        else:
+            # interrupted before its first population was stored
+            abc.new(db="sqlite:///" + db, observed_sum_stat=observed_sum_stat,
+                    meta_info=meta_info or {})
+            t0 = 0
+            print(f"No population stored in {db}, restarting at generation 0")
+        if journal is not None:
+            proposals, simulated, seconds = journal.resume(t0)
+            print(f"{proposals} proposals of the interrupted generation {t0} "
+                  f"will be replayed in start order, reusing {simulated} "
+                  f"simulations ({seconds:.0f} s of simulator time)")
+        return t0
+    if journal is not None:
+        journal.clear()
+    abc.new(db="sqlite:///" + db, observed_sum_stat=observed_sum_stat,
+            meta_info=meta_info or {})
+    return 0
+
+
+def finished(db, t0, max_populations):
+    """
+    Tell whether a resumed run already has max_populations generations, in
+    which case pyabc would still sample another one, and report its history
+    if so.
+    """
+    if t0 < max_populations:
+        return False
+    history = pyabc.History("sqlite:///" + db)
+    populations = history.get_all_populations()
+    last = populations[populations.t == history.max_t].iloc[0]
+    print(f"Run {history.id} in {db} already has {t0} generations "
+          f"(--max-populations {max_populations}): {populations.samples.sum()} "
+          f"simulations, final epsilon {last.epsilon:.4g}. Nothing to resume")
+    return True
+
+
+def report_resume(journal):
+    """
+    Print the simulator time saved by replaying journaled simulations.
+    """
+    count, seconds = journal.reused()
+    if count:
+        print(f"Reused {count} simulations of the interrupted generation, "
+              f"saving {seconds:.0f} s of simulator time")
@@ -0,0 +1,432 @@
+import logging
+import os
+import time
+from argparse import ArgumentParser
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyabc
+from pyabc.sampler import MulticoreEvalParallelSampler, RedisEvalParallelSampler
+
+from .cohort import (ReferenceDistance, ReferenceModel, ReferenceTable,
+                     TablePrior)
+from .counts import import_counts
+from .distance import allele_count_distance, total_distance
+from .prefilter import delayed_acceptance
+from .resume import (Journal, JournalModel, ReplayPrior, ReplayTransition,
+                     finished, report_resume, start_or_resume)
+from .runtime import (SIMULATOR_STATUSES, RuntimeLog, RuntimePredictor,
+                      get_runtime_log, lpt_order, makespan)
+from .simulate import (limit_simulations, log_model_abc, set_simulation_budget,
+                       simulate_abc)
+from .timing import CALIBRATION, TimedModel, TimingLog
+from .tumour import STORAGE
+from .utils import OUTPUT_PROFILES, import_data
+
+SAMPLERS = ("pool", "throttled-pool", "redis")
+
+MODELS = {
+    "simulate": simulate_abc,
+    "log": log_model_abc,
+}
+
+DISTANCES = {
+    "total": total_distance,
+    "counts": allele_count_distance,
+}
+
+PRIORS = {
+    "simulate": {
+        'init_migration_rate': (0.0005, 0.1),
+        'mu_driver_birth': (0, 0.01),
+        's_driver_birth': (0, .2),
+        'meth_rate': (0, 0.1),
+        'demeth_rate': (0, 0.1)
+    },
+    "log": {
+        'meth_rate': (-4, -2),
+        'demeth_rate': (-4, -2),
+        'init_migration_rate': (-3.3, -1),
+        'mu_driver_birth': (-5, -2),
+        's_driver_birth': (0, .2),
+    },
+}
+
+
+def setup_logging(level=logging.INFO):
+    """
+    Print the log messages of methabc in the format of pyabc's, which
+    configures its own logger.
+    """
+    logger = logging.getLogger("methabc")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(
+            logging.Formatter("%(name)s %(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def add_sampler_arguments(parser, default="pool", port=2166,
+                          runtime_log="tmp/runtimes.jsonl"):
+    """
+    Add the sampler selection arguments to an ArgumentParser.
+    Args:
+        parser: the ArgumentParser of a run script
+        default: sampler used if --sampler is not given
+        port: default port of the Redis server
+        runtime_log: runtime log used if --runtime-log is not given
+    """
+    parser.add_argument("--sampler", choices=SAMPLERS, default=default,
+                        help="local process pool, a pool that also caps "
+                             "concurrent methdemon runs, or Redis workers")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes for the pool samplers "
+                             "(default: cores, or twice the cores when "
+                             "throttled)")
+    parser.add_argument("--max-simulations", type=int, default=None,
+                        help="concurrent methdemon runs for throttled-pool "
+                             "(default: cores)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds after which a simulation is killed "
+                             "and rejected")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="memory limit of a simulation in MB")
+    parser.add_argument("--runtime-log", type=str, default=runtime_log,
+                        help="record the wall time of every simulation, "
+                             "cache hits and early rejections in this file, "
+                             "summed up at the end of the run (default: "
+                             "%(default)s; Redis workers: set "
+                             "$METHABC_RUNTIME_LOG)")
+    parser.add_argument("--adaptive-timeout", action="store_true",
+                        help="size the timeout of every simulation from "
+                             "the runtimes in --runtime-log, capped at "
+                             "--timeout")
+    parser.add_argument("--simulator", type=str, default=None,
+                        help="command running the simulator instead of "
+                             "the methdemon submodule, e.g. "
+                             "methdemon-standin (Redis workers: set "
+                             "$METHABC_MODEL)")
+    parser.add_argument("--output-profile", choices=OUTPUT_PROFILES,
+                        default=None,
+                        help="simulator outputs: lean (default) writes only "
+                             "the demes, or streams them to stdout if the "
+                             "simulator can; full as in the config template "
+                             "(Redis workers: set $METHABC_OUTPUT_PROFILE)")
+    parser.add_argument("--seed", choices=("random", "params"),
+                        default="random",
+                        help="simulator seed: drawn at random, or derived "
+                             "from the parameters so that the same draw "
+                             "always gives the same simulation (Redis "
+                             "workers: set $METHABC_SEED)")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="reuse simulator outputs stored in this "
+                             "directory, e.g. when re-running after a crash "
+                             "or comparing distances on the same draws; "
+                             "needs --seed params (Redis workers: set "
+                             "$METHABC_CACHE)")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="Redis server host")
+    parser.add_argument("--port", type=int, default=port,
+                        help="Redis server port")
+
+
+def add_resume_arguments(parser):
+    """
+    Add the arguments resuming an interrupted run to an ArgumentParser.
+    """
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last run in the history database "
+                             "after its last finished generation, instead "
+                             "of starting a new run")
+    parser.add_argument("--journal", action="store_true",
+                        help="keep every proposal and simulation of the "
+                             "generation in progress in <db>.journal, so "
+                             "that --resume replays them (Redis workers "
+                             "must share the directory)")
+
+
+def resumable(model, prior, db, args):
+    """
+    Wrap the model and prior of a run to record its simulations in the
+    journal selected by add_resume_arguments, and build the matching
+    transition.
+    Returns:
+        model, prior, transition, journal; journal and transition are None
+        without --journal
+    """
+    if not args.journal:
+        return model, prior, None, None
+    journal = Journal(db + ".journal")
+    if type(prior) is pyabc.Distribution:
+        prior = ReplayPrior(journal, **prior)
+    return (JournalModel(model, journal), prior, ReplayTransition(journal),
+            journal)
+
+
+def make_sampler(args):
+    """
+    Build the pyabc sampler selected by add_sampler_arguments.
+
+    The pool samplers fork their workers, so observed data and compiled
+    distance structures loaded before sampling are inherited rather than
+    pickled. Redis workers receive compiled observations as a reference to
+    their data file and load them once per worker process; they take their
+    simulation budget from $METHABC_TIMEOUT and $METHABC_MAX_MEMORY.
+    """
+    # inherited by the forked pool workers
+    if args.runtime_log:
+        os.environ["METHABC_RUNTIME_LOG"] = args.runtime_log
+    if args.simulator:
+        os.environ["METHABC_MODEL"] = args.simulator
+    if args.output_profile:
+        os.environ["METHABC_OUTPUT_PROFILE"] = args.output_profile
+    if args.seed == "params":
+        os.environ["METHABC_SEED"] = "params"
+    if args.cache:
+        if args.seed != "params":
+            print("--cache is ignored without --seed params: simulations "
+                  "with random seeds never recur")
+        os.environ["METHABC_CACHE"] = args.cache
+    predictor = None
+    if args.adaptive_timeout:
+        predictor = fit_runtime_predictor(args.runtime_log)
+    if (args.timeout is not None or args.max_memory is not None
+            or predictor is not None):
+        set_simulation_budget(
+            timeout=args.timeout,
+            max_memory=args.max_memory * 2**20 if args.max_memory else None,
+            runtime_predictor=predictor,
+        )
+    if args.sampler == "redis":
+        print("Setting up redis_sampler...")
+        return RedisEvalParallelSampler(host=args.host, port=args.port)
+    cores = os.cpu_count()
+    processes = args.processes
+    if args.sampler == "throttled-pool":
+        # more Python workers than cores, so parsing and distances overlap
+        # with simulations, but never more simulations than cores
+        limit_simulations(args.max_simulations or cores)
+        processes = processes or 2 * cores
+    return MulticoreEvalParallelSampler(n_procs=processes or cores)
+
+
+def fit_runtime_predictor(path, min_simulations=20):
+    """
+    Fit a RuntimePredictor to a runtime log, or return None if the log
+    holds too few completed simulations.
+    """
+    log = RuntimeLog(path) if path else get_runtime_log()
+    if log is None or log.counts()["completed"] < min_simulations:
+        print("Too few recorded simulations to predict runtimes")
+        return None
+    return RuntimePredictor.from_log(log)
+
+
+def report_makespan(history, workers, runtime_log=None):
+    """
+    Print the projected makespan of a further generation: proposals are
+    drawn from the final population and their runtimes predicted from the
+    runtime log, then dispatched to the workers in random and in
+    longest-first order.
+    """
+    predictor = fit_runtime_predictor(runtime_log)
+    if predictor is None:
+        return
+    df, w = history.get_distribution()
+    proposals = df.sample(history.get_all_populations().samples.iloc[-1],
+                          weights=w, replace=True).to_dict("records")
+    runtimes = predictor.predict(proposals)
+    for name, order in (("random", np.random.permutation(len(runtimes))),
+                        ("longest first", lpt_order(runtimes))):
+        span, idle = makespan(runtimes[order], workers)
+        print(f"Projected generation makespan, {name} order: {span:.0f} s, "
+              f"{idle / (workers * span):.0%} idle")
+
+
+def report_throughput(history, start, previous=0):
+    """
+    Print the simulation throughput of a finished run session. The history
+    of a resumed run also counts the simulations of earlier sessions, which
+    are passed as previous and left out.
+    """
+    elapsed = time.time() - start
+    simulations = history.total_nr_simulations - previous
+    print(f"{simulations} simulations in {elapsed:.0f} s: "
+          f"{simulations / elapsed:.2f} particles/s")
+
+
+def report_simulations(runtime_log, start):
+    """
+    Print how the simulations of a run session ended, how many the distance
+    rejected early and the cache hits and misses, summed over all of its
+    workers from the runtime log.
+    Args:
+        runtime_log: RuntimeLog or its path
+        start: start of the session as a Unix timestamp
+    """
+    if isinstance(runtime_log, str):
+        runtime_log = RuntimeLog(runtime_log)
+    counts = runtime_log.counts(since=start)
+    if not counts:
+        print(f"Nothing recorded in {runtime_log.path} during the run "
+              f"(Redis workers: set $METHABC_RUNTIME_LOG)")
+        return
+    print("Simulations: " + ", ".join(
+        f"{counts[status]} {status.replace('_', ' ')}"
+        for status in SIMULATOR_STATUSES))
+    rejections = {status[len("rejected_"):]: count
+                  for status, count in counts.items()
+                  if status.startswith("rejected_")}
+    if rejections:
+        print("Rejected before any distance work: " + ", ".join(
+            f"{count} {reason.replace('_', ' ')}"
+            for reason, count in sorted(rejections.items())))
+    lookups = counts["cache_hit"] + counts["cache_miss"]
+    if lookups:
+        print(f"Simulation cache: {counts['cache_hit']} hits, "
+              f"{counts['cache_miss']} misses "
+              f"({counts['cache_hit'] / lookups:.0%} hit rate)")
+
+
+def report_prefilter(model):
+    """
+    Print the simulations a PrefilteredModel saved in every generation.
+    """
+    saved = model.saved
+    print(f"{sum(saved.values())} simulations saved by the prefilter, per "
+          f"generation: {saved}")
+
+
+def report_timing(path):
+    """
+    Print how the particles of every generation spent their time, by stage
+    of simulate and of the distance, from a TimingLog.
+    """
+    breakdown = TimingLog(path).breakdown().rename(
+        index={CALIBRATION: "calibration"})
+    stages = breakdown.columns.drop(["particles", "workers", "total"])
+    shares = breakdown[stages].div(breakdown["total"], axis=0)
+    print(f"Time per particle by stage, per generation ({path}):")
+    print(pd.concat([
+        breakdown[["particles", "workers"]],
+        (1000 * breakdown["total"] / breakdown["particles"]).rename("ms"),
+        shares.map(lambda x: f"{x:.0%}"),
+    ], axis=1).to_string())
+
+
+def main():
+    parser = ArgumentParser(description="Run ABC-SMC inference on a tumour.")
+    parser.add_argument("-d", "--data_id", type=str, required=True,
+                        help="ID of the data set in the data folder")
+    parser.add_argument("--model", choices=MODELS, default="simulate",
+                        help="linear or log-transformed parameters")
+    parser.add_argument("--population-size", type=int, default=1000)
+    parser.add_argument("--max-populations", type=int, default=25)
+    parser.add_argument("--min-acceptance-rate", type=float, default=0.05)
+    parser.add_argument("--db", type=str, default=None,
+                        help="history database (default: "
+                             "tmp/inference_<data_id>.db)")
+    parser.add_argument("--storage", choices=STORAGE, default="full",
+                        help="simulation payload stored in the history: "
+                             "full arrays, float32 or uint16 arrays, deme "
+                             "matrix and quantiles only, or uint8 allele "
+                             "counts")
+    parser.add_argument("--distance", choices=DISTANCES, default="total",
+                        help="total distance on the beta values, or on "
+                             "allele counts compared with "
+                             "data/individual_distances")
+    parser.add_argument("--reference-table", type=str, default=None,
+                        help="reference table built by run_cohort.py, to "
+                             "draw the first generation from")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="skip simulating proposals that a surrogate "
+                             "trained on earlier generations predicts to be "
+                             "rejected")
+    parser.add_argument("--explore", type=float, default=0.1,
+                        help="fraction of screened-out proposals simulated "
+                             "anyway with --prefilter")
+    parser.add_argument("--timing-log", type=str, default=None,
+                        help="record the time every particle spends in each "
+                             "stage of the simulation and distance in this "
+                             "file, and print a breakdown per generation")
+    add_resume_arguments(parser)
+    add_sampler_arguments(parser)
+    args = parser.parse_args()
+    setup_logging()
+    if args.reference_table and args.model != "simulate":
+        parser.error("reference tables are built with the simulate model")
+    if args.reference_table and args.distance != "total":
+        parser.error("reference tables are built with the total distance")
+    if args.storage == "summary" and args.distance == "counts":
+        parser.error("the allele count distance needs the arrays")
+
+    rvs = {key: pyabc.RV("uniform", a, b - a)
+           for key, (a, b) in PRIORS[args.model].items()}
+    model, distance = MODELS[args.model], DISTANCES[args.distance]
+    if args.storage != "full":
+        model = partial(model, storage=args.storage)
+    if args.reference_table:
+        table = ReferenceTable(args.reference_table)
+        prior = TablePrior(table, **rvs)
+        model = ReferenceModel(model, table, args.data_id)
+        distance = ReferenceDistance(distance)
+    else:
+        prior = pyabc.Distribution(**rvs)
+    if args.prefilter:
+        model, distance = delayed_acceptance(model, distance,
+                                             explore=args.explore)
+        prefiltered = model
+    db = args.db or "tmp/inference_" + args.data_id + ".db"
+    model, prior, transition, journal = resumable(model, prior, db, args)
+    if args.timing_log:
+        model = TimedModel(model, args.timing_log)
+
+    if args.distance == "counts":
+        observation = import_counts("data/individual_distances/"
+                                    "CRC-multi_patient-" + args.data_id
+                                    + ".csv")
+    else:
+        observation = import_data("data/individual/tumour_" + args.data_id
+                                  + ".csv", compiled=True)
+
+    abc = pyabc.ABCSMC(
+        model,
+        prior,
+        distance,
+        population_size=args.population_size,
+        transitions=transition,
+        sampler=make_sampler(args),
+    )
+
+    t0 = start_or_resume(
+        abc, db,
+        observed_sum_stat={"data": observation},
+        meta_info={"initial_dist_matrix": observation.deme_matrix},
+        resume=args.resume,
+        journal=journal,
+    )
+    if finished(db, t0, args.max_populations):
+        return
+
+    previous = abc.history.total_nr_simulations
+    start = time.time()
+    history = abc.run(max_nr_populations=args.max_populations - t0,
+                      minimum_epsilon=0,
+                      min_acceptance_rate=args.min_acceptance_rate)
+    report_throughput(history, start, previous)
+    report_simulations(args.runtime_log, start)
+    if args.runtime_log and args.model == "simulate":
+        workers = args.max_simulations or args.processes or os.cpu_count()
+        report_makespan(history, workers, args.runtime_log)
+    if args.prefilter:
+        report_prefilter(prefiltered)
+    if args.timing_log:
+        report_timing(args.timing_log)
+    if journal is not None:
+        report_resume(journal)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import heapq
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from .utils import load_template
+
+# parameters with the largest effect on methdemon runtime, always part of
+# the predictor; missing values are taken from the config template
+RUNTIME_PARAMETERS = (
+    'deme_carrying_capacity',
+    'init_migration_rate',
+    'mu_driver_birth',
+    's_driver_birth',
+    'meth_rate',
+    'demeth_rate',
+)
+
+# statuses of simulator runs; other entries of a runtime log are events such
+# as cache hits, see RuntimeLog.record_event
+SIMULATOR_STATUSES = ('completed', 'failed', 'timed_out')
+
+
+class RuntimeLog:
+    """
+    Append-only record of the wall time of every simulation against its
+    parameters, one JSON object per line. Lines are written with a single
+    append, so every process of a run can share one file, and the driver of
+    a run can count what happened in all of its workers, see counts.
+
+    Args:
+        path: file to append to
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, params, seconds, status, start=None):
+        """
+        Append one simulation.
+        Args:
+            params: parameters of the simulation
+            seconds: wall time of the simulator
+            status: "completed", "failed" or "timed_out"
+            start: start time as a Unix timestamp
+        """
+        self._append({
+            "params": {key: float(value) for key, value in params.items()},
+            "seconds": seconds,
+            "status": status,
+            "start": start if start is not None else time.time() - seconds,
+            "pid": os.getpid(),
+        })
+
+    def record_event(self, status):
+        """
+        Append an event other than a simulator run, e.g. "cache_hit", to be
+        counted by counts. Events have no parameters or wall time.
+        """
+        self._append({"status": status, "start": time.time(),
+                      "pid": os.getpid()})
+
+    def _append(self, entry):
+        line = json.dumps(entry) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def read(self):
+        """
+        Return every recorded simulation and event as a list of dicts.
+        """
+        try:
+            with open(self.path) as file:
+                return [json.loads(line) for line in file if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def simulations(self):
+        """
+        Return the recorded simulator runs, without other events.
+        """
+        return [entry for entry in self.read()
+                if entry["status"] in SIMULATOR_STATUSES]
+
+    def counts(self, since=None):
+        """
+        Count the simulations and events of every status.
+        Args:
+            since: only count entries started at or after this Unix
+                timestamp, e.g. the start of a run session, as the log may
+                hold earlier runs
+        """
+        return Counter(entry["status"] for entry in self.read()
+                       if since is None or entry["start"] >= since)
+
+
+_runtime_log = None
+
+
+def get_runtime_log():
+    """
+    Return the runtime log configured by $METHABC_RUNTIME_LOG, or None if
+    runtimes are not recorded.
+    """
+    global _runtime_log
+    path = os.environ.get("METHABC_RUNTIME_LOG")
+    if not path:
+        return None
+    if _runtime_log is None or _runtime_log.path != path:
+        _runtime_log = RuntimeLog(path)
+    return _runtime_log
+
+
+class RuntimePredictor:
+    """
+    Log-linear model of simulation wall time: log(seconds) is regressed on
+    the logarithm of every runtime parameter, with normally distributed
+    residuals, so that quantiles of the runtime can size timeouts.
+
+    Args:
+        names: parameters used as predictors
+        config_template_path: template providing values of parameters a
+            simulation did not set
+    """
+
+    def __init__(self, names=RUNTIME_PARAMETERS,
+                 config_template_path="resources/config_template.dat"):
+        self.names = tuple(names)
+        template = load_template(config_template_path)
+        self.defaults = {name: template.value(name) for name in self.names
+                         if name in template.index}
+        self.coef = None
+        self.sigma = None
+
+    def features(self, params):
+        """
+        Feature matrix of a list of parameter dicts.
+        """
+        rows = np.array([[p.get(name, self.defaults.get(name, 0))
+                          for name in self.names] for p in params],
+                        dtype=float)
+        # small offset, since rates can be zero
+        return np.hstack([np.ones((len(rows), 1)),
+                          np.log(np.abs(rows) + 1e-6)])
+
+    def fit(self, params, seconds, ridge=1e-3):
+        """
+        Fit the model to parameter dicts and their wall times in seconds.
+        """
+        x = self.features(params)
+        y = np.log(np.maximum(seconds, 1e-3))
+        penalty = ridge * np.eye(x.shape[1])
+        penalty[0, 0] = 0
+        self.coef = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+        residuals = y - x @ self.coef
+        self.sigma = float(np.sqrt(np.mean(residuals ** 2)))
+        return self
+
+    @classmethod
+    def from_log(cls, log, **kwargs):
+        """
+        Fit the model to the completed simulations of a RuntimeLog. Failed
+        simulations stop early and timed-out ones at their timeout, so both
+        would bias the runtimes down and are left out.
+        """
+        entries = [entry for entry in log.simulations()
+                   if entry["status"] == "completed"]
+        if not entries:
+            raise ValueError(f"No completed simulations recorded in "
+                             f"{log.path}")
+        return cls(**kwargs).fit([e["params"] for e in entries],
+                                 np.array([e["seconds"] for e in entries]))
+
+    def predict(self, params):
+        """
+        Median wall time in seconds of every parameter dict.
+        """
+        return np.exp(self.features(params) @ self.coef)
+
+    def timeout(self, params, z=3, factor=2, minimum=60):
+        """
+        Timeout for a simulation: factor times the runtime quantile z
+        standard deviations above the median, and at least minimum
+        seconds.
+        """
+        quantile = np.exp(self.features([params]) @ self.coef
+                          + z * self.sigma)[0]
+        return max(factor * quantile, minimum)
+
+
+def lpt_order(runtimes):
+    """
+    Longest-processing-time-first order: indices of the runtimes, longest
+    first.
+    """
+    return np.argsort(-np.asarray(runtimes), kind="stable")
+
+
+def makespan(runtimes, workers):
+    """
+    Simulate workers taking jobs in the given order, each starting the next
+    job as soon as it is free.
+    Args:
+        runtimes: run time of every job, in dispatch order
+        workers: number of workers
+    Returns:
+        makespan: time until the last job finishes
+        idle: total time workers wait for the last job, i.e.
+            workers * makespan - sum(runtimes)
+    """
+    finish = [0.0] * workers
+    for runtime in runtimes:
+        heapq.heappush(finish, heapq.heappop(finish) + runtime)
+    span = max(finish)
+    return span, workers * span - float(np.sum(runtimes))
@@ -1,91 +1,451 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
 import os
+import resource
+import shlex
 import subprocess
-import tempfile
+import time
+from collections import Counter
+from contextlib import nullcontext
 
 import numpy as np
-import pandas as pd
 
-from .utils import write_config
+from .cache import default_cache
+from .noise import BetaNoise, NoisyModel
+from .runtime import get_runtime_log
+from .timing import stage
+from .tumour import compact
+from .utils import (parse_final_demes, read_final_demes, render_config,
+                    write_config)
+from .workspace import Workspace, get_workspace
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = "resources/methdemon/bin/methdemon"
+
+_simulation_slots = None
+
+# per-simulation budget, see set_simulation_budget
+_budget = {
+    "timeout": float(os.environ.get("METHABC_TIMEOUT", 0)) or None,
+    "max_memory": int(os.environ.get("METHABC_MAX_MEMORY", 0)) or None,
+    "runtime_predictor": None,
+}
+
+# how often simulations ran, hit the budget or failed in this process
+simulation_counts = Counter()
+
+
+def limit_simulations(max_simulations):
+    """
+    Cap the number of methdemon subprocesses running at once across this
+    process and any worker processes forked after the call.
+    Args:
+        max_simulations: maximum number of concurrent simulations, or None
+            to remove the cap
+    """
+    global _simulation_slots
+    if max_simulations is None:
+        _simulation_slots = None
+    else:
+        _simulation_slots = multiprocessing.BoundedSemaphore(max_simulations)
+
+
+def set_simulation_budget(timeout=None, max_memory=None,
+                          runtime_predictor=None):
+    """
+    Set the wall-clock and memory budget of every simulation in this process
+    and worker processes forked after the call. Redis workers read the
+    defaults from $METHABC_TIMEOUT (seconds) and $METHABC_MAX_MEMORY (bytes).
+    Args:
+        timeout: seconds after which methdemon is killed, or None
+        max_memory: address space limit of methdemon in bytes, or None
+        runtime_predictor: RuntimePredictor sizing the timeout of every
+            simulation from its parameters, capped at timeout, or None
+    """
+    _budget["timeout"] = timeout
+    _budget["max_memory"] = max_memory
+    _budget["runtime_predictor"] = runtime_predictor
+
+
+def _timeout(params):
+    predictor = _budget["runtime_predictor"]
+    if predictor is None:
+        return _budget["timeout"]
+    timeout = predictor.timeout(params)
+    if _budget["timeout"] is not None:
+        timeout = min(timeout, _budget["timeout"])
+    return timeout
+
+
+def model_command():
+    """
+    Command that runs the simulator: $METHABC_MODEL if set, e.g.
+    "python -m methabc.standin" for the stand-in of methabc.standin, else the
+    methdemon binary of the submodule.
+    """
+    return shlex.split(os.environ.get("METHABC_MODEL") or MODEL_PATH)
+
+
+def _memory_limit(max_memory):
+    def preexec():
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    return preexec
+
+
+def params_seed(params):
+    """
+    Derive a simulator seed from the parameters, so that the same parameters
+    always give the same simulation.
+    """
+    items = sorted((key, repr(float(value))) for key, value in params.items())
+    digest = hashlib.sha256(repr(items).encode()).digest()
+    seed = int.from_bytes(digest[:4], "little") % (2**15 - 2) + 1
+    if seed==66:
+        seed += 1
+    return seed
+
+
+def seed_mode():
+    """
+    Seed of simulations not given one: "params" if $METHABC_SEED is set to
+    it, deriving the seed from the parameters (see params_seed), else None,
+    drawing it from np.random.
+    """
+    return "params" if os.environ.get("METHABC_SEED") == "params" else None
+
+
+def _cache_for(seed, cache):
+    """
+    Cache of a simulation with a resolved seed: None for drawn seeds, whose
+    configs never recur, else the given cache or default_cache().
+    """
+    if seed is None:
+        return None
+    return cache if cache is not None else default_cache()
+
+
+def output_profile():
+    """
+    Output profile of the simulations, see OUTPUT_PROFILES:
+    $METHABC_OUTPUT_PROFILE if set, else "lean".
+    """
+    return os.environ.get("METHABC_OUTPUT_PROFILE") or "lean"
+
+
+def _simulator_env(profile):
+    """
+    Environment of the simulator. Lean runs ask it to stream the final
+    demes to stdout, which simulators that do not support it ignore.
+    """
+    if profile == "full":
+        return None
+    return {**os.environ, "METHABC_DEMES_STDOUT": "1"}
+
+
+def _read_output(stdout, config_dir, dtype):
+    """
+    Read the final demes from the simulator's stdout if it streamed them
+    there, else from final_demes.csv.
+    """
+    header = stdout[:stdout.find(b"\n")]
+    if b"AverageArray" in header:
+        with stage("csv_read"):
+            text = stdout.decode()
+        return parse_final_demes(text, dtype=dtype, source="stdout")
+    return read_final_demes(os.path.join(config_dir, "final_demes.csv"),
+                            dtype=dtype)
+
+
+def _render(params, seed, profile):
+    """
+    Render the config of a simulation, drawing or deriving its seed, see
+    simulate.
+    """
+    if seed is None:
+        seed = np.random.randint(2**15 - 2) + 1
+        if seed==66:
+            seed += 1
+    elif seed == "params":
+        seed = params_seed(params)
+
+    with stage("config_write"):
+        return render_config({**params, "seed": seed}, profile=profile)
+
+
+def _record(params, status, start):
+    """
+    Count a finished simulation and add it to the runtime log, if any.
+    """
+    simulation_counts[status] += 1
+    runtime_log = get_runtime_log()
+    if runtime_log is not None:
+        runtime_log.record(params, time.time() - start, status, start)
 
 
 def simulate(
         params,
+        dtype=np.float64,
+        seed=None,
+        cache=None,
+        profile=None,
     ):
     """
     Simulate data using the methdemon model.
     Args:
         params: parameters to use in simulation, drawn from prior
+        dtype: float type of the methylation arrays
+        seed: simulator seed; None uses seed_mode(), "params" derives it
+            from the parameters (see params_seed)
+        cache: SimulationCache to reuse outputs from; None uses the cache
+            configured by $METHABC_CACHE, if any. Simulations with a seed
+            drawn from np.random are never cached
+        profile: output profile, see OUTPUT_PROFILES; None uses
+            output_profile(). Lean runs read the final demes from stdout if
+            the simulator streams them there, else from final_demes.csv
     Returns:
-        df: pd.DataFrame with the final output of the simulation
+        tumour: SimulatedTumour with the final generation of the simulation,
+            see SimulatedTumour.to_dataframe for the dataframe layout, or
+            None if methdemon failed or exceeded its budget (see
+            set_simulation_budget)
     """
-    seed = np.random.randint(2**15 - 2) + 1
-    if seed==66:
-        seed += 1
+    profile = profile or output_profile()
+    seed = seed if seed is not None else seed_mode()
+    config = _render(params, seed, profile)
+    cache = _cache_for(seed, cache)
+    if cache is not None:
+        tumour = cache.get(config)
+        if tumour is not None:
+            return tumour.replace_arrays(tumour.arrays.astype(dtype, copy=False))
 
-    # temporary directory to store the config and outputs
-    tempdir = tempfile.mkdtemp()
-    config_path = write_config(params=params, output_dir=tempdir)
-    model_path = "resources/methdemon/bin/methdemon"
-
-    config_dir, config_name = os.path.split(config_path)
-
-    try:
-        result = subprocess.run(
-            [model_path, config_dir, config_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True  # Forces an exception if the command fails
-        )
-    except subprocess.CalledProcessError as e:
-        print(f"Subprocess failed with: {e.output.decode()}, {e.stderr.decode()}")
-        with open(os.path.join(tempdir, "config.dat"), "r") as f:
-            print(f.read())
-        return None
+    # per-process workspace to store the config and outputs, emptied after
+    # every run
+    workspace = get_workspace()
+    with workspace.run() as run_dir:
+        with stage("config_write"):
+            config_path = write_config(params=params, output_dir=run_dir,
+                                       config=config)
+        config_dir, config_name = os.path.split(config_path)
+
+        max_memory = _budget["max_memory"]
+        timeout = _timeout(params)
+        try:
+            with _simulation_slots or nullcontext():
+                start = time.time()
+                with stage("simulator"):
+                    result = subprocess.run(
+                        [*model_command(), config_dir, config_name],
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        check=True,  # Forces an exception if the command fails
+                        timeout=timeout,  # kills methdemon when hit
+                        preexec_fn=(_memory_limit(max_memory) if max_memory
+                                    else None),
+                        env=_simulator_env(profile),
+                    )
+        except subprocess.TimeoutExpired:
+            _record(params, "timed_out", start)
+            logger.warning(f"Simulation exceeded {timeout:.0f} s and "
+                           f"was killed ({simulation_counts['timed_out']} so "
+                           f"far): {dict(params)}")
+            workspace.mark_failed()
+            return None
+        except subprocess.CalledProcessError as e:
+            _record(params, "failed", start)
+            print(f"Subprocess failed with: {e.output.decode()}, {e.stderr.decode()}")
+            print(config)
+            workspace.mark_failed()
+            return None
+        _record(params, "completed", start)
 
-    data_path = os.path.join(config_dir, "final_demes.csv")
-    df = pd.read_csv(data_path, header=0)
-    df.AverageArray = df.AverageArray.apply(lambda x: np.fromstring(x, sep=";"))
-    df = df[np.floor(df.Generation) == np.floor(df.Generation.max())]
-    df = df.reset_index(drop=True)
+        tumour = _read_output(result.stdout, config_dir, dtype)
 
-    return df
+    if cache is not None:
+        cache.put(config, tumour)
+    return tumour
 
 
-def simulate_abc(params):
+def simulate_abc(params, seed=None, cache=None, storage="full"):
     """
     Wrapper around simulate to be used with pyabc.
     Args:
         params: parameters drawn from prior to use in simulation
+        seed: simulator seed, see simulate
+        cache: SimulationCache to reuse outputs from, see simulate
+        storage: payload stored in the pyabc history, see compact
     Returns:
         A dictionary with the simulated data.
     """
-    res = simulate(params)
-    return {"data": res}
+    res = simulate(params, seed=seed, cache=cache)
+    return {"data": compact(res, storage)}
 
 
-def noisy_abc(params):
-    df = simulate(params)
-    noise = [
-            list(np.random.beta(
-                2,
-                2,
-                size=len(df.AverageArray.iloc[0])
-                )/100) for _ in range(df.shape[0])
-            ]
-    for i in range(df.shape[0]):
-        df.AverageArray.iloc[i] += noise[i]
-    return {"data": df}
+def noisy_abc(params, noise=None, seed=None, storage="full"):
+    """
+    Wrapper around simulate adding measurement noise, to be used with pyabc.
+    Args:
+        params: parameters drawn from prior to use in simulation
+        noise: noise stage from methabc.noise (default: Beta(2, 2) / 100 at
+            every site)
+        seed: seed of the noise, see NoisyModel
+        storage: payload stored in the pyabc history, see compact
+    Returns:
+        A dictionary with the noisy simulated data.
+    """
+    return NoisyModel(simulate_abc, noise or BetaNoise(), seed=seed,
+                      storage=storage)(params)
 
 
-def log_model_abc(log_params):
+def log_model_abc(log_params, storage="full"):
     """
     Wrapper around simulate to be used with pyabc.
     Args:
         log_params: log-transformed parameters drawn from prior to use in simulation
+        storage: payload stored in the pyabc history, see compact
     Returns:
         A dictionary with the simulated data.
     """
     params = {k: 10**v for k, v in log_params.items() if k != "s_driver_birth"}
     params["s_driver_birth"] = log_params["s_driver_birth"]
     res = simulate(params)
-    return {"data": res}
+    return {"data": compact(res, storage)}
+
+
+class AsyncSimulator:
+    """
+    Runs many methdemon subprocesses concurrently from one event loop,
+    instead of blocking one Python process per simulation. Every running
+    simulation has its own workspace, and outputs are parsed as the
+    simulations finish. The simulation budget is the one of
+    set_simulation_budget; limit_simulations does not apply, the
+    concurrency is.
+
+    Args:
+        max_concurrent: number of simulations running at once (default:
+            cores)
+    """
+
+    def __init__(self, max_concurrent=None):
+        self.max_concurrent = max_concurrent or os.cpu_count()
+        self.workspaces = None
+        self.semaphore = None
+        self._loop = None
+
+    def _slots(self):
+        """
+        Semaphore of the running event loop, and the workspaces, created on
+        first use so that simulate can be awaited without map.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # a semaphore is bound to the loop it is first used in
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        if self.workspaces is None:
+            quarantine_dir = os.environ.get("METHABC_QUARANTINE")
+            self.workspaces = [Workspace(quarantine_dir=quarantine_dir)
+                               for _ in range(self.max_concurrent)]
+        return self.semaphore
+
+    async def simulate(self, params, dtype=np.float64, seed=None, cache=None,
+                       profile=None):
+        """
+        Coroutine variant of simulate, with the same arguments and result.
+        """
+        profile = profile or output_profile()
+        seed = seed if seed is not None else seed_mode()
+        config = _render(params, seed, profile)
+        cache = _cache_for(seed, cache)
+        if cache is not None:
+            tumour = cache.get(config)
+            if tumour is not None:
+                return tumour.replace_arrays(
+                    tumour.arrays.astype(dtype, copy=False))
+
+        async with self._slots():
+            workspace = self.workspaces.pop()
+            try:
+                tumour = await self._run(workspace, params, config, dtype,
+                                         profile)
+            finally:
+                self.workspaces.append(workspace)
+
+        if cache is not None and tumour is not None:
+            cache.put(config, tumour)
+        return tumour
+
+    async def simulate_abc(self, params, seed=None, cache=None,
+                           storage="full"):
+        """
+        Coroutine variant of simulate_abc.
+        """
+        res = await self.simulate(params, seed=seed, cache=cache)
+        return {"data": compact(res, storage)}
+
+    async def _run(self, workspace, params, config, dtype, profile):
+        with workspace.run() as run_dir:
+            config_path = write_config(params=params, output_dir=run_dir,
+                                       config=config)
+            config_dir, config_name = os.path.split(config_path)
+
+            max_memory = _budget["max_memory"]
+            timeout = _timeout(params)
+            start = time.time()
+            process = await asyncio.create_subprocess_exec(
+                *model_command(), config_dir, config_name,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                preexec_fn=_memory_limit(max_memory) if max_memory else None,
+                env=_simulator_env(profile),
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(),
+                                                        timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                _record(params, "timed_out", start)
+                logger.warning(f"Simulation exceeded {timeout:.0f} s and "
+                               f"was killed ({simulation_counts['timed_out']} "
+                               f"so far): {dict(params)}")
+                workspace.mark_failed()
+                return None
+            if process.returncode != 0:
+                _record(params, "failed", start)
+                logger.warning(f"Subprocess failed with: {stdout.decode()}, "
+                               f"{stderr.decode()}\n{config}")
+                workspace.mark_failed()
+                return None
+            _record(params, "completed", start)
+            return _read_output(stdout, config_dir, dtype)
+
+    async def _map(self, params_list, callback, kwargs):
+        self._slots()
+        results = [None] * len(params_list)
+
+        async def run(i, params):
+            results[i] = await self.simulate(params, **kwargs)
+            if callback is not None:
+                callback(i, results[i])
+
+        # the semaphore is fair, so simulations start in the given order
+        await asyncio.gather(*(run(i, params)
+                               for i, params in enumerate(params_list)))
+        return results
+
+    def map(self, params_list, callback=None, **kwargs):
+        """
+        Simulate every parameter dict, starting them in the given order.
+        Args:
+            params_list: parameter dicts to simulate
+            callback: called as callback(i, tumour) as soon as the
+                simulation of params_list[i] has been parsed, e.g. to score
+                it while the others are still running
+            **kwargs: passed to simulate, e.g. seed="params"
+        Returns:
+            tumours: SimulatedTumour, or None, of every parameter dict
+        """
+        return asyncio.run(self._map(list(params_list), callback, kwargs))
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+# generations between the founder cell and the sampled tumour
+TUMOUR_AGE = 1000
+
+
+def read_config(path):
+    """
+    Read the key value pairs of a methdemon config file as floats.
+    """
+    values = {}
+    with open(path, "r") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 2:
+                values[parts[0]] = float(parts[1])
+    return values
+
+
+def runtime(config, seconds):
+    """
+    Wall time of a run: seconds at the template defaults, growing with the
+    carrying capacity and migration rate like methdemon's.
+    """
+    scale = (config.get("deme_carrying_capacity", 100) / 100) ** 0.8 \
+        * (max(config.get("init_migration_rate", 0.001), 1e-6) / 0.001) ** 0.3
+    return seconds * scale
+
+
+def simulate_demes(config, demes, rng):
+    """
+    Draw the final generation of a tumour. Every fCpG site of the founder
+    cell is unmethylated, hemi- or fully methylated. Demes branch off at
+    their origin times, earlier with a higher migration rate, and every site
+    relaxes towards the meth_rate / (meth_rate + demeth_rate) equilibrium at
+    rate meth_rate + demeth_rate, with sampling noise that shrinks with the
+    carrying capacity.
+    Args:
+        config: values of the config, see read_config
+        demes: number of demes
+        rng: numpy Generator
+    Returns:
+        arrays: (demes, fCpGs) average methylation of every deme
+        origin_time: generation at which every deme branched off
+    """
+    fcpgs = int(config.get("fCpG_loci_per_cell", 1200))
+    meth = config.get("meth_rate", 0.001)
+    demeth = config.get("demeth_rate", 0.0015)
+    capacity = max(config.get("deme_carrying_capacity", 100), 1)
+    migration = config.get("init_migration_rate", 0.001)
+
+    rate = meth + demeth
+    equilibrium = meth / rate if rate > 0 else 0.5
+    founder = rng.choice([0, 0.5, 1], size=fcpgs)
+    origin_time = np.sort(TUMOUR_AGE * rng.random(demes)
+                          ** (1 + 100 * migration))
+    relaxed = 1 - np.exp(-rate * (TUMOUR_AGE - origin_time))[:, None]
+    shared = 1 - np.exp(-rate * origin_time)[:, None]
+    # sites that relaxed before a deme branched off are redrawn from the
+    # equilibrium genotype frequencies
+    lineage = np.where(rng.random((demes, fcpgs)) < shared,
+                       rng.choice([0, 0.5, 1], size=(demes, fcpgs),
+                                  p=[(1 - equilibrium) ** 2,
+                                     2 * equilibrium * (1 - equilibrium),
+                                     equilibrium ** 2]),
+                       founder)
+    mean = (1 - relaxed) * lineage + relaxed * equilibrium
+    noise = rng.normal(0, 1, (demes, fcpgs)) \
+        * np.sqrt(relaxed * (1 - relaxed) / capacity)
+    return np.clip(mean + noise, 0, 1), origin_time
+
+
+def _write_demes(file, arrays, origin_time, generations):
+    demes = len(arrays)
+    file.write("Generation,Deme,Side,Population,OriginTime,AverageArray\n")
+    for generation in range(generations):
+        for deme in range(demes):
+            side = "left" if deme < demes // 2 else "right"
+            array = ";".join(f"{x:.6f}" for x in arrays[deme])
+            file.write(f"{TUMOUR_AGE - generations + generation + 1},"
+                       f"{deme},{side},100,{origin_time[deme]:.4f},"
+                       f"{array}\n")
+
+
+def write_final_demes(path, arrays, origin_time, generations=3):
+    """
+    Write demes as a methdemon final_demes.csv, repeated for the given
+    number of generations with the last one holding the final demes.
+    """
+    with open(path, "w") as file:
+        _write_demes(file, arrays, origin_time, generations)
+
+
+def write_clones(path, arrays, generations=3, clones=5, rng=None):
+    """
+    Write a clones.csv of the size methdemon writes: the methylation state
+    of every fCpG site of a few clones per deme and generation.
+    """
+    rng = rng or np.random.default_rng()
+    with open(path, "w") as file:
+        file.write("Generation,Deme,Clone,Population,Drivers,MethArray\n")
+        for generation in range(generations):
+            for deme, array in enumerate(arrays):
+                for clone in range(clones):
+                    state = rng.binomial(2, array)
+                    file.write(f"{TUMOUR_AGE - generations + generation + 1},"
+                               f"{deme},{clone},20,0,"
+                               f"{';'.join(map(str, state))}\n")
+
+
+def main(argv=None):
+    """
+    Stand-in for the methdemon executable, taking the same config_dir
+    config_name arguments. Since simulate passes no options, they default
+    to $METHABC_STANDIN_DEMES, $METHABC_STANDIN_GENERATIONS,
+    $METHABC_STANDIN_SECONDS and $METHABC_STANDIN_STREAM (0 for
+    --no-stream). The number of fCpG sites is fCpG_loci_per_cell of the
+    config.
+
+    Like methdemon, it writes clones.csv and final_demes.csv as selected by
+    write_clones_file and write_demes_file. With $METHABC_DEMES_STDOUT set
+    it prints the final generation of the demes to stdout instead of
+    writing final_demes.csv, see simulate.
+    """
+    parser = ArgumentParser(
+        description="Write a synthetic final_demes.csv for a methdemon "
+                    "config.")
+    parser.add_argument("config_dir", type=str)
+    parser.add_argument("config_name", type=str)
+    parser.add_argument("--demes", type=int,
+                        default=int(os.environ.get("METHABC_STANDIN_DEMES",
+                                                   8)))
+    parser.add_argument("--generations", type=int,
+                        default=int(os.environ.get(
+                            "METHABC_STANDIN_GENERATIONS", 3)),
+                        help="generations written to the output")
+    parser.add_argument("--seconds", type=float,
+                        default=float(os.environ.get(
+                            "METHABC_STANDIN_SECONDS", 0)),
+                        help="wall time of a run at the template defaults")
+    parser.add_argument("--no-stream", dest="stream", action="store_false",
+                        default=os.environ.get("METHABC_STANDIN_STREAM",
+                                               "1") != "0",
+                        help="ignore $METHABC_DEMES_STDOUT, like a "
+                             "simulator that cannot stream its output")
+    args = parser.parse_args(argv)
+
+    config = read_config(os.path.join(args.config_dir, args.config_name))
+    rng = np.random.default_rng(int(config.get("seed", 0)))
+    start = time.time()
+    arrays, origin_time = simulate_demes(config, args.demes, rng)
+    if os.environ.get("METHABC_DEMES_STDOUT") and args.stream:
+        _write_demes(sys.stdout, arrays, origin_time, 1)
+    elif config.get("write_demes_file", 1):
+        write_final_demes(os.path.join(args.config_dir, "final_demes.csv"),
+                          arrays, origin_time, args.generations)
+    if config.get("write_clones_file", 1):
+        write_clones(os.path.join(args.config_dir, "clones.csv"), arrays,
+                     args.generations, rng=rng)
+    remaining = runtime(config, args.seconds) - (time.time() - start)
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+if __name__ == "__main__":
+    main()
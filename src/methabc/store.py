@@ -0,0 +1,235 @@
+import glob
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .tumour import SIDES, ObservedTumour
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"METHABC1"
+ALIGNMENT = 64
+# store used by import_data if $METHABC_DATA_STORE is not set
+DEFAULT_STORE = "data/tumours.store"
+# allele count of fCpG sites missing from the allele count file
+MISSING_COUNT = np.iinfo(np.uint8).max
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_counts(path, tumour):
+    """
+    Read an allele count file aligned to the sites and demes of a tumour.
+    """
+    counts = pd.read_csv(path, index_col=0)
+    counts = counts.reindex(index=tumour.labels, columns=list(tumour.demes))
+    return counts.fillna(MISSING_COUNT).to_numpy(dtype=np.uint8).T
+
+
+def build_store(path, data_dir="data/individual",
+                counts_dir="data/individual_distances"):
+    """
+    Convert every tumour_<ID>.csv of a directory, and its allele counts in
+    CRC-multi_patient-<ID>.csv if there are any, into one binary store that
+    workers open memory-mapped, see TumourStore.
+
+    The file starts with MAGIC, the length of a JSON header and the header,
+    which holds the deme names and sides, data file signatures and the
+    offset, shape and dtype of every array. The arrays follow, aligned to
+    ALIGNMENT bytes: CpG labels, methylation arrays, deme matrix and sorted
+    arrays as in ObservedTumour, and uint8 allele counts aligned to the same
+    sites and demes, MISSING_COUNT where the count file lacks a site.
+    Args:
+        path: store file to write
+        data_dir: directory of the tumour_<ID>.csv files
+        counts_dir: directory of the allele count files, or None
+    Returns:
+        IDs of the stored tumours
+    """
+    from .utils import import_data
+
+    paths = sorted(glob.glob(os.path.join(data_dir, "tumour_*.csv")))
+    if not paths:
+        raise FileNotFoundError(f"No tumour_*.csv files in {data_dir}")
+    tumours = {}
+    blobs = []
+    offset = 0
+
+    def add(array):
+        nonlocal offset
+        array = np.ascontiguousarray(array)
+        blobs.append((offset, array))
+        entry = {"offset": offset, "shape": list(array.shape),
+                 "dtype": array.dtype.str}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        return entry
+
+    for data_path in paths:
+        tumour_id = re.fullmatch(r"tumour_(.*)\.csv",
+                                 os.path.basename(data_path))[1]
+        # parsed from the file, not from an earlier store
+        tumour = ObservedTumour.from_dataframe(import_data(data_path))
+        entry = {
+            "source": os.path.realpath(data_path),
+            "signature": _signature(data_path),
+            "demes": list(tumour.demes),
+            "sides": [SIDES[0] if "A" in deme else SIDES[1] if "B" in deme
+                      else None for deme in tumour.demes],
+            "labels": add(tumour.labels.astype(str)),
+            "arrays": add(tumour.arrays),
+            "deme_matrix": add(tumour.deme_matrix),
+            "sorted_arrays": add(tumour.sorted_arrays),
+        }
+        counts_path = os.path.join(counts_dir or "",
+                                   f"CRC-multi_patient-{tumour_id}.csv")
+        if counts_dir and os.path.exists(counts_path):
+            entry["counts_source"] = os.path.realpath(counts_path)
+            entry["counts_signature"] = _signature(counts_path)
+            entry["allele_counts"] = add(_read_counts(counts_path, tumour))
+        tumours[tumour_id] = entry
+
+    header = json.dumps({"tumours": tumours}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as file:
+        file.write(MAGIC)
+        file.write(np.uint64(len(header)).tobytes())
+        file.write(header)
+        for blob_offset, array in blobs:
+            file.seek(start + blob_offset)
+            file.write(array.tobytes())
+        file.truncate(start + offset)
+    os.replace(tmp, path)
+    open_store.cache_clear()
+    return list(tumours)
+
+
+class TumourStore:
+    """
+    Observed tumours of a store written by build_store. The file is mapped
+    read-only, so the arrays of all worker processes of a node share one
+    copy in the page cache and nothing is parsed but the header.
+
+    Args:
+        path: store file
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(self.path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a tumour store")
+            length = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(file.read(length))
+        self.start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+        self.map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.sources = {entry["source"]: tumour_id for tumour_id, entry
+                        in self.header["tumours"].items()}
+        self.counts_sources = {
+            entry["counts_source"]: tumour_id for tumour_id, entry
+            in self.header["tumours"].items() if "counts_source" in entry}
+
+    @property
+    def ids(self):
+        return list(self.header["tumours"])
+
+    def _array(self, tumour_id, name):
+        entry = self.header["tumours"][tumour_id][name]
+        return np.ndarray(entry["shape"], dtype=entry["dtype"],
+                          buffer=self.map, offset=self.start + entry["offset"])
+
+    def observed(self, tumour_id):
+        """
+        Return a tumour as an ObservedTumour whose arrays are views of the
+        store, and which pickles as a reference to it.
+        """
+        entry = self.header["tumours"][tumour_id]
+        # labels are stored as fixed-width unicode; read back as str, as
+        # from the data file
+        labels = self._array(tumour_id, "labels").astype(object)
+        labels.setflags(write=False)
+        return ObservedTumour(
+            labels=labels,
+            demes=tuple(entry["demes"]),
+            arrays=self._array(tumour_id, "arrays"),
+            deme_matrix=self._array(tumour_id, "deme_matrix"),
+            sorted_arrays=self._array(tumour_id, "sorted_arrays"),
+            source=f"{self.path}#{tumour_id}",
+        )
+
+    def sides(self, tumour_id):
+        """
+        Side of every deme of a tumour, "left" for A and "right" for B.
+        """
+        return self.header["tumours"][tumour_id]["sides"]
+
+    def allele_counts(self, tumour_id):
+        """
+        uint8 allele counts of shape (demes, fCpGs), aligned to the sites
+        and demes of observed(tumour_id), or None if the store has none.
+        """
+        if "allele_counts" not in self.header["tumours"][tumour_id]:
+            return None
+        return self._array(tumour_id, "allele_counts")
+
+    def _find(self, path, sources, key):
+        tumour_id = sources.get(os.path.realpath(path))
+        if tumour_id is None:
+            return None
+        if _signature(path) != self.header["tumours"][tumour_id][key]:
+            logger.warning(f"{path} changed since {self.path} was built, "
+                           f"reading the file instead")
+            return None
+        return tumour_id
+
+    def find(self, data_path):
+        """
+        ID of the tumour stored from a data file, or None if the file is
+        not in the store or changed since the store was built.
+        """
+        return self._find(data_path, self.sources, "signature")
+
+    def find_counts(self, counts_path):
+        """
+        ID of the tumour whose allele counts were stored from a count file,
+        or None as for find.
+        """
+        return self._find(counts_path, self.counts_sources,
+                          "counts_signature")
+
+
+@lru_cache(maxsize=None)
+def open_store(path):
+    """
+    Open a store once per process.
+    """
+    return TumourStore(path)
+
+
+def data_store():
+    """
+    Return the store configured by $METHABC_DATA_STORE, or DEFAULT_STORE if
+    it exists, or None. Setting $METHABC_DATA_STORE to an empty string
+    switches the store off.
+    """
+    path = os.environ.get("METHABC_DATA_STORE", DEFAULT_STORE)
+    if not path or not os.path.exists(path):
+        return None
+    return open_store(os.path.abspath(path))
+
+
+def load_reference(reference):
+    """
+    Load a tumour from a "<store path>#<ID>" reference, see
+    TumourStore.observed.
+    """
+    path, tumour_id = reference.rsplit("#", 1)
+    return open_store(path).observed(tumour_id)
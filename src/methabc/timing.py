@@ -0,0 +1,156 @@
+import json
+import os
+import socket
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+import pandas as pd
+import pyabc
+
+# seconds per stage of the particle being evaluated in this process, or None
+# when no TimedModel is evaluating one and stage() does nothing
+_stages = None
+_off = nullcontext()
+
+# generation under which the calibration sample drawn from the prior is
+# logged, as pyabc numbers it
+CALIBRATION = -1
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        _stages[self.name] += time.perf_counter() - self.start
+
+
+def stage(name):
+    """
+    Context manager adding its wall time to a stage of the particle being
+    evaluated by a TimedModel. Outside of a TimedModel, i.e. unless timing is
+    switched on, it returns a shared no-op context and costs one check.
+    Stages must not be nested.
+    """
+    if _stages is None:
+        return _off
+    return _Stage(name)
+
+
+class TimingLog:
+    """
+    Stage timings of every particle, one JSON object per line, written with
+    a single append so that every worker can share one file.
+
+    Args:
+        path: file to append to
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, t, total, stages):
+        """
+        Append one particle.
+        Args:
+            t: generation
+            total: wall time of the particle in the model, in seconds
+            stages: seconds per stage
+        """
+        line = json.dumps({
+            "t": t,
+            "worker": f"{socket.gethostname()}:{os.getpid()}",
+            "total": total,
+            "stages": stages,
+        }) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def read(self):
+        """
+        Return every particle as a dataframe with columns t, worker, total,
+        one column per stage and other, the time outside of any stage, i.e.
+        in pyabc and the remaining Python code.
+        """
+        with open(self.path) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        df = pd.DataFrame([{"t": e["t"], "worker": e["worker"],
+                            "total": e["total"], **e["stages"]}
+                           for e in entries])
+        stages = [c for c in df.columns if c not in ("t", "worker", "total")]
+        df[stages] = df[stages].fillna(0)
+        df["other"] = df["total"] - df[stages].sum(axis=1)
+        return df
+
+    def breakdown(self, by=("t",)):
+        """
+        Aggregate the particles.
+        Args:
+            by: columns to group by, ("t",) per generation or
+                ("t", "worker") per worker and generation
+        Returns:
+            dataframe with the number of particles and workers and the total
+            seconds in every stage per group
+        """
+        df = self.read()
+        grouped = df.groupby(list(by))
+        res = grouped[df.columns.drop(["t", "worker"])].sum()
+        res.insert(0, "particles", grouped.size())
+        res.insert(1, "workers", grouped["worker"].nunique())
+        return res
+
+
+class TimedModel(pyabc.Model):
+    """
+    Model recording how long every particle spends in each stage of
+    simulate and of the distance, see stage, in a TimingLog. Simulations of
+    the calibration sample are logged under generation CALIBRATION.
+
+    Args:
+        model: model function or pyabc.Model, e.g. simulate_abc
+        path: TimingLog file
+    """
+
+    def __init__(self, model, path, name=None):
+        model = pyabc.model.FunctionModel.to_model(model)
+        super().__init__(name or model.name)
+        self.model = model
+        self.log = TimingLog(path)
+
+    def _timed(self, t, method, *args, log_t=None):
+        global _stages
+        _stages = Counter()
+        start = time.perf_counter()
+        try:
+            return method(t, *args)
+        finally:
+            total = time.perf_counter() - start
+            stages, _stages = _stages, None
+            self.log.record(t if log_t is None else log_t, total, stages)
+
+    def sample(self, pars):
+        return self.model.sample(pars)
+
+    def summary_statistics(self, t, pars, sum_stat_calculator):
+        # pyabc simulates the calibration sample with t=0, and later
+        # generations only through accept, or look-ahead with t > 0
+        return self._timed(t, self.model.summary_statistics, pars,
+                           sum_stat_calculator,
+                           log_t=CALIBRATION if t == 0 else t)
+
+    def accept(self, t, pars, sum_stat_calculator, distance_calculator,
+               eps_calculator, acceptor, x_0):
+        return self._timed(t, self.model.accept, pars, sum_stat_calculator,
+                           distance_calculator, eps_calculator, acceptor,
+                           x_0)
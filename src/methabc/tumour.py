@@ -0,0 +1,403 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .wasserstein import sort_demes
+
+
+SIDES = ('left', 'right')
+
+# storage modes of simulated tumours in the pyabc history, see compact
+STORAGE = ('full', 'float32', 'uint16', 'summary', 'counts')
+
+# beta values in [0, 1] are stored as multiples of 1 / QUANTISED_MAX
+QUANTISED_MAX = np.iinfo(np.uint16).max
+
+# beta values below, between and above these are 0, 1 and 2 methylated
+# alleles; this reproduces most of the counts in data/individual_distances
+# from the beta values in data/individual
+COUNT_THRESHOLDS = (0.25, 0.75)
+
+
+def pairwise_squared(arrays):
+    """
+    Compute the squared distance between every pair of rows of an array, i.e.
+    the deme matrix without going through the dataframe. Leading dimensions
+    are batch dimensions.
+    """
+    differences = arrays[..., :, None, :] - arrays[..., None, :, :]
+    return np.sum(differences ** 2, axis=-1) / arrays.shape[-1]
+
+
+def quantise(arrays):
+    """
+    Store beta values as uint16, with a resolution of 1 / QUANTISED_MAX.
+    """
+    return np.rint(np.clip(arrays, 0, 1) * QUANTISED_MAX).astype(np.uint16)
+
+
+def allele_counts(arrays):
+    """
+    Discretise beta values to the number of methylated alleles, as uint8.
+    """
+    low, high = COUNT_THRESHOLDS
+    return (arrays >= low).view(np.uint8) + (arrays >= high).view(np.uint8)
+
+
+def dequantise(arrays):
+    """
+    Return arrays as floats, undoing quantise for uint16 arrays and mapping
+    allele counts (uint8) to beta values 0, 0.5 and 1.
+    """
+    if arrays.dtype == np.uint16:
+        return arrays / QUANTISED_MAX
+    if arrays.dtype == np.uint8:
+        return arrays / 2
+    return arrays.astype(float, copy=False)
+
+
+def _frozen(arr):
+    arr = np.ascontiguousarray(arr)
+    arr.setflags(write=False)
+    return arr
+
+
+@dataclass(frozen=True, eq=False)
+class ObservedTumour:
+    """
+    Observed tumour with everything the distance functions need from it
+    computed once, so that no observed-side work is repeated per particle.
+    Attributes:
+        labels: CpG labels of the fCpG sites
+        demes: names of the demes, in the order of import_data
+        arrays: methylation arrays of shape (demes, fCpGs)
+        deme_matrix: squared distance between every pair of demes
+        sorted_arrays: arrays sorted per deme, for Wasserstein distances
+        source: data file the tumour was imported from, if any; such
+            tumours pickle as a reference to the file and are loaded once
+            per worker process
+    """
+    labels: np.ndarray
+    demes: tuple
+    arrays: np.ndarray
+    deme_matrix: np.ndarray
+    sorted_arrays: np.ndarray
+    source: str = None
+
+    @classmethod
+    def from_array(cls, arrays, labels=None, demes=None, source=None):
+        """
+        Build the observed tumour from an array of shape (demes, fCpGs).
+        """
+        arrays = _frozen(np.asarray(arrays, dtype=float))
+        if labels is None:
+            labels = np.arange(arrays.shape[1])
+        if demes is None:
+            demes = tuple(range(arrays.shape[0]))
+        return cls(
+            labels=_frozen(labels),
+            demes=tuple(demes),
+            arrays=arrays,
+            deme_matrix=_frozen(pairwise_squared(arrays)),
+            sorted_arrays=_frozen(sort_demes(arrays)),
+            source=source,
+        )
+
+    @classmethod
+    def from_dataframe(cls, df, source=None):
+        """
+        Build the observed tumour from the dataframe returned by import_data,
+        which holds one deme per column.
+        """
+        return cls.from_array(
+            df.to_numpy(dtype=float).T,
+            labels=df.index.to_numpy(),
+            demes=df.columns,
+            source=source,
+        )
+
+    def to_dataframe(self):
+        """
+        Convert back to the dataframe layout of import_data.
+        """
+        return pd.DataFrame(self.arrays.T, index=self.labels,
+                            columns=list(self.demes))
+
+    def __reduce_ex__(self, protocol):
+        if self.source is None:
+            return super().__reduce_ex__(protocol)
+        from .utils import load_observed
+        return load_observed, (self.source,)
+
+    def __array__(self, dtype=None, copy=None):
+        # pyabc stores summary statistics with numpy.save
+        if dtype is None:
+            return self.arrays
+        return self.arrays.astype(dtype)
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class SimulatedTumour:
+    """
+    Final generation of a methdemon simulation, held as one contiguous block
+    of methylation arrays plus per-deme metadata, in simulator row order.
+    Attributes:
+        arrays: methylation arrays of shape (demes, fCpGs)
+        side: index into SIDES for every deme, -1 for any other side
+        origin_time: OriginTime of every deme
+        generation: Generation of every deme
+    """
+    arrays: np.ndarray
+    side: np.ndarray
+    origin_time: np.ndarray
+    generation: np.ndarray
+
+    @classmethod
+    def from_dataframe(cls, df, dtype=np.float64):
+        """
+        Build the result from a final_demes dataframe whose AverageArray
+        column holds one array per deme.
+        """
+        return cls(
+            arrays=np.vstack(df.AverageArray.values).astype(dtype),
+            side=np.asarray(pd.Categorical(df.Side, categories=SIDES).codes,
+                            dtype=np.int8),
+            origin_time=df.OriginTime.to_numpy(dtype=float),
+            generation=df.Generation.to_numpy(dtype=float),
+        )
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build the result from the structured array produced by __array__,
+        e.g. as read back from a pyabc history.
+        """
+        return cls(
+            arrays=np.ascontiguousarray(records['AverageArray']),
+            side=np.ascontiguousarray(records['Side']),
+            origin_time=np.ascontiguousarray(records['OriginTime']),
+            generation=np.ascontiguousarray(records['Generation']),
+        )
+
+    def to_dataframe(self):
+        """
+        Convert to the final_demes dataframe layout, e.g. for notebooks.
+        """
+        return pd.DataFrame({
+            'Generation': self.generation,
+            'Side': pd.Categorical.from_codes(self.side, categories=SIDES),
+            'OriginTime': self.origin_time,
+            'AverageArray': list(self.arrays),
+        })
+
+    @property
+    def num_demes(self):
+        return self.arrays.shape[0]
+
+    @property
+    def num_left(self):
+        return int(np.count_nonzero(self.side == 0))
+
+    @property
+    def float_arrays(self):
+        """
+        The arrays as floats, dequantised if stored as uint16 or uint8.
+        """
+        return dequantise(self.arrays)
+
+    @property
+    def deme_matrix(self):
+        """
+        Squared distance between every pair of demes, in row order. Computed
+        on every access.
+        """
+        return pairwise_squared(self.float_arrays)
+
+    @property
+    def sorted_arrays(self):
+        """
+        Arrays sorted per deme, see sort_demes. Computed on every access.
+        """
+        return sort_demes(self.float_arrays)
+
+    def sorted_by_side(self):
+        """
+        Return the demes on a known side, ordered by side and OriginTime as
+        the distance functions expect. Already sorted results are returned
+        as they are, without copying the arrays.
+        """
+        order = np.lexsort((self.origin_time, self.side))
+        order = order[self.side[order] >= 0]
+        if len(order) == self.num_demes and np.all(order[1:] > order[:-1]):
+            return self
+        return self.take(order)
+
+    def take(self, index):
+        """
+        Return the demes at the given positions.
+        """
+        return SimulatedTumour(
+            arrays=self.arrays[index],
+            side=self.side[index],
+            origin_time=self.origin_time[index],
+            generation=self.generation[index],
+        )
+
+    def replace_arrays(self, arrays):
+        """
+        Return a copy with new methylation arrays and the same metadata.
+        """
+        return SimulatedTumour(arrays=arrays, side=self.side,
+                               origin_time=self.origin_time,
+                               generation=self.generation)
+
+    def __array__(self, dtype=None, copy=None):
+        # pyabc stores summary statistics with numpy.save, which cannot
+        # pickle, so store everything as one structured array
+        records = np.empty(self.num_demes, dtype=[
+            ('Side', np.int8),
+            ('OriginTime', float),
+            ('Generation', float),
+            ('AverageArray', self.arrays.dtype, self.arrays.shape[1:]),
+        ])
+        records['Side'] = self.side
+        records['OriginTime'] = self.origin_time
+        records['Generation'] = self.generation
+        records['AverageArray'] = self.arrays
+        return records
+
+
+@dataclass(frozen=True, eq=False)
+class TumourSummary:
+    """
+    Compact stand-in for a simulated tumour holding only what the distance
+    functions need: its deme matrix and quantiles of every deme, for the
+    demes on a known side ordered as by SimulatedTumour.sorted_by_side.
+    Attributes:
+        side: index into SIDES for every deme
+        deme_matrix: squared distance between every pair of demes
+        sorted_arrays: quantiles of every deme, in increasing order
+    """
+    side: np.ndarray
+    deme_matrix: np.ndarray
+    sorted_arrays: np.ndarray
+
+    @classmethod
+    def from_tumour(cls, tumour, quantiles=200):
+        """
+        Summarise a simulated tumour.
+        Args:
+            tumour: SimulatedTumour
+            quantiles: number of quantiles kept per deme, each the mean of an
+                equally sized bin of sorted values; None keeps every sorted
+                value, which keeps Wasserstein distances exact
+        """
+        tumour = tumour.sorted_by_side()
+        sorted_arrays = tumour.sorted_arrays
+        num_sites = sorted_arrays.shape[1]
+        if quantiles is not None and quantiles < num_sites:
+            starts = np.arange(quantiles) * num_sites // quantiles
+            sizes = np.diff(np.append(starts, num_sites))
+            sorted_arrays = (np.add.reduceat(sorted_arrays, starts, axis=1)
+                             / sizes)
+        return cls(side=tumour.side, deme_matrix=tumour.deme_matrix,
+                   sorted_arrays=sorted_arrays.astype(np.float32))
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(
+            side=np.ascontiguousarray(records['Side']),
+            deme_matrix=np.ascontiguousarray(records['DemeMatrix']),
+            sorted_arrays=np.ascontiguousarray(records['SortedArray']),
+        )
+
+    @property
+    def num_demes(self):
+        return len(self.side)
+
+    @property
+    def num_left(self):
+        return int(np.count_nonzero(self.side == 0))
+
+    def sorted_by_side(self):
+        return self
+
+    def __array__(self, dtype=None, copy=None):
+        records = np.empty(self.num_demes, dtype=[
+            ('Side', np.int8),
+            ('DemeMatrix', float, (self.num_demes,)),
+            ('SortedArray', self.sorted_arrays.dtype,
+             self.sorted_arrays.shape[1:]),
+        ])
+        records['Side'] = self.side
+        records['DemeMatrix'] = self.deme_matrix
+        records['SortedArray'] = self.sorted_arrays
+        return records
+
+
+def compact(tumour, storage="full"):
+    """
+    Convert a simulation to the payload stored in the pyabc history.
+    Args:
+        tumour: SimulatedTumour, or None for a failed simulation
+        storage: one of STORAGE; "full" keeps the tumour as it is,
+            "float32" and "uint16" store the arrays at lower precision
+            (uint16 quantised, see quantise), "summary" stores a
+            TumourSummary with 200 quantiles per deme, "counts" stores
+            allele counts as uint8, see allele_counts
+    """
+    if tumour is None or storage == "full":
+        return tumour
+    if storage == "float32":
+        return tumour.replace_arrays(tumour.arrays.astype(np.float32))
+    if storage == "uint16":
+        return tumour.replace_arrays(quantise(tumour.arrays))
+    if storage == "summary":
+        return TumourSummary.from_tumour(tumour)
+    if storage == "counts":
+        return tumour.replace_arrays(allele_counts(tumour.float_arrays))
+    raise ValueError(f"Unknown storage mode {storage}, expected one of "
+                     f"{STORAGE}")
+
+
+def as_simulated(data):
+    """
+    Return data as a SimulatedTumour, accepting the final_demes dataframe or
+    the structured array stored in a pyabc history. Summaries stored in the
+    history are returned as a TumourSummary.
+    """
+    if isinstance(data, (SimulatedTumour, TumourSummary)):
+        return data
+    if isinstance(data, pd.DataFrame):
+        return SimulatedTumour.from_dataframe(data)
+    if 'SortedArray' in data.dtype.names:
+        return TumourSummary.from_records(data)
+    return SimulatedTumour.from_records(data)
+
+
+def is_simulated(data):
+    """
+    Tell simulated tumours apart from observed ones.
+    """
+    if isinstance(data, (SimulatedTumour, TumourSummary)):
+        return True
+    if isinstance(data, pd.DataFrame):
+        return 'Side' in data.columns
+    return isinstance(data, np.ndarray) and data.dtype.names is not None
+
+
+def as_observed(data):
+    """
+    Return data as an ObservedTumour, accepting the dataframe of import_data,
+    a plain (demes, fCpGs) array as read back from a pyabc history, or a
+    simulated tumour used as synthetic data, with its demes sorted by side.
+    """
+    if isinstance(data, ObservedTumour):
+        return data
+    if is_simulated(data):
+        return ObservedTumour.from_array(as_simulated(data).sorted_by_side()
+                                         .float_arrays)
+    if isinstance(data, pd.DataFrame):
+        return ObservedTumour.from_dataframe(data)
+    return ObservedTumour.from_array(data)
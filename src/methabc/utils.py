@@ -1,12 +1,113 @@
 import os
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 
+from .timing import stage
+from .tumour import SIDES, ObservedTumour, SimulatedTumour
+
+
+class ConfigTemplate:
+    """
+    Config template parsed once into its sections and keys, so that a
+    config can be rendered with a single string build.
+
+    Args:
+        lines: lines of the template file
+    """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.sections = {}
+        self.index = {}
+        section = None
+        for i, line in enumerate(self.lines):
+            parts = line.split(maxsplit=1)
+            if not parts or parts[0] in ("{", "}"):
+                continue
+            if len(parts) == 1:
+                section = parts[0]
+                self.sections[section] = []
+            else:
+                self.sections.setdefault(section, []).append(parts[0])
+                self.index[parts[0]] = i
+
+    @classmethod
+    def from_file(cls, config_template_path):
+        with open(config_template_path, "r") as file:
+            return cls(file.readlines())
+
+    @property
+    def keys(self):
+        return self.index.keys()
+
+    def value(self, key):
+        """
+        Default value of a key in the template, as a float.
+        """
+        return float(self.lines[self.index[key]].split()[1])
+
+    def validate(self, params):
+        """
+        Raise a ValueError naming any parameter that is not a template key.
+        """
+        unknown = [key for key in params.keys() if key not in self.index]
+        if unknown:
+            raise ValueError(f"Parameters not in the config template: {unknown}")
+
+    def render(self, params):
+        """
+        Render the config for params as a string.
+        """
+        self.validate(params)
+        lines = self.lines.copy()
+        for key, value in params.items():
+            if type(value) is float:
+                lines[self.index[key]] = f"    {key} {value:.6f}\n"
+            else:
+                lines[self.index[key]] = f"    {key} {value}\n"
+        return "".join(lines)
+
+
+@lru_cache(maxsize=None)
+def load_template(config_template_path):
+    """
+    Parse a config template once per process.
+    """
+    return ConfigTemplate.from_file(config_template_path)
+
+
+# config overrides of the output profiles: "full" writes what the template
+# asks for, "lean" only the demes file, the one output inference reads
+OUTPUT_PROFILES = {
+    "full": {},
+    "lean": {"write_clones_file": 0, "write_demes_file": 1},
+}
+
+
+def render_config(
+    params,
+    config_template_path="resources/config_template.dat",
+    profile="full",
+):
+    """
+    Render parameters drawn from prior into a config string based on template
+
+    Args:
+        params: sampled prior distribution (accessed as a dict)
+        config_template_path: path to the template config
+        profile: output profile, see OUTPUT_PROFILES
+    """
+    return load_template(config_template_path).render(
+        {**params, **OUTPUT_PROFILES[profile]})
+
 
 def write_config(
 	params,
 	config_template_path="resources/config_template.dat",
 	output_dir="simulations/",
+	config=None,
+	profile="full",
 ):
     """
     Write parameters drawn from prior into a config file based on template
@@ -14,44 +115,154 @@ def write_config(
     Args:
         params: sampled prior distribution (accessed as a dict)
         config_template_path: path to the template config
-        output_dir: directory to write the config file to
+        output_dir: directory to write the config file to, e.g. a workspace
+        config: config already rendered by render_config, to skip rendering
+        profile: output profile, see OUTPUT_PROFILES
     """
     filename = "config.dat"
-    with open(config_template_path, "r") as file:
-        lines = file.readlines()
-
-    updated_lines = []
-    for line in lines:
-        parts = line.split(maxsplit=1)
-        if parts[0] in params.keys():
-            if type(params[parts[0]]) is float:
-                updated_line = f"    {parts[0]} {params[parts[0]]:.6f}\n"
-            else:
-                updated_line = f"    {parts[0]} {params[parts[0]]}\n"
-        else:
-            updated_line = line
-        updated_lines.append(updated_line)
+    if config is None:
+        config = render_config(params, config_template_path, profile)
 
     output_path = os.path.join(output_dir, filename)
 
     with open(output_path, "w") as file:
-        file.writelines(updated_lines)
+        file.write(config)
 
     return output_path
 
 
-def import_data(data_path):
+def order_demes(columns):
+    """
+    Order the deme columns of a data file: the A side, then the B side, then
+    any other columns.
+    """
+    columns_a = sorted([col for col in columns if "A" in col], key=len)
+    columns_b = sorted([col for col in columns if "B" in col], key=len)
+    other_columns = [col for col in columns if "A" not in col and "B" not in col]
+    return columns_a + columns_b + other_columns
+
+
+def import_data(data_path, compiled=False):
     """
     Import tumour methylation data from file.
     Args:
         data_path: path to the data file
+        compiled: return an ObservedTumour with the observed-side statistics
+            precomputed instead of the dataframe
     Returns:
         data: pandas dataframe with columns rearranged
+
+    Compiled tumours are taken from the data store, see methabc.store, if
+    the file is in it and unchanged.
     """
+    if compiled:
+        from .store import data_store
+        store = data_store()
+        tumour_id = store.find(data_path) if store is not None else None
+        if tumour_id is not None:
+            return store.observed(tumour_id)
     data = pd.read_csv(data_path, index_col=0).dropna()
-    columns_a = sorted([col for col in data.columns if "A" in col], key=len)
-    columns_b = sorted([col for col in data.columns if "B" in col], key=len)
-    other_columns = [col for col in data.columns if "A" not in col and "B" not in col]
-    sorted_columns = columns_a + columns_b + other_columns
-    data = data[sorted_columns]
+    data = data[order_demes(data.columns)]
+    if compiled:
+        return ObservedTumour.from_dataframe(data,
+                                             source=os.path.abspath(data_path))
     return data
+
+
+@lru_cache(maxsize=None)
+def load_observed(data_path):
+    """
+    Import a compiled observed tumour once per process, e.g. in each worker
+    that receives it from a sampler. data_path may also be a reference into
+    the data store, see methabc.store.
+    """
+    if "#" in data_path:
+        from .store import load_reference
+        return load_reference(data_path)
+    return import_data(data_path, compiled=True)
+
+
+def read_final_demes(data_path, dtype=np.float64):
+    """
+    Read the final generation of a methdemon final_demes.csv file, see
+    parse_final_demes.
+    Args:
+        data_path: path to final_demes.csv
+        dtype: float type of the methylation arrays
+    Returns:
+        tumour: SimulatedTumour with the demes of the last generation
+    """
+    with stage("csv_read"), open(data_path, "r") as file:
+        text = file.read()
+    return parse_final_demes(text, dtype=dtype, source=data_path)
+
+
+def parse_final_demes(text, dtype=np.float64, source="final_demes.csv"):
+    """
+    Parse the final generation of final_demes.csv content, e.g. read from a
+    file or from the simulator's stdout. Rows are filtered on Generation
+    before any methylation array is decoded, and the selected arrays are
+    parsed straight into one (demes, fCpGs) buffer.
+    Args:
+        text: CSV content, header first
+        dtype: float type of the methylation arrays
+        source: name of the content in error messages
+    Returns:
+        tumour: SimulatedTumour with the demes of the last generation
+    """
+    with stage("generation_filter"):
+        header, _, body = text.partition("\n")
+        header = header.strip().split(",")
+        lines = body.splitlines()
+        columns = {name.strip('"'): i for i, name in enumerate(header)}
+        generation_col = columns["Generation"]
+        side_col = columns["Side"]
+        origin_col = columns["OriginTime"]
+        array_col = columns["AverageArray"]
+        # split off the metadata only; the array is left untouched if it is
+        # last
+        maxsplit = max(generation_col, side_col, origin_col) + 1
+
+        rows = [line.split(",", maxsplit) for line in lines if line]
+        generations = np.array([float(row[generation_col]) for row in rows])
+        if len(rows) == 0:
+            return SimulatedTumour(
+                arrays=np.empty((0, 0), dtype=dtype),
+                side=np.empty(0, dtype=np.int8),
+                origin_time=np.empty(0),
+                generation=generations,
+            )
+        final = np.flatnonzero(np.floor(generations)
+                               == np.floor(generations.max()))
+
+        side_codes = {side: i for i, side in enumerate(SIDES)}
+        side = np.array([side_codes.get(rows[i][side_col].strip('"'), -1)
+                         for i in final], dtype=np.int8)
+        origin_time = np.array([float(rows[i][origin_col]) for i in final])
+
+        arrays = []
+        for i in final:
+            if array_col < maxsplit:
+                field = rows[i][array_col]
+            else:
+                field = rows[i][maxsplit].split(",")[array_col - maxsplit]
+            arrays.append(field.strip('"').strip(";"))
+
+    with stage("array_decode"):
+        # a short and a long row would add up to the expected total
+        lengths = np.array([field.count(";") + 1 for field in arrays])
+        if np.any(lengths != lengths[0]):
+            raise ValueError(f"Demes in {source} have arrays of different "
+                             f"lengths: {sorted(set(lengths.tolist()))}")
+        num_fcpgs = int(lengths[0])
+        values = np.fromstring(";".join(arrays), dtype=dtype, sep=";")
+    if values.size != len(arrays) * num_fcpgs:
+        raise ValueError(f"Arrays in {source} hold {values.size} values, "
+                         f"expected {len(arrays)} demes of {num_fcpgs}")
+
+    return SimulatedTumour(
+        arrays=values.reshape(len(arrays), num_fcpgs),
+        side=side,
+        origin_time=origin_time,
+        generation=generations[final],
+    )
@@ -0,0 +1,90 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+def sort_demes(arrays):
+    """
+    Sort the methylation array of every deme once, so that Wasserstein
+    distances can be read off the sorted values (the empirical quantiles).
+    Args:
+        arrays: array of shape (demes, fCpGs)
+    Returns:
+        sorted array of the same shape
+    """
+    return np.sort(np.asarray(arrays, dtype=float), axis=-1)
+
+
+@lru_cache(maxsize=None)
+def quantile_grid(n, m):
+    """
+    Merge the quantile breakpoints of two samples of sizes n and m.
+    Args:
+        n: number of fCpG sites in the first sample
+        m: number of fCpG sites in the second sample
+    Returns:
+        index_n: order statistic of the first sample on each interval
+        index_m: order statistic of the second sample on each interval
+        weights: length of each interval
+    """
+    # breakpoints k/n and l/m, counted in units of 1/(n*m) to stay exact
+    edges = np.union1d(np.arange(n + 1) * m, np.arange(m + 1) * n)
+    mids = edges[:-1] + edges[1:]
+    index_n = mids // (2 * m)
+    index_m = mids // (2 * n)
+    weights = np.diff(edges) / (n * m)
+    for arr in (index_n, index_m, weights):
+        arr.setflags(write=False)
+    return index_n, index_m, weights
+
+
+def _quantiles(sorted1, sorted2):
+    """
+    Evaluate both sets of sorted arrays on their merged quantile grid.
+    """
+    n, m = sorted1.shape[-1], sorted2.shape[-1]
+    if n == m:
+        return sorted1, sorted2, None
+    index_n, index_m, weights = quantile_grid(n, m)
+    return sorted1[..., index_n], sorted2[..., index_m], weights
+
+
+def wasserstein_matrix(sorted1, sorted2):
+    """
+    Compute the Wasserstein distance between every deme of one tumour and
+    every deme of another in a single operation.
+    Args:
+        sorted1: sorted arrays of shape (demes1, fCpGs1), see sort_demes
+        sorted2: sorted arrays of shape (demes2, fCpGs2)
+            Leading dimensions of either argument are broadcast, to compare
+            several tumours at once.
+    Returns:
+        array of shape (demes1, demes2), entry [k, i] comparing deme k of the
+        first tumour to deme i of the second
+    """
+    q1, q2, weights = _quantiles(sorted1, sorted2)
+    # one deme of the second tumour at a time, which keeps the differences
+    # of shape (..., demes1, grid) and in cache
+    columns = []
+    for i in range(q2.shape[-2]):
+        differences = np.abs(q1 - q2[..., i, None, :])
+        columns.append(differences.mean(axis=-1) if weights is None
+                       else differences @ weights)
+    return np.stack(columns, axis=-1)
+
+
+def paired_wasserstein(sorted1, sorted2):
+    """
+    Compute the Wasserstein distance between deme i of one tumour and deme i
+    of another, for every i.
+    Args:
+        sorted1: sorted arrays of shape (demes, fCpGs1), see sort_demes
+        sorted2: sorted arrays of shape (demes, fCpGs2)
+    Returns:
+        array of shape (demes,)
+    """
+    q1, q2, weights = _quantiles(sorted1, sorted2)
+    differences = np.abs(q1 - q2)
+    if weights is None:
+        return differences.mean(axis=-1)
+    return differences @ weights
@@ -0,0 +1,179 @@
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import util
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "methabc-"
+
+
+def default_root():
+    """
+    Directory to create workspaces in: $METHABC_WORKSPACE if set, otherwise
+    RAM-backed /dev/shm when it is writable, otherwise the system temp dir.
+    """
+    root = os.environ.get("METHABC_WORKSPACE")
+    if root:
+        return root
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale(root):
+    """
+    Remove workspaces left behind by processes that no longer exist, e.g.
+    workers killed before they could clean up.
+    """
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.startswith(PREFIX) or not entry.is_dir():
+            continue
+        try:
+            pid = int(entry.name[len(PREFIX):].split("-")[0])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _clear(path):
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+
+
+class Workspace:
+    """
+    Reusable simulation directory owned by a single process. Every
+    simulation runs in the same directory, which is emptied after each run
+    and removed when the process exits.
+
+    Args:
+        root: directory to create the workspace in, see default_root
+        quarantine_dir: if given, artefacts of failed runs are moved here
+            instead of being deleted
+        max_quarantined: number of failed runs to keep in quarantine_dir
+    """
+
+    def __init__(self, root=None, quarantine_dir=None, max_quarantined=20):
+        self.root = root if root is not None else default_root()
+        self.quarantine_dir = quarantine_dir
+        self.max_quarantined = max_quarantined
+        self.pid = os.getpid()
+        self.path = None
+        self.runs = 0
+        self.last_bytes_written = 0
+        self.total_bytes_written = 0
+        self._failed = False
+        # registered once, not every time the directory is recreated:
+        # atexit covers the main process, the finaliser covers
+        # multiprocessing workers, which exit without running atexit
+        atexit.register(self.cleanup)
+        util.Finalize(self, self.cleanup, exitpriority=0)
+
+    def _create(self):
+        os.makedirs(self.root, exist_ok=True)
+        remove_stale(self.root)
+        self.path = tempfile.mkdtemp(prefix=f"{PREFIX}{self.pid}-",
+                                     dir=self.root)
+
+    @contextmanager
+    def run(self):
+        """
+        Context manager yielding the directory for one simulation. The
+        directory is emptied on exit, after its artefacts were quarantined
+        if the run raised or was marked with mark_failed.
+        """
+        if self.path is None or not os.path.isdir(self.path):
+            self._create()
+        self._failed = False
+        try:
+            yield self.path
+        except BaseException:
+            self._failed = True
+            raise
+        finally:
+            self.last_bytes_written = _directory_size(self.path)
+            self.total_bytes_written += self.last_bytes_written
+            self.runs += 1
+            logger.debug(f"Simulation wrote {self.last_bytes_written} bytes")
+            if self._failed and self.quarantine_dir is not None:
+                self._quarantine()
+            _clear(self.path)
+
+    def mark_failed(self):
+        """
+        Mark the current run as failed, so that its artefacts are kept.
+        """
+        self._failed = True
+
+    def _quarantine(self):
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        target = os.path.join(
+            self.quarantine_dir,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{self.pid}-{self.runs}",
+        )
+        shutil.copytree(self.path, target)
+        kept = sorted(
+            (entry for entry in os.scandir(self.quarantine_dir)
+             if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in kept[:max(len(kept) - self.max_quarantined, 0)]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def cleanup(self):
+        """
+        Remove the workspace. Only the owning process removes it.
+        """
+        if self.path is not None and os.getpid() == self.pid:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+
+_workspace = None
+
+
+def get_workspace():
+    """
+    Return the workspace of the current process, creating a new one after a
+    fork. Failed runs are quarantined in $METHABC_QUARANTINE if it is set.
+    """
+    global _workspace
+    if _workspace is None or _workspace.pid != os.getpid():
+        _workspace = Workspace(
+            quarantine_dir=os.environ.get("METHABC_QUARANTINE"),
+        )
+    return _workspace
@@ -0,0 +1,98 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import methabc.cache
+from methabc.cache import SimulationCache
+from methabc.tumour import SimulatedTumour
+from methabc.utils import render_config
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), os.pardir, "resources",
+                        "config_template.dat")
+
+PARAMS = {
+    "init_migration_rate": 0.009,
+    "mu_driver_birth": 0.0001,
+    "s_driver_birth": 0.1,
+    "meth_rate": 0.0022,
+    "demeth_rate": 0.0018,
+}
+
+
+def tumour(seed=0, demes=4, fcpgs=8):
+    rng = np.random.default_rng(seed)
+    return SimulatedTumour(
+        arrays=rng.random((demes, fcpgs)),
+        side=rng.integers(-1, 2, demes).astype(np.int8),
+        origin_time=rng.random(demes),
+        generation=rng.random(demes),
+    )
+
+
+def assert_same(a, b):
+    for field in ("arrays", "side", "origin_time", "generation"):
+        np.testing.assert_array_equal(getattr(a, field), getattr(b, field))
+
+
+def test_hit_on_the_same_config(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    stored = tumour()
+    cache.put(render_config(PARAMS, TEMPLATE), stored)
+    assert_same(cache.get(render_config(PARAMS, TEMPLATE)), stored)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_miss_when_a_parameter_changes(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    cache.put(render_config(PARAMS, TEMPLATE), tumour())
+    changed = {**PARAMS, "meth_rate": 0.0023}
+    assert cache.get(render_config(changed, TEMPLATE)) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_failed_write_leaves_no_partial_entry(tmp_path, monkeypatch):
+    cache = SimulationCache(str(tmp_path))
+    config = render_config(PARAMS, TEMPLATE)
+
+    def savez(file, **arrays):
+        file.write(b"PK\x03\x04 truncated")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(methabc.cache.np, "savez", savez)
+    with pytest.raises(OSError, match="disk full"):
+        cache.put(config, tumour())
+    monkeypatch.undo()
+    files = [path for path in glob.glob(str(tmp_path / "**"), recursive=True)
+             if os.path.isfile(path) and not path.endswith(".lock")]
+    assert files == []
+    assert cache.get(config) is None
+
+
+def test_truncated_entry_is_removed(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    config = render_config(PARAMS, TEMPLATE)
+    cache.put(config, tumour())
+    path = cache._path(config)
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) // 2)
+    assert cache.get(config) is None
+    assert not os.path.exists(path)
+
+
+def test_eviction_removes_the_oldest_entries(tmp_path):
+    cache = SimulationCache(str(tmp_path))
+    configs = [render_config({**PARAMS, "meth_rate": 0.001 * (i + 1)},
+                             TEMPLATE) for i in range(4)]
+    for i, config in enumerate(configs):
+        cache.put(config, tumour(seed=i))
+        # written out of order: entry 2 is the oldest, then 0, 3, 1
+        mtime = 1_000_000 + [1, 3, 0, 2][i]
+        os.utime(cache._path(config), (mtime, mtime))
+    entry_bytes = os.path.getsize(cache._path(configs[0]))
+    cache.max_bytes = 2 * entry_bytes
+    cache.evict()
+    kept = [os.path.exists(cache._path(config)) for config in configs]
+    assert kept == [False, True, False, True]
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,124 @@
+import os
+import sys
+
+import numpy as np
+import pyabc
+import pytest
+
+from methabc.cohort import (Cohort, ReferenceDistance, ReferenceModel,
+                            ReferenceTable, TablePrior, build_reference_table)
+from methabc.distance import REJECTED, total_distance
+from methabc.simulate import simulate
+from methabc.tumour import ObservedTumour, SimulatedTumour
+from methabc.utils import import_data
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+PRIOR = {
+    "init_migration_rate": (0.0005, 0.1),
+    "mu_driver_birth": (0, 0.01),
+    "s_driver_birth": (0, .2),
+    "meth_rate": (0, 0.1),
+    "demeth_rate": (0, 0.1),
+}
+
+
+def prior():
+    return pyabc.Distribution(**{key: pyabc.RV("uniform", a, b - a)
+                                 for key, (a, b) in PRIOR.items()})
+
+
+def simulated(rng, num_sites, sides=(0, 0, 0, 1, 1, 1, 1, -1)):
+    sides = rng.permutation(np.array(sides, dtype=np.int8))
+    return SimulatedTumour(arrays=rng.beta(0.5, 0.5, (len(sides), num_sites)),
+                           side=sides, origin_time=np.zeros(len(sides)),
+                           generation=np.zeros(len(sides)))
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    # the config template is read relative to the working directory
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("METHABC_MODEL", f"{sys.executable} -m methabc.standin")
+    monkeypatch.setenv("PYTHONPATH", os.path.join(ROOT, "src"))
+    monkeypatch.setenv("METHABC_DATA_STORE", "")
+    for name in ("METHABC_CACHE", "METHABC_SEED", "METHABC_RUNTIME_LOG"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_cohort_distances_match_total_distance():
+    rng = np.random.default_rng(0)
+    # tumours with different numbers of sites are scored in separate groups
+    tumours = [ObservedTumour.from_array(rng.beta(0.5, 0.5, (7, num_sites)))
+               for num_sites in (300, 250, 300)]
+    cohort = Cohort(["a", "b", "c"], tumours)
+    assert len(cohort.groups) == 2
+    for _ in range(3):
+        tumour = simulated(rng, 280)
+        direct = [total_distance({"data": tumour}, {"data": observed})
+                  for observed in tumours]
+        np.testing.assert_allclose(cohort.distances(tumour), direct,
+                                   rtol=1e-12)
+    np.testing.assert_array_equal(cohort.distances(None), [REJECTED] * 3)
+    six_demes = simulated(rng, 280, sides=(0, 0, 0, 1, 1, 1))
+    np.testing.assert_array_equal(cohort.distances(six_demes),
+                                  [REJECTED] * 3)
+
+
+@pytest.mark.parametrize("concurrency", [None, 2])
+def test_build_reference_table(standin, tmp_path, concurrency):
+    paths = [os.path.join("data", "individual", f"tumour_{tumour_id}.csv")
+             for tumour_id in ("D", "E")]
+    cohort = Cohort(["D", "E"], [import_data(path, compiled=True)
+                                 for path in paths])
+    path = str(tmp_path / "table.npz")
+    table = ReferenceTable(path, names=list(PRIOR), ids=cohort.ids)
+    build_reference_table(table, cohort, prior(), 4, processes=2,
+                          save_every=3, concurrency=concurrency)
+    stored = ReferenceTable(path)
+    assert len(stored) == 4
+    assert stored.distances.shape == (4, 2)
+    for row in range(len(stored)):
+        params = dict(stored.parameter(row))
+        tumour = simulate(params, seed="params")
+        np.testing.assert_allclose(stored.distances[row],
+                                   cohort.distances(tumour))
+        assert stored.lookup(params, "E") == stored.distances[row, 1]
+
+
+def test_table_prior_draws_every_row_then_the_prior(tmp_path):
+    table = ReferenceTable(str(tmp_path / "table.npz"), names=list(PRIOR),
+                           ids=["D", "E"])
+    draws = [dict(prior().rvs()) for _ in range(5)]
+    table.append(draws, np.arange(10.).reshape(5, 2))
+    table_prior = TablePrior(table, **prior())
+    drawn = [dict(table_prior.rvs()) for _ in range(5)]
+    assert sorted(map(str, drawn)) == sorted(map(str, draws))
+    assert table.lookup(table_prior.rvs(), "D") is None
+    # densities are those of the prior
+    assert table_prior.pdf(drawn[0]) == pytest.approx(prior().pdf(drawn[0]))
+    with pytest.raises(ValueError, match="Reference table has parameters"):
+        TablePrior(table, meth_rate=pyabc.RV("uniform", 0, 1))
+
+
+def test_reference_model_and_distance(tmp_path):
+    table = ReferenceTable(str(tmp_path / "table.npz"), names=list(PRIOR),
+                           ids=["D", "E"])
+    params = dict(prior().rvs())
+    table.append([params], np.array([[3.0, 4.0]]))
+    simulated_params = []
+
+    def model(p):
+        simulated_params.append(p)
+        return {"data": 1.0}
+
+    reference = ReferenceModel(model, table, "E")
+    distance = ReferenceDistance(lambda x, y: abs(x["data"] - y["data"]))
+    x_0 = {"data": 0.25}
+    stored = reference(params)
+    assert stored == {"reference_distance": 4.0}
+    assert simulated_params == []
+    assert distance(stored, x_0) == 4.0
+    other = {**params, "meth_rate": params["meth_rate"] / 2}
+    assert distance(reference(other), x_0) == 0.75
+    assert simulated_params == [other]
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from methabc.utils import (ConfigTemplate, load_template, render_config,
+                           write_config)
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), os.pardir, "resources",
+                        "config_template.dat")
+
+PARAMS = {
+    "init_migration_rate": 0.009,
+    "mu_driver_birth": 0.0001,
+    "s_driver_birth": 0.1,
+    "meth_rate": 0.0022,
+    "demeth_rate": 0.0018,
+}
+
+
+def parse(config):
+    """
+    Key-value pairs of a rendered config.
+    """
+    return dict(line.split() for line in config.splitlines()
+                if len(line.split()) == 2)
+
+
+def test_template_sections_and_keys():
+    template = load_template(TEMPLATE)
+    assert "deme_carrying_capacity" in template.sections["capacity"]
+    assert "meth_rate" in template.sections["methylation"]
+    assert set(PARAMS) <= set(template.keys)
+    assert template.value("fCpG_loci_per_cell") == 1200
+
+
+def test_render_config_sets_parameters():
+    config = parse(render_config(PARAMS, TEMPLATE))
+    assert config["meth_rate"] == "0.002200"
+    assert config["s_driver_birth"] == "0.100000"
+    # keys not given keep their template values
+    assert config["deme_carrying_capacity"] == "100"
+    assert config["fCpG_loci_per_cell"] == "1200"
+
+
+def test_render_config_matches_template_layout():
+    with open(TEMPLATE) as file:
+        lines = file.read().splitlines()
+    rendered = render_config(PARAMS, TEMPLATE).splitlines()
+    assert len(rendered) == len(lines)
+    for line, new in zip(lines, rendered):
+        if line.split()[:1] and line.split()[0] not in PARAMS:
+            assert line == new
+
+
+@pytest.mark.parametrize("params", [
+    {"meth_rat": 0.001},
+    {**PARAMS, "deme_carying_capacity": 10},
+])
+def test_unknown_parameters_raise(params):
+    with pytest.raises(ValueError, match="not in the config template"):
+        render_config(params, TEMPLATE)
+
+
+def test_validate_names_every_unknown_key():
+    template = ConfigTemplate(["section\n", "{\n", "    a 1\n", "}\n"])
+    with pytest.raises(ValueError, match=r"\['b', 'c'\]"):
+        template.validate({"a": 2, "b": 1, "c": 1})
+
+
+def test_write_config(tmp_path):
+    path = write_config(PARAMS, TEMPLATE, output_dir=str(tmp_path),
+                        profile="lean")
+    with open(path) as file:
+        config = parse(file.read())
+    assert config["write_demes_file"] == "1"
+    assert config["write_clones_file"] == "0"
+    # a config rendered beforehand is written as it is
+    rendered = render_config(PARAMS, TEMPLATE)
+    path = write_config(PARAMS, output_dir=str(tmp_path), config=rendered)
+    with open(path) as file:
+        assert file.read() == rendered
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from methabc.counts import (bit_planes, fraction_costs, import_counts,
+                            pairwise_allele_distance, plane_fractions)
+from methabc.tumour import allele_counts
+
+COUNTS = os.path.join(os.path.dirname(__file__), os.pardir, "data",
+                      "individual_distances", "CRC-multi_patient-D.csv")
+
+
+def test_allele_count_thresholds():
+    betas = np.array([0.0, 0.2499, 0.25, 0.5, 0.7499, 0.75, 1.0])
+    counts = allele_counts(betas)
+    assert counts.dtype == np.uint8
+    assert list(counts) == [0, 0, 1, 1, 1, 2, 2]
+
+
+@pytest.mark.parametrize("num_sites", [1200, 1164, 7, 1])
+def test_pairwise_allele_distance_matches_numpy(num_sites):
+    rng = np.random.default_rng(0)
+    counts1 = allele_counts(rng.beta(0.5, 0.5, size=(8, num_sites)))
+    counts2 = allele_counts(rng.beta(0.5, 0.5, size=(6, num_sites)))
+    res = pairwise_allele_distance(bit_planes(counts1), bit_planes(counts2),
+                                   num_sites)
+    direct = np.abs(counts1[:, None, :].astype(int)
+                    - counts2[None, :, :].astype(int)).mean(axis=-1)
+    assert res.shape == (8, 6)
+    np.testing.assert_allclose(res, direct, rtol=1e-15)
+
+
+def test_fraction_costs_match_numpy():
+    rng = np.random.default_rng(1)
+    counts1 = rng.integers(0, 3, size=(4, 101), dtype=np.uint8)
+    counts2 = rng.integers(0, 3, size=(5, 101), dtype=np.uint8)
+    res = fraction_costs(plane_fractions(bit_planes(counts1), 101),
+                         plane_fractions(bit_planes(counts2), 101))
+    # the Wasserstein distance between distributions on 0, 1, 2 is the
+    # summed difference of their cumulative distributions
+    cdf1 = np.stack([(counts1 <= k).mean(-1) for k in (0, 1)], axis=-1)
+    cdf2 = np.stack([(counts2 <= k).mean(-1) for k in (0, 1)], axis=-1)
+    direct = np.abs(cdf1[:, None, :] - cdf2[None, :, :]).sum(-1)
+    np.testing.assert_allclose(res, direct, atol=1e-15)
+
+
+def test_import_counts(monkeypatch):
+    monkeypatch.setenv("METHABC_DATA_STORE", "")
+    observed = import_counts(COUNTS)
+    df = pd.read_csv(COUNTS, index_col=0)
+    assert set(observed.demes) == set(df.columns)
+    np.testing.assert_array_equal(observed.counts,
+                                  df[list(observed.demes)].to_numpy().T)
+    np.testing.assert_allclose(
+        observed.deme_matrix,
+        np.abs(observed.counts[:, None, :].astype(int)
+               - observed.counts[None, :, :]).mean(axis=-1))
+    assert observed.source == os.path.abspath(COUNTS)
@@ -0,0 +1,231 @@
+from itertools import permutations
+
+import numpy as np
+import pyabc
+import pytest
+from pyabc.population import Sample
+from scipy.stats import wasserstein_distance
+
+from methabc.distance import (REJECTED, AdaptiveTotalDistance,
+                              _enumerate_by_side,
+                              _enumerate_orderings, batch_distances,
+                              distance_components, match_demes,
+                              population_distances, side_permutations,
+                              total_distance)
+from methabc.tumour import (ObservedTumour, SimulatedTumour, compact,
+                            pairwise_squared)
+
+
+def random_tumour(rng, num_left, num_right, num_sites=60):
+    """
+    Simulated tumour with the demes of both sides interleaved, as methdemon
+    writes them in no particular order.
+    """
+    num_demes = num_left + num_right
+    side = np.array([0] * num_left + [1] * num_right, dtype=np.int8)
+    order = rng.permutation(num_demes)
+    return SimulatedTumour(
+        arrays=rng.random((num_demes, num_sites))[order],
+        side=side[order],
+        origin_time=rng.random(num_demes)[order],
+        generation=np.full(num_demes, 10.0),
+    )
+
+
+def brute_force(tumour, observed):
+    """
+    Total distance scoring every ordering that keeps left demes first, with
+    scipy's Wasserstein distance.
+    """
+    tumour = tumour.sorted_by_side()
+    left = np.flatnonzero(tumour.side == 0)
+    right = np.flatnonzero(tumour.side == 1)
+    best = np.inf
+    for left_perm in permutations(left):
+        for right_perm in permutations(right):
+            order = list(left_perm + right_perm)
+            arrays = tumour.arrays[order]
+            l2 = np.sqrt(np.sum((pairwise_squared(arrays)
+                                 - observed.deme_matrix) ** 2) / 2)
+            wasserstein = sum(wasserstein_distance(a, b) for a, b
+                              in zip(arrays, observed.arrays))
+            best = min(best, l2 + wasserstein)
+    return best
+
+
+@pytest.mark.parametrize("num_left, num_right",
+                         [(4, 4), (5, 3), (3, 5), (2, 6), (0, 5)])
+def test_total_distance_matches_brute_force(num_left, num_right):
+    rng = np.random.default_rng(num_left * 10 + num_right)
+    observed = ObservedTumour.from_array(
+        rng.random((num_left + num_right, 50)))
+    for _ in range(3):
+        tumour = random_tumour(rng, num_left, num_right)
+        assert total_distance({"data": tumour}, {"data": observed}) == \
+            pytest.approx(brute_force(tumour, observed), rel=1e-10)
+
+
+@pytest.mark.parametrize("num_left, num_right", [(4, 4), (5, 4), (2, 5)])
+def test_branch_and_bound_matches_enumeration(num_left, num_right):
+    rng = np.random.default_rng(7)
+    num_demes = num_left + num_right
+    for _ in range(3):
+        sim = pairwise_squared(rng.random((num_demes, 40)))
+        obs = pairwise_squared(rng.random((num_demes, 40)))
+        costs = rng.random((num_demes, num_demes))
+        exhaustive, order = match_demes(sim, obs, costs, num_left)
+        pruned, pruned_order = match_demes(sim, obs, costs, num_left,
+                                           max_enumerate=0)
+        assert pruned == pytest.approx(exhaustive, rel=1e-12)
+        np.testing.assert_array_equal(pruned_order, order)
+
+
+def test_match_demes_keeps_sides():
+    rng = np.random.default_rng(8)
+    sim = pairwise_squared(rng.random((7, 30)))
+    obs = pairwise_squared(rng.random((7, 30)))
+    costs = rng.random((7, 7))
+    _, order = match_demes(sim, obs, costs, 3)
+    assert sorted(order[:3]) == [0, 1, 2]
+    assert sorted(order[3:]) == [3, 4, 5, 6]
+    assert len(side_permutations(3, 4)) == 6 * 24
+
+
+def test_distance_components_add_up():
+    rng = np.random.default_rng(9)
+    observed = ObservedTumour.from_array(rng.random((8, 50)))
+    tumour = random_tumour(rng, 4, 4)
+    l2, wasserstein, order = distance_components({"data": tumour},
+                                                 {"data": observed})
+    assert l2 + wasserstein == pytest.approx(
+        total_distance({"data": tumour}, {"data": observed}), rel=1e-12)
+    assert sorted(order) == list(range(8))
+
+
+def test_rejections():
+    rng = np.random.default_rng(10)
+    observed = {"data": ObservedTumour.from_array(rng.random((8, 50)))}
+    assert total_distance({"data": None}, observed) == REJECTED
+    assert total_distance({"data": random_tumour(rng, 4, 3)},
+                          observed) == REJECTED
+
+
+@pytest.mark.parametrize("num_left", [0, 1, 3, 4, 6])
+def test_enumerate_by_side_matches_enumeration(num_left):
+    rng = np.random.default_rng(11)
+    sim = pairwise_squared(rng.random((5, 6, 40)))
+    obs = pairwise_squared(rng.random((6, 40)))
+    costs = rng.random((5, 6, 6))
+    dist, order = _enumerate_by_side(sim, obs, costs, num_left)
+    expected, expected_order = _enumerate_orderings(sim, obs, costs,
+                                                    num_left)
+    np.testing.assert_allclose(dist, expected, rtol=1e-10)
+    np.testing.assert_array_equal(order, expected_order)
+
+
+@pytest.fixture
+def population():
+    rng = np.random.default_rng(12)
+    observed = ObservedTumour.from_array(rng.random((8, 80)))
+    tumours = [random_tumour(rng, num_left, 8 - num_left, num_sites)
+               for num_left in (4, 4, 3, 5, 2)
+               for num_sites in (80, 70)]
+    tumours.append(random_tumour(rng, 4, 3))
+    sum_stats = [{"data": tumour} for tumour in tumours] + [{"data": None}]
+    return observed, sum_stats
+
+
+def test_population_distances_match_single_distances(population):
+    observed, sum_stats = population
+    expected = [total_distance(x, {"data": observed}) for x in sum_stats]
+    np.testing.assert_allclose(population_distances(sum_stats, observed),
+                               expected, rtol=1e-12)
+    assert expected[-2:] == [REJECTED, REJECTED]
+
+
+def test_population_distances_components(population):
+    observed, sum_stats = population
+    dist, l2, wasserstein = population_distances(
+        sum_stats, observed, components=True, l2_weight=0.5,
+        wasserstein_weight=3)
+    for i, x in enumerate(sum_stats):
+        l2_i, wasserstein_i, order = distance_components(
+            x, {"data": observed}, 0.5, 3)
+        assert l2[i] == pytest.approx(l2_i, rel=1e-12)
+        assert wasserstein[i] == pytest.approx(wasserstein_i, rel=1e-12)
+        if order is not None:
+            assert dist[i] == pytest.approx(0.5 * l2_i + 3 * wasserstein_i,
+                                            rel=1e-12)
+        else:
+            assert dist[i] == REJECTED
+
+
+@pytest.mark.parametrize("storage", ["float32", "uint16", "summary"])
+def test_population_distances_compacted(population, storage):
+    observed, sum_stats = population
+    compacted = [{"data": compact(x["data"], storage)} for x in sum_stats]
+    expected = [total_distance(x, {"data": observed}) for x in compacted]
+    np.testing.assert_allclose(population_distances(compacted, observed),
+                               expected, rtol=1e-6)
+
+
+def test_batch_distances_chunks_and_rejections():
+    rng = np.random.default_rng(13)
+    observed = ObservedTumour.from_array(rng.random((8, 60)))
+    tumours = [random_tumour(rng, 4, 4, 60).sorted_by_side()
+               for _ in range(6)]
+    arrays = np.stack([tumour.arrays for tumour in tumours])
+    arrays[2] = np.nan
+    expected = [total_distance({"data": tumour}, {"data": observed})
+                for tumour in tumours]
+    expected[2] = REJECTED
+    # one simulation per chunk, and all in one
+    for max_bytes in (1, 2**30):
+        np.testing.assert_allclose(
+            batch_distances(arrays, observed, 4, max_bytes=max_bytes),
+            expected, rtol=1e-12)
+    assert np.all(batch_distances(arrays[:, :7], observed, 4) == REJECTED)
+
+
+def adaptive_sample(sum_stats, accepted):
+    sample = Sample(record_rejected=True)
+    for i, sum_stat in enumerate(sum_stats):
+        sample.append(pyabc.Particle(
+            m=0, parameter=pyabc.Parameter({"x": float(i)}), weight=1.0,
+            sum_stat=sum_stat, distance=0.0, accepted=i in accepted))
+    return sample
+
+
+def expected_weights(sum_stats, observed, weights):
+    components = np.array([
+        distance_components(x, {"data": observed}, *weights)[:2]
+        for x in sum_stats if x["data"] is not None])
+    components = components[components[:, 0] < REJECTED]
+    return 1 / (components.max(axis=0) - components.min(axis=0))
+
+
+def test_adaptive_total_distance_weights(population):
+    observed, sum_stats = population
+    x_0 = {"data": observed}
+    distance = AdaptiveTotalDistance()
+    assert distance.requires_calibration()
+    distance.initialize(0, lambda: adaptive_sample(sum_stats, ()), x_0,
+                        total_sims=len(sum_stats))
+    # terms scaled by their span over the simulations that were not rejected
+    np.testing.assert_allclose(distance.weights[0],
+                               expected_weights(sum_stats, observed, (1, 1)),
+                               rtol=1e-12)
+    accepted = (0, 3, 5)
+    assert distance.update(1, lambda: adaptive_sample(sum_stats, accepted),
+                           total_sims=len(sum_stats))
+    # the demes are matched under the weights of the previous generation
+    np.testing.assert_allclose(
+        distance.weights[1],
+        expected_weights(sum_stats, observed, distance.weights[0]),
+        rtol=1e-12)
+    weights = distance.weights[1]
+    for i, x in enumerate(sum_stats):
+        l2, wasserstein, order = distance_components(x, x_0, *weights)
+        expected = (REJECTED if order is None
+                    else weights[0] * l2 + weights[1] * wasserstein)
+        assert distance(x, x_0, 1) == pytest.approx(expected, rel=1e-12)
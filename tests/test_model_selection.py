@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from methabc.model_selection import (StoppingKernel, cost_aware_selection,
+                                     model_family)
+from methabc.runtime import RuntimeLog
+
+
+@pytest.mark.parametrize("probability_to_stay", [1, 1.5, -0.1])
+def test_probability_to_stay_is_validated(probability_to_stay):
+    with pytest.raises(ValueError, match="probability_to_stay"):
+        StoppingKernel(3, probability_to_stay)
+
+
+def test_stopped_models_are_never_proposed():
+    kernel = StoppingKernel(3, probability_to_stay=0.5)
+    kernel.stopped.add(1)
+    np.testing.assert_allclose([kernel.pmf(n, 0) for n in range(3)],
+                               [2 / 3, 0, 1 / 3])
+    # particles of a stopped model move to the models still running
+    np.testing.assert_allclose([kernel.pmf(n, 1) for n in range(3)],
+                               [0.5, 0, 0.5])
+
+
+def test_last_running_model_keeps_its_particles():
+    kernel = StoppingKernel(3, probability_to_stay=0)
+    kernel.stopped.update({1, 2})
+    assert [kernel.pmf(n, 0) for n in range(3)] == [1, 0, 0]
+    assert kernel.rvs(0) == 0
+
+
+def test_generations_and_stopped_models_are_printed(tmp_path, capsys):
+    models = model_family(deme_carrying_capacity=[10, 100, 1000])
+    log = RuntimeLog(str(tmp_path / "runtimes.jsonl"))
+    distance, kernel = cost_aware_selection(
+        models, lambda x, x_0: 0.0, min_probability=0.1, runtime_log=log)
+    for capacity, seconds in ((10, 1.0), (100, 2.0), (1000, 30.0)):
+        log.record({"deme_carrying_capacity": capacity}, seconds, "completed")
+    # events are not simulator time
+    log.record_event("cache_hit")
+    particles = [SimpleNamespace(m=m, weight=w)
+                 for m, w in ((0, 0.5), (1, 0.45), (2, 0.05))]
+    sample = SimpleNamespace(accepted_particles=particles)
+    distance.update(2, lambda: sample, 3)
+    out = capsys.readouterr().out
+    assert kernel.stopped == {2}
+    assert "Generation 1: stopped deme_carrying_capacity=1000" in out
+    assert ("deme_carrying_capacity=1000 p=0.050 1 sims 30 s (stopped)"
+            in out)
+    assert distance.generations[0]["simulations"] == 1
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from methabc.noise import BetaNoise, GaussianNoise, NoisyModel, add_noise
+from methabc.tumour import SimulatedTumour, TumourSummary, compact
+
+
+@pytest.fixture
+def tumour():
+    rng = np.random.default_rng(0)
+    return SimulatedTumour(arrays=rng.random((8, 500)),
+                           side=np.repeat([0, 1], 4).astype(np.int8),
+                           origin_time=np.arange(8.0),
+                           generation=np.full(8, 10.0))
+
+
+def test_add_noise_leaves_simulation_unchanged(tumour):
+    before = tumour.arrays.copy()
+    noisy = add_noise(tumour, BetaNoise(), np.random.default_rng(1))
+    np.testing.assert_array_equal(tumour.arrays, before)
+    assert noisy.arrays.dtype == before.dtype
+    assert np.all(noisy.arrays > before)
+
+
+@pytest.mark.parametrize("storage", ["full", "float32", "uint16", "summary"])
+def test_noise_is_added_before_compaction(tumour, storage):
+    model = NoisyModel(lambda params: {"data": tumour}, GaussianNoise(0.05),
+                       seed=2, storage=storage)
+    noisy = model({"meth_rate": 0.001})["data"]
+    clean = compact(tumour, storage)
+    if storage == "summary":
+        assert isinstance(noisy, TumourSummary)
+        changed = np.abs(noisy.deme_matrix - clean.deme_matrix).mean()
+    else:
+        assert noisy.arrays.dtype == clean.arrays.dtype
+        changed = np.abs(noisy.float_arrays - clean.float_arrays).mean()
+    # the noise survives the storage conversion
+    assert changed > 1e-3
+
+
+def test_noise_is_reproducible(tumour):
+    model = NoisyModel(lambda params: {"data": tumour}, BetaNoise(), seed=3)
+    params = {"meth_rate": 0.001}
+    np.testing.assert_array_equal(model(params)["data"].arrays,
+                                  model(params)["data"].arrays)
+
+
+@pytest.mark.parametrize("storage", ["uint16", "summary", "counts"])
+def test_add_noise_refuses_compacted_tumours(tumour, storage):
+    with pytest.raises(ValueError, match="before the simulation is compacted"):
+        add_noise(compact(tumour, storage), BetaNoise())
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from methabc.simulate import _read_output
+from methabc.standin import _write_demes, write_final_demes
+from methabc.tumour import SIDES
+from methabc.utils import parse_final_demes, read_final_demes
+
+
+def pandas_final_demes(path):
+    """
+    Reference parse of the final generation with pandas.
+    """
+    df = pd.read_csv(path)
+    df = df[np.floor(df.Generation) == np.floor(df.Generation.max())]
+    arrays = np.vstack([np.fromstring(x.strip(";"), sep=";")
+                        for x in df.AverageArray])
+    return df, arrays
+
+
+@pytest.mark.parametrize("num_demes, num_sites", [(8, 1200), (40, 50)])
+def test_read_final_demes_matches_pandas(tmp_path, num_demes, num_sites):
+    rng = np.random.default_rng(num_demes)
+    path = str(tmp_path / "final_demes.csv")
+    write_final_demes(path, rng.random((num_demes, num_sites)),
+                      rng.random(num_demes), generations=3)
+    tumour = read_final_demes(path)
+    df, arrays = pandas_final_demes(path)
+    np.testing.assert_array_equal(tumour.arrays, arrays)
+    np.testing.assert_array_equal(tumour.origin_time, df.OriginTime)
+    assert [SIDES[i] for i in tumour.side] == list(df.Side)
+    assert len(np.unique(tumour.generation)) == 1
+
+
+def test_parse_final_demes_keeps_last_generation_only():
+    text = ("Generation,Side,OriginTime,AverageArray\n"
+            "4,left,1,0.9;0.9\n"
+            "5,left,1,0.1;0.2\n"
+            "5,elsewhere,2,0.3;0.4\n"
+            "5.5,right,3,0.5;0.6;\n")
+    tumour = parse_final_demes(text, dtype=np.float32)
+    assert tumour.arrays.dtype == np.float32
+    np.testing.assert_allclose(tumour.arrays,
+                               [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]])
+    np.testing.assert_array_equal(tumour.side, [0, -1, 1])
+
+
+def test_parse_final_demes_empty():
+    tumour = parse_final_demes("Generation,Side,OriginTime,AverageArray\n")
+    assert tumour.arrays.shape == (0, 0)
+
+
+def test_parse_final_demes_rejects_ragged_rows():
+    # one row short and one long: the total matches demes x sites
+    text = ("Generation,Side,OriginTime,AverageArray\n"
+            "5,left,1,0.1;0.2;0.3\n"
+            "5,right,2,0.1;0.2\n"
+            "5,left,3,0.1;0.2;0.3;0.4\n")
+    with pytest.raises(ValueError, match="different lengths"):
+        parse_final_demes(text)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_stdout_matches_final_demes_csv(tmp_path, dtype):
+    rng = np.random.default_rng(3)
+    arrays, origin_time = rng.random((8, 300)), rng.random(8)
+    # simulators streaming their output print the final generation only
+    stdout = io.StringIO()
+    _write_demes(stdout, arrays, origin_time, 1)
+    write_final_demes(str(tmp_path / "final_demes.csv"), arrays, origin_time)
+    streamed = _read_output(stdout.getvalue().encode(),
+                            str(tmp_path / "missing"), dtype)
+    written = _read_output(b"", str(tmp_path), dtype)
+    # other output on stdout is not taken for the demes
+    chatter = _read_output(b"Simulating...\ndone\n", str(tmp_path), dtype)
+    for tumour in (written, chatter):
+        assert tumour.arrays.dtype == dtype
+        for name in ("arrays", "side", "origin_time", "generation"):
+            np.testing.assert_array_equal(getattr(streamed, name),
+                                          getattr(tumour, name))
+    np.testing.assert_allclose(streamed.arrays, arrays, atol=1e-6)
@@ -0,0 +1,40 @@
+import numpy as np
+import pyabc
+from pyabc.population import Sample
+
+from methabc.prefilter import PrefilterDistance, PrefilteredModel
+
+
+def particle(x, accepted, simulated=True):
+    return pyabc.Particle(
+        m=0, parameter=pyabc.Parameter({"x": x}), weight=1.0,
+        sum_stat={"data": x, "other": 2 * x} if simulated else {},
+        distance=abs(x) if simulated else np.inf, accepted=accepted)
+
+
+def make_sample(rng):
+    sample = Sample(record_rejected=True)
+    for x in rng.random(20):
+        sample.append(particle(x, accepted=True))
+    for x in rng.random(30):
+        sample.append(particle(x, accepted=False))
+    # screened out by the surrogate without simulating
+    for x in rng.random(10):
+        sample.append(particle(x, accepted=False, simulated=False))
+    return sample
+
+
+def test_adaptive_distance_skips_screened_out_proposals():
+    rng = np.random.default_rng(0)
+    model = PrefilteredModel(lambda params: {}, min_train=10)
+    distance = PrefilterDistance(pyabc.AdaptivePNormDistance(), model)
+    x_0 = {"data": 0.5, "other": 1.0}
+    distance.initialize(0, lambda: make_sample(rng), x_0, total_sims=60)
+    sample = make_sample(rng)
+    assert distance.update(1, lambda: sample, total_sims=120)
+    # the wrapped distance did not change the sample itself
+    assert len(sample.all_particles) == 60
+    assert model.saved[0] == 10
+    assert len(model.distances) == 50
+    assert model.trained
+    assert np.isfinite(distance(x_0, x_0, 1))
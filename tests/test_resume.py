@@ -0,0 +1,105 @@
+import pyabc
+import pytest
+
+from methabc.resume import (Journal, JournalModel, ReplayPrior,
+                            ReplayTransition, finished, start_or_resume)
+
+
+def interrupted(directory, t=1):
+    """
+    Journal of an interrupted generation t with three proposals started in
+    the order 0, 1, 2, of which only the second finished.
+    """
+    journal = Journal(directory)
+    bases = [journal.start(t, {"x": float(i)}, started=1000 + i)
+             for i in (2, 0, 1)]
+    journal.record(bases[2], {"data": 1.0}, 0.5, 30.0)
+    return journal
+
+
+def test_resume_replays_every_proposal_in_start_order(tmp_path):
+    interrupted(str(tmp_path))
+    journal = Journal(str(tmp_path))
+    assert journal.resume(1) == (3, 1, 30.0)
+    entries = [journal.claim() for _ in range(4)]
+    assert entries[-1] is None
+    assert [e["params"]["x"] for e in entries[:3]] == [0, 1, 2]
+    assert ["sum_stat" in e for e in entries[:3]] == [False, True, False]
+    assert journal.reused() == (1, 30.0)
+
+
+def test_resume_removes_other_generations(tmp_path):
+    interrupted(str(tmp_path), t=3)
+    journal = Journal(str(tmp_path))
+    assert journal.resume(1) == (0, 0, 0.0)
+    assert journal.resume(3) == (0, 0, 0.0)
+
+
+def test_replayed_proposals_are_journaled_again(tmp_path):
+    interrupted(str(tmp_path))
+    journal = Journal(str(tmp_path))
+    journal.resume(1)
+
+    def model(params):
+        raise AssertionError("finished proposals are not simulated again")
+
+    journaled = JournalModel(model, journal)
+    journal.claim()
+    entry = journal.claim()
+    result = journaled.accept(
+        1, pyabc.Parameter(entry["params"]), lambda x: x,
+        lambda x, x_0, t, par: abs(x["data"] - x_0["data"]), lambda t: 1.0,
+        pyabc.UniformAcceptor(), {"data": 0.0})
+    assert result.accepted and result.weight == 0.5
+    assert result.distance == pytest.approx(1.0)
+    # a second interruption still replays both in start order, including the
+    # proposal claimed but not evaluated yet
+    again = Journal(str(tmp_path))
+    assert again.resume(1) == (3, 1, 30.0)
+    assert [again.claim()["params"]["x"] for _ in range(3)] == [0, 1, 2]
+
+
+def abc_smc(journal):
+    prior = ReplayPrior(journal, x=pyabc.RV("uniform", 0, 1))
+    model = JournalModel(lambda params: {"data": params["x"]}, journal)
+    return pyabc.ABCSMC(model, prior,
+                        lambda x, x_0: abs(x["data"] - x_0["data"]),
+                        population_size=20,
+                        transitions=ReplayTransition(journal),
+                        sampler=pyabc.sampler.SingleCoreSampler())
+
+
+def test_finished_run_is_not_resumed(tmp_path, capsys):
+    db = str(tmp_path / "run.db")
+    journal = Journal(str(tmp_path / "journal"))
+    abc = abc_smc(journal)
+    assert start_or_resume(abc, db, {"data": 0.5}, journal=journal) == 0
+    abc.run(max_nr_populations=2)
+    abc = abc_smc(journal)
+    t0 = start_or_resume(abc, db, {"data": 0.5}, resume=True,
+                         journal=journal)
+    assert t0 == 2
+    assert not finished(db, t0, 3)
+    assert finished(db, t0, 2)
+    assert "Nothing to resume" in capsys.readouterr().out
+
+
+def test_resumed_throughput_counts_this_session_only(tmp_path, capsys):
+    from methabc.run import report_throughput
+
+    db = str(tmp_path / "run.db")
+    journal = Journal(str(tmp_path / "journal"))
+    abc = abc_smc(journal)
+    start_or_resume(abc, db, {"data": 0.5}, journal=journal)
+    abc.run(max_nr_populations=2)
+    abc = abc_smc(journal)
+    assert start_or_resume(abc, db, {"data": 0.5}, resume=True,
+                           journal=journal) == 2
+    previous = abc.history.total_nr_simulations
+    assert previous > 0
+    capsys.readouterr()
+    history = abc.run(max_nr_populations=1)
+    report_throughput(history, 0, previous)
+    populations = history.get_all_populations()
+    resumed = populations.samples[populations.t == 2].sum()
+    assert capsys.readouterr().out.startswith(f"{resumed} simulations in ")
@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+import pytest
+
+from methabc.distance import REJECTED, total_distance
+from methabc.run import report_simulations
+from methabc.runtime import RuntimeLog, RuntimePredictor
+from methabc.tumour import ObservedTumour, SimulatedTumour
+
+PARAMS = {"meth_rate": 0.002, "demeth_rate": 0.001}
+
+
+def test_events_are_counted_apart_from_simulations(tmp_path, capsys):
+    log = RuntimeLog(str(tmp_path / "runtimes.jsonl"))
+    # an earlier run in the same log
+    log.record(PARAMS, 5.0, "completed", start=time.time() - 3600)
+    start = time.time()
+    log.record(PARAMS, 4.0, "completed", start=start)
+    for event in ("cache_hit", "cache_hit", "cache_hit", "cache_miss"):
+        log.record_event(event)
+    assert len(log.simulations()) == 2
+    counts = log.counts(since=start)
+    assert counts == {"completed": 1, "cache_hit": 3, "cache_miss": 1}
+    report_simulations(log.path, start)
+    assert ("3 hits, 1 misses (75% hit rate)"
+            in capsys.readouterr().out)
+
+
+def test_early_rejections_are_recorded(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "runtimes.jsonl")
+    monkeypatch.setenv("METHABC_RUNTIME_LOG", path)
+    start = time.time()
+    rng = np.random.default_rng(0)
+    observed = ObservedTumour.from_array(rng.random((4, 20)))
+    three_demes = SimulatedTumour(
+        arrays=rng.random((3, 20)), side=np.array([0, 1, 1], dtype=np.int8),
+        origin_time=np.zeros(3), generation=np.zeros(3))
+    RuntimeLog(path).record(PARAMS, 1.0, "timed_out", start=start)
+    assert total_distance({"data": None}, {"data": observed}) == REJECTED
+    assert total_distance({"data": three_demes},
+                          {"data": observed}) == REJECTED
+    assert RuntimeLog(path).counts(since=start) == {
+        "timed_out": 1, "rejected_failed_simulation": 1,
+        "rejected_deme_count": 1}
+    report_simulations(path, start)
+    out = capsys.readouterr().out
+    assert "0 completed, 0 failed, 1 timed out" in out
+    assert "1 deme count, 1 failed simulation" in out
+
+
+def test_predictor_is_fitted_on_completed_simulations(tmp_path):
+    log = RuntimeLog(str(tmp_path / "runtimes.jsonl"))
+    rng = np.random.default_rng(0)
+    params, seconds = [], []
+    for rate in rng.uniform(0.001, 0.1, size=40):
+        params.append({**PARAMS, "meth_rate": rate})
+        # runtime grows with the methylation rate
+        seconds.append(1000 * rate * rng.lognormal(0, 0.1))
+        log.record(params[-1], seconds[-1], "completed")
+        # failures stop early, timeouts at the timeout
+        log.record({**PARAMS, "meth_rate": rate}, 0.2, "failed")
+        log.record({**PARAMS, "meth_rate": rate}, 10.0, "timed_out")
+        log.record_event("cache_hit")
+    predictor = RuntimePredictor.from_log(log)
+    expected = RuntimePredictor().fit(params, np.array(seconds))
+    np.testing.assert_allclose(predictor.coef, expected.coef)
+    assert predictor.sigma == pytest.approx(expected.sigma)
+    assert predictor.predict([{**PARAMS, "meth_rate": 0.05}])[0] == \
+        pytest.approx(50, rel=0.1)
+
+
+def test_predictor_needs_completed_simulations(tmp_path):
+    log = RuntimeLog(str(tmp_path / "runtimes.jsonl"))
+    log.record(PARAMS, 0.2, "failed")
+    with pytest.raises(ValueError, match="No completed simulations"):
+        RuntimePredictor.from_log(log)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from methabc.cache import SimulationCache
+from methabc.simulate import AsyncSimulator, simulate
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+PARAMS = {
+    "init_migration_rate": 0.009,
+    "mu_driver_birth": 0.0001,
+    "s_driver_birth": 0.1,
+    "meth_rate": 0.0022,
+    "demeth_rate": 0.0018,
+}
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    # the config template is read relative to the working directory
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("METHABC_MODEL", f"{sys.executable} -m methabc.standin")
+    monkeypatch.setenv("PYTHONPATH", os.path.join(ROOT, "src"))
+    monkeypatch.delenv("METHABC_CACHE", raising=False)
+    monkeypatch.delenv("METHABC_SEED", raising=False)
+
+
+def test_simulate_can_be_awaited_without_map(standin):
+    simulator = AsyncSimulator(max_concurrent=2)
+
+    async def run():
+        return await asyncio.gather(*(simulator.simulate(PARAMS, seed=seed)
+                                      for seed in (1, 2, 3)))
+
+    tumours = asyncio.run(run())
+    assert all(tumour is not None for tumour in tumours)
+    assert len(simulator.workspaces) == 2
+    # a new event loop gets a semaphore of its own
+    again = asyncio.run(simulator.simulate(PARAMS, seed=1))
+    np.testing.assert_array_equal(again.arrays, tumours[0].arrays)
+
+
+def test_map_keeps_order(standin):
+    simulator = AsyncSimulator(max_concurrent=2)
+    params_list = [{**PARAMS, "meth_rate": rate} for rate in (0.001, 0.003)]
+    tumours = simulator.map(params_list, seed="params")
+    expected = [asyncio.run(simulator.simulate(params, seed="params"))
+                for params in params_list]
+    for tumour, single in zip(tumours, expected):
+        np.testing.assert_array_equal(tumour.arrays, single.arrays)
+
+
+def test_only_deterministic_seeds_are_cached(standin, tmp_path, monkeypatch):
+    cache = SimulationCache(str(tmp_path))
+    assert simulate(PARAMS, cache=cache) is not None
+    assert cache.size() == 0 and cache.hits + cache.misses == 0
+    monkeypatch.setenv("METHABC_SEED", "params")
+    first = simulate(PARAMS, cache=cache)
+    again = simulate(PARAMS, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(again.arrays, first.arrays)
@@ -0,0 +1,52 @@
+import numpy as np
+import pyabc
+import pytest
+
+from methabc.distance import REJECTED, total_distance
+from methabc.tumour import (STORAGE, ObservedTumour, SimulatedTumour,
+                            TumourSummary, as_simulated, compact)
+
+DTYPES = {"full": np.float64, "float32": np.float32, "uint16": np.uint16,
+          "counts": np.uint8}
+
+
+@pytest.fixture
+def tumour():
+    rng = np.random.default_rng(5)
+    side = np.array([1, 0, -1, 0, 1, 1, 0, 0, 1], dtype=np.int8)
+    return SimulatedTumour(arrays=rng.beta(0.5, 0.5, (len(side), 300)),
+                           side=side, origin_time=rng.random(len(side)),
+                           generation=np.full(len(side), 40.0))
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_storage_round_trips_through_history(tmp_path, tumour, storage):
+    observed = ObservedTumour.from_array(
+        np.random.default_rng(6).random((8, 300)))
+    stored = compact(tumour, storage)
+    abc = pyabc.ABCSMC(lambda params: {"data": stored},
+                       pyabc.Distribution(x=pyabc.RV("uniform", 0, 1)),
+                       total_distance, population_size=3,
+                       sampler=pyabc.sampler.SingleCoreSampler())
+    abc.new("sqlite:///" + str(tmp_path / "history.db"), {"data": observed})
+    history = abc.run(max_nr_populations=1)
+
+    _, sum_stats = history.get_weighted_sum_stats()
+    assert len(sum_stats) == 3
+    loaded = as_simulated(sum_stats[0]["data"])
+    if storage == "summary":
+        assert isinstance(loaded, TumourSummary)
+        for name in ("side", "deme_matrix", "sorted_arrays"):
+            np.testing.assert_array_equal(getattr(loaded, name),
+                                          getattr(stored, name))
+    else:
+        assert loaded.arrays.dtype == DTYPES[storage]
+        for name in ("arrays", "side", "origin_time", "generation"):
+            np.testing.assert_array_equal(getattr(loaded, name),
+                                          getattr(stored, name))
+    # the observed tumour is read back as a plain array
+    x_0 = history.observed_sum_stat()
+    expected = total_distance({"data": stored}, {"data": observed})
+    assert expected < REJECTED
+    assert total_distance({"data": loaded}, x_0) == pytest.approx(expected,
+                                                                  rel=1e-12)
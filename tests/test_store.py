@@ -0,0 +1,71 @@
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+
+from methabc.store import TumourStore, build_store, load_reference
+from methabc.utils import import_data
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, "data")
+IDS = ["D", "E"]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # compare against the data files, not a store in the working directory
+    monkeypatch.setenv("METHABC_DATA_STORE", "")
+    for directory, name in (("individual", "tumour_{}.csv"),
+                            ("individual_distances",
+                             "CRC-multi_patient-{}.csv")):
+        os.makedirs(tmp_path / directory)
+        for tumour_id in IDS:
+            shutil.copy(os.path.join(DATA, directory, name.format(tumour_id)),
+                        tmp_path / directory)
+    path = str(tmp_path / "tumours.store")
+    assert build_store(path, str(tmp_path / "individual"),
+                       str(tmp_path / "individual_distances")) == IDS
+    return TumourStore(path)
+
+
+def data_path(store, tumour_id):
+    return os.path.join(os.path.dirname(store.path), "individual",
+                        f"tumour_{tumour_id}.csv")
+
+
+@pytest.mark.parametrize("tumour_id", IDS)
+def test_store_matches_data_files(store, tumour_id):
+    stored = store.observed(tumour_id)
+    parsed = import_data(data_path(store, tumour_id), compiled=True)
+    assert stored.demes == parsed.demes
+    assert list(stored.labels) == list(parsed.labels)
+    assert all(type(label) is str for label in stored.labels)
+    for name in ("arrays", "deme_matrix", "sorted_arrays"):
+        np.testing.assert_array_equal(getattr(stored, name),
+                                      getattr(parsed, name))
+    assert store.sides(tumour_id) == [
+        "left" if "A" in deme else "right" for deme in parsed.demes]
+    counts = store.allele_counts(tumour_id)
+    assert counts.dtype == np.uint8
+    assert counts.shape == parsed.arrays.shape
+
+
+def test_find_misses_once_the_file_changes(store):
+    path = data_path(store, "D")
+    assert store.find(path) == "D"
+    assert store.find(data_path(store, "F")) is None
+    with open(path, "a") as file:
+        file.write("\n")
+    assert store.find(path) is None
+
+
+def test_stored_tumour_pickles_as_a_reference(store):
+    stored = store.observed("E")
+    assert stored.source == f"{store.path}#E"
+    loaded = pickle.loads(pickle.dumps(stored))
+    assert loaded.source == stored.source
+    np.testing.assert_array_equal(loaded.arrays, stored.arrays)
+    np.testing.assert_array_equal(loaded.arrays,
+                                  load_reference(stored.source).arrays)
+    assert len(pickle.dumps(stored)) < stored.arrays.nbytes // 100
@@ -0,0 +1,31 @@
+import pyabc
+
+from methabc.timing import CALIBRATION, TimedModel, TimingLog, stage
+
+
+def model(params):
+    with stage("simulate"):
+        pass
+    return {"data": params["x"]}
+
+
+def test_calibration_is_logged_apart_from_generation_0(tmp_path):
+    path = str(tmp_path / "timing.jsonl")
+    timed = TimedModel(model, path)
+    pars = pyabc.Parameter({"x": 1.0})
+    calculator = lambda x: x  # noqa: E731
+    # the calibration sample, then a particle of generation 0
+    timed.summary_statistics(0, pars, calculator)
+    timed.accept(0, pars, calculator,
+                 lambda x, x_0, t, par: 0.0, lambda t: 1.0,
+                 lambda distance_function, eps, x, x_0, t, par:
+                 pyabc.acceptor.AcceptorResult(0.0, True), {"data": 1.0})
+    df = TimingLog(path).read()
+    assert list(df.t) == [CALIBRATION, 0]
+    assert (df["simulate"] >= 0).all()
+    assert list(TimingLog(path).breakdown().particles) == [1, 1]
+
+
+def test_stage_outside_timed_model_is_a_no_op():
+    with stage("simulate"):
+        pass
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from scipy.stats import wasserstein_distance
+
+from methabc.distance import overall_wasserstein, wasserstein_costs
+from methabc.tumour import ObservedTumour
+from methabc.wasserstein import (paired_wasserstein, quantile_grid,
+                                 sort_demes, wasserstein_matrix)
+
+
+def scipy_matrix(arrays1, arrays2):
+    return np.array([[wasserstein_distance(a, b) for b in arrays2]
+                     for a in arrays1])
+
+
+@pytest.mark.parametrize("num_sites1, num_sites2",
+                         [(1200, 1200), (1200, 1164), (7, 3), (1, 5)])
+def test_wasserstein_matrix_matches_scipy(num_sites1, num_sites2):
+    rng = np.random.default_rng(0)
+    arrays1 = rng.beta(0.5, 0.5, size=(8, num_sites1))
+    arrays2 = rng.beta(0.5, 0.5, size=(6, num_sites2))
+    res = wasserstein_matrix(sort_demes(arrays1), sort_demes(arrays2))
+    assert res.shape == (8, 6)
+    np.testing.assert_allclose(res, scipy_matrix(arrays1, arrays2),
+                               rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize("num_sites2", [300, 250])
+def test_paired_wasserstein_matches_scipy(num_sites2):
+    rng = np.random.default_rng(1)
+    arrays1 = rng.random((8, 300))
+    arrays2 = rng.random((8, num_sites2))
+    res = paired_wasserstein(sort_demes(arrays1), sort_demes(arrays2))
+    expected = [wasserstein_distance(a, b) for a, b in zip(arrays1, arrays2)]
+    np.testing.assert_allclose(res, expected, rtol=1e-12, atol=1e-14)
+
+
+def test_wasserstein_matrix_broadcasts_leading_dimensions():
+    rng = np.random.default_rng(2)
+    sim = sort_demes(rng.random((5, 8, 120)))
+    obs = sort_demes(rng.random((8, 100)))
+    res = wasserstein_matrix(sim, obs)
+    assert res.shape == (5, 8, 8)
+    for i in range(5):
+        np.testing.assert_allclose(res[i], wasserstein_matrix(sim[i], obs),
+                                   rtol=1e-12)
+
+
+def test_quantile_grid_weights_sum_to_one():
+    index_n, index_m, weights = quantile_grid(7, 3)
+    assert weights.sum() == pytest.approx(1)
+    assert index_n.max() == 6 and index_m.max() == 2
+    assert np.all(np.diff(index_n) >= 0) and np.all(np.diff(index_m) >= 0)
+
+
+def test_overall_wasserstein_and_costs_match_scipy():
+    rng = np.random.default_rng(3)
+    arrays1 = rng.random((8, 200))
+    arrays2 = rng.random((8, 150))
+    observed1 = {"data": ObservedTumour.from_array(arrays1)}
+    observed2 = {"data": ObservedTumour.from_array(arrays2)}
+    expected = scipy_matrix(arrays1, arrays2)
+    assert overall_wasserstein(observed1, observed2) == pytest.approx(
+        np.trace(expected), rel=1e-12)
+    np.testing.assert_allclose(wasserstein_costs(arrays1, arrays2), expected,
+                               rtol=1e-12, atol=1e-14)
@@ -0,0 +1,42 @@
+import atexit
+import os
+
+from methabc.workspace import Workspace
+
+
+def test_workspace_is_reused_and_emptied(tmp_path):
+    workspace = Workspace(root=str(tmp_path))
+    with workspace.run() as path:
+        with open(os.path.join(path, "final_demes.csv"), "w") as file:
+            file.write("x" * 10)
+    with workspace.run() as second:
+        assert second == path
+        assert os.listdir(second) == []
+    assert workspace.runs == 2
+    assert workspace.total_bytes_written == 10
+    workspace.cleanup()
+    assert not os.path.exists(path)
+
+
+def test_cleanup_is_registered_once(tmp_path):
+    workspace = Workspace(root=str(tmp_path))
+    before = atexit._ncallbacks()
+    for _ in range(5):
+        # recreated after something removed the directory
+        with workspace.run():
+            pass
+        workspace.cleanup()
+    assert atexit._ncallbacks() == before
+
+
+def test_failed_runs_are_quarantined(tmp_path):
+    quarantine = tmp_path / "quarantine"
+    workspace = Workspace(root=str(tmp_path / "root"),
+                          quarantine_dir=str(quarantine), max_quarantined=1)
+    for i in range(3):
+        with workspace.run() as path:
+            open(os.path.join(path, f"run{i}"), "w").close()
+            workspace.mark_failed()
+    kept = os.listdir(quarantine)
+    assert len(kept) == 1
+    workspace.cleanup()